@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Batch scheduler and watch-folder mode for converting many films.
+
+Inputs are video files, directories and glob patterns, or a JSON jobs file
+giving each film its own output prefix and settings. Every job runs
+``video_processor.py`` in its own process with its output logged to
+``<prefix>.log``. Concurrency is bounded in two places:
+
+- ``--decodes``: jobs, and so FFmpeg decodes, running at once
+- ``--workers``: CPU worker processes, shared out between running jobs
+
+Jobs whose source and sampling settings match decode the same frames.
+They are grouped and run one after another through the decoded-frame
+cache, so only the first job in a group starts FFmpeg and the rest read
+its frames back memory-mapped.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from job_manifest import fingerprint_file
+from options import DEFAULT_CACHE_DIR, DITHER_METHODS, PALETTES, RESAMPLE_PRESETS, STRATEGIES, TONE_MODES
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+
+# video_processor.py options a job may set, with their batch defaults
+DEFAULT_OPTIONS = {
+    "subtitle": None,
+    "fps": 1,
+    "width": 400,
+    "height": 300,
+    "crop": False,
+    "resample": "balanced",
+    "luma": False,
+    "timestamps": None,
+    "budget": None,
+    "dither": "floyd-steinberg",
+    "tone": "shot",
+    "palette": "mono",
+    "format": "bmp",
+    "dedup": None,
+    "dedup_window": 4,
+    "resume": False,
+    "cache": False,
+    "strategy": "auto",
+    "fsync": False,
+    "delta": False
+}
+
+# Values a jobs file may give the options that take a fixed set
+OPTION_CHOICES = {
+    "resample": RESAMPLE_PRESETS,
+    "dither": DITHER_METHODS,
+    "tone": TONE_MODES,
+    "palette": PALETTES,
+    "format": ("bmp", "container"),
+    "strategy": STRATEGIES
+}
+
+# File systems stamp modification times coarsely, so a frame written just
+# after a job starts can carry a slightly earlier time
+MTIME_SLACK_SECONDS = 1.0
+
+
+def find_videos(patterns):
+    """
+    Expand files, directories and glob patterns into video paths.
+
+    Args:
+        patterns (list): Paths, directories or glob patterns
+
+    Returns:
+        list: Video paths in a stable order, without duplicates
+    """
+    videos = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS):
+                path = os.path.abspath(path)
+                if path not in videos:
+                    videos.append(path)
+            elif not os.path.exists(path):
+                print(f"Warning: No such file: {path}")
+    return videos
+
+
+def load_jobs_file(path):
+    """
+    Read a JSON jobs file.
+
+    Each entry is a video path, or an object with ``input``, an optional
+    ``prefix`` and optional ``options`` named like ``video_processor.py``'s
+    flags (``{"fps": 0.5, "dither": "atkinson", "crop": true}``).
+
+    Args:
+        path (str): Jobs file
+
+    Returns:
+        list: ``(input, prefix, options)`` tuples; ``prefix`` may be None
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"input": entry}
+        unknown = set(entry.get("options", {})) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown options for {entry['input']}: {', '.join(sorted(unknown))}")
+        for name, value in entry.get("options", {}).items():
+            if name in OPTION_CHOICES and value not in OPTION_CHOICES[name]:
+                raise ValueError(f"Invalid {name} for {entry['input']}: {value} "
+                                 f"(choose from {', '.join(OPTION_CHOICES[name])})")
+        jobs.append((os.path.join(base, entry["input"]), entry.get("prefix"), entry.get("options", {})))
+    return jobs
+
+
+class Job:
+    """
+    One film to convert.
+
+    Args:
+        input_video (str): Source video
+        prefix (str): Output prefix
+        options (dict): ``video_processor.py`` options
+    """
+
+    def __init__(self, input_video, prefix, options):
+        self.input_video = input_video
+        self.prefix = prefix
+        self.options = options
+        self.log_path = prefix + ".log"
+        self.status = "queued"
+        self.frames = 0
+        self.seconds = 0.0
+        self.started = 0.0
+        self.error = None
+
+    def decode_key(self):
+        """
+        Identify the decoded frames this job needs.
+
+        Returns:
+            tuple: Source fingerprint and sampling settings
+        """
+        options = self.options
+        return (fingerprint_file(self.input_video), str(options["fps"]), options["width"], options["height"],
+                options["crop"], options["resample"], options["luma"], options["palette"],
+                fingerprint_file(options["subtitle"]), options["budget"], fingerprint_file(options["timestamps"]))
+
+    def shares_decode(self):
+        """
+        Whether the job can read its frames from the decoded-frame cache.
+
+        The cache holds grayscale frames, so colour jobs always decode
+        their own. It also holds only whole sampling grids, so jobs that
+        convert a planned selection of frames (``budget`` or
+        ``timestamps``) decode their own too.
+
+        Returns:
+            bool: True if the job may be grouped with others on its source
+        """
+        options = self.options
+        return options["palette"] == "mono" and options["budget"] is None and options["timestamps"] is None
+
+    def command(self, workers, cache_dir, shared):
+        """
+        Build the ``video_processor.py`` command line.
+
+        Args:
+            workers (int): Worker processes for this job
+            cache_dir (str): Decoded-frame cache directory
+            shared (bool): Whether the job shares decoded frames with others
+
+        Returns:
+            list: Command and arguments
+        """
+        command = [sys.executable, os.path.join(SCRIPT_DIR, "video_processor.py"), self.input_video, self.prefix,
+                   "--workers", str(workers)]
+        options = dict(self.options)
+        if shared and self.shares_decode():
+            options["cache"] = True
+        for name, value in options.items():
+            flag = "--" + name.replace("_", "-")
+            if value is True:
+                command.append(flag)
+            elif value is not None and value is not False:
+                command += [flag, str(value)]
+        if options["cache"]:
+            command += ["--cache-dir", cache_dir]
+        return command
+
+    def count_frames(self):
+        """
+        Count the frames the job wrote.
+
+        A resumed job counts the frames its job manifest lists. Otherwise
+        only frames written since the job started count, so frames left in
+        the folder by an earlier, longer run are not added to the total.
+        """
+        if self.options["format"] == "container":
+            from epd_container import ContainerReader
+            path = self.prefix + ".simf"
+            return ContainerReader(path).count if os.path.exists(path) else 0
+        manifest_path = self.prefix + "_job.json"
+        if self.options["resume"] and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                return len(json.load(f)["frames"])
+        frames_dir = self.prefix + "_frames"
+        if not os.path.isdir(frames_dir):
+            return 0
+        return sum(1 for entry in os.scandir(frames_dir)
+                   if entry.name.endswith(".bmp") and entry.stat().st_mtime >= self.started - MTIME_SLACK_SECONDS)
+
+    def to_dict(self):
+        """Summarise the job for the batch summary."""
+        return {
+            "input": self.input_video,
+            "prefix": self.prefix,
+            "status": self.status,
+            "frames": self.frames,
+            "seconds": self.seconds,
+            "frames_per_s": self.frames / self.seconds if self.seconds else None,
+            "log": self.log_path,
+            "error": self.error
+        }
+
+
+def group_jobs(jobs):
+    """
+    Group jobs that decode the same frames.
+
+    Jobs that cannot share decoded frames get a group of their own.
+
+    Args:
+        jobs (list): Jobs to run
+
+    Returns:
+        tuple: ``(groups, failed)`` with the groups as lists of jobs in
+        submission order, and the jobs whose source could not be read
+    """
+    groups = {}
+    failed = []
+    for job in jobs:
+        try:
+            key = job.decode_key() if job.shares_decode() else id(job)
+        except OSError as e:
+            job.status = "failed"
+            job.error = str(e)
+            failed.append(job)
+            continue
+        groups.setdefault(key, []).append(job)
+    return list(groups.values()), failed
+
+
+class BatchScheduler:
+    """
+    Runs jobs with bounded decode and CPU concurrency.
+
+    Args:
+        output_dir (str): Folder for per-job outputs and logs
+        decodes (int): Jobs running at once
+        workers (int): CPU worker processes shared by running jobs
+        cache_dir (str): Decoded-frame cache for jobs that share a source
+    """
+
+    def __init__(self, output_dir, decodes=1, workers=1, cache_dir=DEFAULT_CACHE_DIR):
+        self.output_dir = output_dir
+        self.decodes = decodes
+        self.workers_per_job = max(1, workers // decodes)
+        self.cache_dir = cache_dir
+        self.jobs = []
+        self.prefixes = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=decodes)
+        self.futures = []
+        self.started = time.monotonic()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def make_job(self, input_video, options, prefix=None):
+        """
+        Create a job with a unique output prefix.
+
+        Args:
+            input_video (str): Source video
+            options (dict): ``video_processor.py`` options
+            prefix (str, optional): Output prefix relative to the output
+                folder; defaults to the video's file name
+
+        Returns:
+            Job: New job
+        """
+        base = prefix or os.path.splitext(os.path.basename(input_video))[0]
+        candidate = os.path.join(self.output_dir, base)
+        suffix = 2
+        while candidate in self.prefixes:
+            candidate = os.path.join(self.output_dir, f"{base}-{suffix}")
+            suffix += 1
+        self.prefixes.add(candidate)
+        return Job(input_video, candidate, options)
+
+    def submit(self, jobs):
+        """
+        Queue jobs, grouping those that decode the same frames.
+
+        Args:
+            jobs (list): Jobs to run
+        """
+        groups, failed = group_jobs(jobs)
+        self.jobs.extend(failed)
+        for group in groups:
+            self.jobs.extend(group)
+            self.futures.append(self.executor.submit(self._run_group, group))
+
+    def _run_group(self, group):
+        # Later jobs in a group read the frames the first one cached
+        shared = len(group) > 1
+        for job in group:
+            self._run_job(job, shared)
+
+    def _run_job(self, job, shared):
+        job.status = "running"
+        self._report(f"Started {job.input_video} -> {job.prefix}")
+        start = time.monotonic()
+        job.started = time.time()
+        with open(job.log_path, "w") as log:
+            result = subprocess.run(job.command(self.workers_per_job, self.cache_dir, shared),
+                                    stdout=log, stderr=subprocess.STDOUT)
+        job.seconds = time.monotonic() - start
+        job.frames = job.count_frames()
+        if result.returncode == 0:
+            job.status = "done"
+            self._report(f"Finished {job.prefix}: {job.frames} frames in {job.seconds:.1f}s")
+        else:
+            job.status = "failed"
+            job.error = f"Exit code {result.returncode}; see {job.log_path}"
+            self._report(f"Failed {job.prefix}: {job.error}")
+
+    def _report(self, message):
+        with self.lock:
+            print(message, flush=True)
+
+    def wait(self):
+        """Wait for every submitted job."""
+        for future in self.futures:
+            future.result()
+
+    def shutdown(self, cancel=False):
+        """
+        Stop accepting jobs.
+
+        Args:
+            cancel (bool): Drop jobs that have not started yet
+        """
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def summary(self):
+        """
+        Summarise throughput and failures.
+
+        Returns:
+            dict: Totals and per-job results
+        """
+        wall = time.monotonic() - self.started
+        done = [job for job in self.jobs if job.status == "done"]
+        frames = sum(job.frames for job in self.jobs)
+        return {
+            "jobs": len(self.jobs),
+            "done": len(done),
+            "failed": sum(1 for job in self.jobs if job.status == "failed"),
+            "not_run": sum(1 for job in self.jobs if job.status in ("queued", "running")),
+            "frames": frames,
+            "wall_s": wall,
+            "frames_per_s": frames / wall if wall else None,
+            "results": [job.to_dict() for job in self.jobs]
+        }
+
+
+def watch(scheduler, folder, options, poll_interval=5.0):
+    """
+    Queue every video that appears in a folder until interrupted.
+
+    A file is queued once its size is unchanged between two polls, so
+    videos still being copied in are not picked up half-written.
+
+    Args:
+        scheduler (BatchScheduler): Scheduler to submit jobs to
+        folder (str): Folder to watch
+        options (dict): ``video_processor.py`` options for every job
+        poll_interval (float): Seconds between polls
+    """
+    seen = set()
+    sizes = {}
+    print(f"Watching {folder} for videos (Ctrl+C to stop)")
+    while True:
+        ready = []
+        for path in find_videos([folder]):
+            if path in seen:
+                continue
+            size = os.path.getsize(path)
+            if sizes.get(path) == size:
+                seen.add(path)
+                ready.append(scheduler.make_job(path, dict(options)))
+            sizes[path] = size
+        if ready:
+            scheduler.submit(ready)
+        time.sleep(poll_interval)
+
+
+def print_summary(summary):
+    """Print the batch summary."""
+    print(f"\n{'status':<8} {'frames':>7} {'seconds':>8} {'frames/s':>9}  prefix")
+    for result in summary["results"]:
+        rate = f"{result['frames_per_s']:.1f}" if result["frames_per_s"] else "-"
+        print(f"{result['status']:<8} {result['frames']:>7} {result['seconds']:>8.1f} {rate:>9}  {result['prefix']}")
+        if result["error"]:
+            print(f"{'':<8} {result['error']}")
+    print(f"\n{summary['done']} of {summary['jobs']} jobs done, {summary['failed']} failed, "
+          f"{summary['not_run']} not run")
+    print(f"{summary['frames']} frames in {summary['wall_s']:.1f}s ({summary['frames_per_s'] or 0:.1f} frames/s)")
+
+
+def main():
+    """Command-line interface for batch processing."""
+    parser = argparse.ArgumentParser(description="Process many videos for e-paper display")
+    parser.add_argument("inputs", nargs="*", help="Video files, directories or glob patterns")
+    parser.add_argument("--jobs", metavar="FILE", help="JSON jobs file with per-film prefixes and options")
+    parser.add_argument("--watch", metavar="DIR", help="Keep watching this folder and queue new videos")
+    parser.add_argument("--poll", type=float, default=5, help="Seconds between watch-folder polls (default: 5)")
+    parser.add_argument("--output-dir", default="batch_output", help="Folder for outputs, logs and the summary (default: batch_output)")
+    parser.add_argument("--decodes", type=int, default=1, help="Jobs (FFmpeg decodes) running at once (default: 1)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="CPU worker processes shared by running jobs (default: all CPUs)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Decoded-frame cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--subtitle", help="Subtitle file for every job")
+    parser.add_argument("--fps", type=float, default=1, help="Frames per second (default: 1)")
+    parser.add_argument("--width", type=int, default=400, help="Output frame width (default: 400)")
+    parser.add_argument("--height", type=int, default=300, help="Output frame height (default: 300)")
+    parser.add_argument("--crop", action="store_true", help="Crop to the output aspect ratio instead of stretching")
+    parser.add_argument("--resample", choices=RESAMPLE_PRESETS, default="balanced", help="Resampling preset (default: balanced)")
+    parser.add_argument("--luma", action="store_true", help="Decode 8-bit luma instead of RGB for mono output")
+    parser.add_argument("--budget", type=int, metavar="N", help="Convert N representative frames of each film, chosen by scene change")
+    parser.add_argument("--dither", choices=DITHER_METHODS, default="floyd-steinberg", help="Dithering method (default: floyd-steinberg)")
+    parser.add_argument("--tone", choices=TONE_MODES, default="shot", help="Tone mapping mode (default: shot)")
+    parser.add_argument("--palette", choices=PALETTES, default="mono", help="Output palette, mono or 7color (default: mono)")
+    parser.add_argument("--format", choices=("bmp", "container"), default="bmp", help="Output format (default: bmp)")
+    parser.add_argument("--dedup", type=int, metavar="DISTANCE", help="Skip near-duplicate frames")
+    parser.add_argument("--dedup-window", type=int, default=4, help="Recent frames compared when deduplicating (default: 4)")
+    parser.add_argument("--resume", action="store_true", help="Resume each job from its job manifest")
+    parser.add_argument("--cache", action="store_true", help="Cache decoded frames for every job, not only shared sources")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="auto", help="Decode strategy (default: auto)")
+    parser.add_argument("--fsync", action="store_true", help="Flush frames to the device at each checkpoint")
+    parser.add_argument("--delta", action="store_true", help="Write a partial-refresh index for each job")
+
+    args = parser.parse_args()
+    if not args.inputs and not args.jobs and not args.watch:
+        parser.error("Give input videos, --jobs or --watch")
+    if args.decodes < 1 or args.workers < 1:
+        parser.error("--decodes and --workers must be at least 1")
+
+    # Timestamp manifests belong to one film, so only a jobs file sets them
+    options = {name: getattr(args, name, default) for name, default in DEFAULT_OPTIONS.items()}
+    scheduler = BatchScheduler(args.output_dir, args.decodes, args.workers, args.cache_dir)
+
+    interrupted = False
+    try:
+        jobs = [scheduler.make_job(path, dict(options)) for path in find_videos(args.inputs)]
+        if args.jobs:
+            for input_video, prefix, overrides in load_jobs_file(args.jobs):
+                jobs.append(scheduler.make_job(input_video, dict(options, **overrides), prefix))
+        scheduler.submit(jobs)
+        if args.watch:
+            watch(scheduler, args.watch, options, args.poll)
+        scheduler.wait()
+    except KeyboardInterrupt:
+        print("\nInterrupted; stopping")
+        interrupted = True
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        interrupted = True
+    finally:
+        scheduler.shutdown(cancel=interrupted)
+
+    summary = scheduler.summary()
+    print_summary(summary)
+    summary_path = os.path.join(args.output_dir, "batch_summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Summary written to {summary_path}")
+    if summary["failed"] or summary["not_run"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the video-to-e-paper pipeline.
+
+Synthetic test videos are rendered locally with FFmpeg's ``testsrc`` and
+``mandelbrot`` sources, so every machine benchmarks the same inputs. Each
+case is measured two ways:
+
+- stages, in process: decode (``iter_frames``), tone mapping, rendering
+  (``process_frame``), BMP encoding and writing, each as seconds and frames/s
+- a whole ``video_processor.py`` run in a child process, with wall time,
+  frames/s, peak RSS and the peak bytes it left in its temp directory
+
+Results are written as JSON and can be compared against a stored baseline.
+A golden file of output hashes shows that a faster path still produces the
+same frames.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from frame_source import iter_frames, parse_rate
+from output_sink import BmpEncoder
+from tone import tone_map
+from video_processor import process_frame
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "still-in-motion-bench")
+STAGES = ("decode", "tone", "render", "encode", "write")
+
+# Synthetic inputs; durations are in seconds of source video at 25 fps
+SUITES = {
+    "quick": [
+        {"name": "testsrc-360p-h264", "source": "testsrc", "size": "640x360", "codec": "libx264",
+         "duration": 20, "fps": 1},
+        {"name": "mandelbrot-360p-mpeg4", "source": "mandelbrot", "size": "640x360", "codec": "mpeg4",
+         "duration": 20, "fps": 1},
+    ],
+    "full": [
+        {"name": "testsrc-360p-h264", "source": "testsrc", "size": "640x360", "codec": "libx264",
+         "duration": 20, "fps": 1},
+        {"name": "mandelbrot-360p-mpeg4", "source": "mandelbrot", "size": "640x360", "codec": "mpeg4",
+         "duration": 20, "fps": 1},
+        {"name": "testsrc-1080p-h264", "source": "testsrc", "size": "1920x1080", "codec": "libx264",
+         "duration": 120, "fps": 1},
+        {"name": "mandelbrot-720p-h264-2fps", "source": "mandelbrot", "size": "1280x720", "codec": "libx264",
+         "duration": 60, "fps": 2},
+        {"name": "testsrc-720p-mpeg4-sparse", "source": "testsrc", "size": "1280x720", "codec": "mpeg4",
+         "duration": 300, "fps": 0.1},
+    ],
+}
+
+# Relative slowdown against the baseline reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def make_video(case, work_dir):
+    """
+    Render a synthetic test video, reusing it if it already exists.
+
+    Args:
+        case (dict): Benchmark case
+        work_dir (str): Directory for generated videos
+
+    Returns:
+        str: Path to the video
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, f"{case['source']}-{case['size']}-{case['codec']}-{case['duration']}s.mp4")
+    if os.path.exists(path):
+        return path
+    partial_path = path + ".partial.mp4"
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"{case['source']}=size={case['size']}:rate=25",
+        "-t", str(case["duration"]), "-c:v", case["codec"], "-pix_fmt", "yuv420p", "-g", "250",
+        partial_path
+    ]
+    subprocess.run(command, check=True)
+    os.replace(partial_path, path)
+    return path
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def benchmark_stages(video_path, case, width, height, dither, tone, output_dir):
+    """
+    Time each pipeline stage on its own.
+
+    Each stage consumes the previous stage's output from memory, so the
+    timings do not include the stages before it.
+
+    Args:
+        video_path (str): Input video
+        case (dict): Benchmark case
+        width (int): Frame width
+        height (int): Frame height
+        dither (str): Dithering method
+        tone (str): Tone mapping mode
+        output_dir (str): Scratch folder for the write stage
+
+    Returns:
+        dict: Seconds and frames/s per stage
+    """
+    rate = parse_rate(case["fps"])
+    timings = {}
+    timings["decode"], frames = _timed(
+        lambda: [(t, frame.copy()) for t, frame in iter_frames(video_path, rate, width, height)])
+    timings["tone"], toned = _timed(lambda: list(tone_map(iter(frames), tone)))
+    timings["render"], images = _timed(
+        lambda: [process_frame(frame, width, height, dither, tone) for _, frame in toned])
+
+    def encode():
+        encoder = BmpEncoder(width, height)
+        buffer = bytearray(encoder.size)
+        return [bytes(encoder.encode(img, buffer)) for img in images]
+
+    timings["encode"], encoded = _timed(encode)
+
+    def write():
+        os.makedirs(output_dir, exist_ok=True)
+        for index, data in enumerate(encoded):
+            with open(os.path.join(output_dir, f"frame_{index:04d}.bmp"), "wb") as f:
+                f.write(data)
+
+    timings["write"], _ = _timed(write)
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    count = len(frames)
+    return {
+        stage: {"seconds": seconds, "frames_per_s": count / seconds if seconds else None}
+        for stage, seconds in timings.items()
+    }
+
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def benchmark_run(video_path, case, run_dir, extra_args):
+    """
+    Time a whole ``video_processor.py`` run in a child process.
+
+    The child gets its own temp directory, which is polled to find the
+    peak number of bytes the run kept there. Unlinked temp files do not
+    show up there, but they are included in ``disk_write_bytes``.
+
+    Args:
+        video_path (str): Input video
+        case (dict): Benchmark case
+        run_dir (str): Scratch directory for the run's outputs
+        extra_args (list): Further ``video_processor.py`` arguments
+
+    Returns:
+        tuple: ``(result, frames_dir)`` with the run's measurements and the
+        folder holding its frames
+    """
+    shutil.rmtree(run_dir, ignore_errors=True)
+    temp_dir = os.path.join(run_dir, "tmp")
+    os.makedirs(temp_dir)
+    prefix = os.path.join(run_dir, "out")
+    command = [sys.executable, os.path.join(SCRIPT_DIR, "video_processor.py"), video_path, prefix,
+               "--fps", str(case["fps"])] + extra_args
+    env = dict(os.environ, TMPDIR=temp_dir, TEMP=temp_dir, TMP=temp_dir)
+
+    peak_temp = 0
+    done = threading.Event()
+
+    def poll_temp():
+        nonlocal peak_temp
+        while not done.wait(0.05):
+            peak_temp = max(peak_temp, _directory_bytes(temp_dir))
+
+    poller = threading.Thread(target=poll_temp, daemon=True)
+    poller.start()
+    start = time.perf_counter()
+    # The progress bar goes to stderr, so log it to a file rather than a pipe nobody drains
+    log_path = os.path.join(run_dir, "run.log")
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+        peak_rss = None
+        disk_write = None
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # Linux reports ru_maxrss in KiB, macOS in bytes
+            peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+            # Block output operations are counted in 512-byte units
+            disk_write = usage.ru_oublock * 512
+        else:
+            process.wait()
+    seconds = time.perf_counter() - start
+    done.set()
+    poller.join()
+    peak_temp = max(peak_temp, _directory_bytes(temp_dir))
+
+    if process.returncode != 0:
+        with open(log_path, errors="replace") as log:
+            raise RuntimeError(f"{case['name']}: video_processor.py failed: {log.read()[-500:]}")
+
+    frames_dir = prefix + "_frames"
+    frames = len([name for name in os.listdir(frames_dir) if name.endswith(".bmp")]) if os.path.isdir(frames_dir) else 0
+    return {
+        "seconds": seconds,
+        "frames": frames,
+        "frames_per_s": frames / seconds if seconds else None,
+        "peak_rss_bytes": peak_rss,
+        "peak_temp_bytes": peak_temp,
+        "disk_write_bytes": disk_write,
+        "output_bytes": _directory_bytes(frames_dir)
+    }, frames_dir
+
+
+def hash_frames(frames_dir):
+    """
+    Hash a folder of output frames in frame order.
+
+    Args:
+        frames_dir (str): Folder of ``frame_XXXX.bmp`` files
+
+    Returns:
+        str: SHA-256 over the decoded pixels of every frame
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(frames_dir)):
+        if not name.endswith(".bmp"):
+            continue
+        with Image.open(os.path.join(frames_dir, name)) as img:
+            # Hash pixels rather than bytes so header-only changes still match
+            digest.update(f"{name}:{img.mode}:{img.size}".encode())
+            digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def golden_key(case, extra_args):
+    """Key a golden hash by case and the options that affect output."""
+    return " ".join([case["name"], f"fps={case['fps']}"] + extra_args)
+
+
+def environment():
+    """
+    Describe the machine and library versions a result was measured on.
+
+    Returns:
+        dict: Environment metadata
+    """
+    ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "ffmpeg": ffmpeg,
+        "cpus": os.cpu_count()
+    }
+
+
+def run_suite(cases, work_dir, repeat=1, width=400, height=300, dither="floyd-steinberg", tone="shot",
+              workers=1, skip_stages=False):
+    """
+    Run every benchmark case.
+
+    Timings are the best of ``repeat`` runs; generated videos are kept in
+    ``work_dir`` and reused.
+
+    Args:
+        cases (list): Benchmark cases
+        work_dir (str): Directory for generated videos and scratch output
+        repeat (int): Runs per measurement
+        width (int): Frame width
+        height (int): Frame height
+        dither (str): Dithering method
+        tone (str): Tone mapping mode
+        workers (int): Worker processes for whole runs; not part of the
+            golden key, since output must not depend on it
+        skip_stages (bool): Only measure whole runs
+
+    Returns:
+        dict: Results with environment metadata
+    """
+    run_args = ["--width", str(width), "--height", str(height), "--dither", dither, "--tone", tone]
+    results = {"environment": environment(), "args": run_args, "workers": workers, "cases": {}}
+    for case in cases:
+        print(f"{case['name']}: preparing video")
+        video_path = make_video(case, os.path.join(work_dir, "videos"))
+        scratch = os.path.join(work_dir, "scratch")
+        result = {"case": case}
+
+        if not skip_stages:
+            runs = [benchmark_stages(video_path, case, width, height, dither, tone, scratch) for _ in range(repeat)]
+            result["stages"] = {
+                stage: min((run[stage] for run in runs), key=lambda timing: timing["seconds"])
+                for stage in STAGES
+            }
+
+        runs = []
+        for _ in range(repeat):
+            run, frames_dir = benchmark_run(video_path, case, scratch, run_args + ["--workers", str(workers)])
+            run["output_sha256"] = hash_frames(frames_dir)
+            runs.append(run)
+        best = min(runs, key=lambda run: run["seconds"])
+        best["peak_rss_bytes"] = max((run["peak_rss_bytes"] or 0) for run in runs) or None
+        best["peak_temp_bytes"] = max(run["peak_temp_bytes"] for run in runs)
+        if len({run["output_sha256"] for run in runs}) > 1:
+            best["nondeterministic"] = True
+        result["run"] = best
+        result["golden_key"] = golden_key(case, run_args)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+        results["cases"][case["name"]] = result
+        print(f"{case['name']}: {best['frames']} frames in {best['seconds']:.2f}s "
+              f"({best['frames_per_s']:.1f} frames/s)")
+    return results
+
+
+def check_golden(results, golden_path, update=False):
+    """
+    Compare output hashes against a golden file, or record them.
+
+    Args:
+        results (dict): Suite results
+        golden_path (str): Golden file path
+        update (bool): Record the current hashes instead of checking
+
+    Returns:
+        list: Cases whose output differs from the golden hash
+    """
+    golden = {}
+    if os.path.exists(golden_path):
+        with open(golden_path) as f:
+            golden = json.load(f)
+
+    mismatches = []
+    for name, result in results["cases"].items():
+        key = result["golden_key"]
+        digest = result["run"]["output_sha256"]
+        if update:
+            golden[key] = digest
+        elif key not in golden:
+            print(f"Golden: no recorded output for {key}")
+        elif golden[key] != digest:
+            mismatches.append(name)
+            print(f"Golden: {name} output differs from the recorded frames")
+        else:
+            print(f"Golden: {name} matches")
+
+    if update:
+        with open(golden_path, "w") as f:
+            json.dump(golden, f, indent=2, sort_keys=True)
+        print(f"Recorded golden hashes in {golden_path}")
+    return mismatches
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Print each measurement against a baseline result file.
+
+    Args:
+        results (dict): Suite results
+        baseline (dict): Earlier suite results
+        threshold (float): Relative slowdown reported as a regression
+
+    Returns:
+        list: ``(case, measurement)`` pairs that regressed
+    """
+    regressions = []
+    print(f"\n{'case':<28} {'measurement':<12} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results["cases"].items():
+        previous = baseline.get("cases", {}).get(name)
+        if previous is None:
+            continue
+        pairs = [("run", previous.get("run"), result["run"])]
+        pairs += [(stage, previous.get("stages", {}).get(stage), result.get("stages", {}).get(stage))
+                  for stage in STAGES]
+        for label, old, new in pairs:
+            if not old or not new:
+                continue
+            change = new["seconds"] / old["seconds"] - 1 if old["seconds"] else 0
+            marker = " !" if change > threshold else ""
+            print(f"{name:<28} {label:<12} {old['seconds']:>9.3f}s {new['seconds']:>9.3f}s {change:>+7.1%}{marker}")
+            if change > threshold:
+                regressions.append((name, label))
+        old_rss = previous.get("run", {}).get("peak_rss_bytes")
+        new_rss = result["run"]["peak_rss_bytes"]
+        if old_rss and new_rss:
+            print(f"{name:<28} {'peak RSS':<12} {old_rss / 2 ** 20:>8.1f}MB {new_rss / 2 ** 20:>8.1f}MB "
+                  f"{new_rss / old_rss - 1:>+7.1%}")
+    return regressions
+
+
+def print_results(results):
+    """Print a table of stage and whole-run results."""
+    print(f"\n{'case':<28} {'stage':<8} {'seconds':>9} {'frames/s':>10}")
+    for name, result in results["cases"].items():
+        for stage, timing in result.get("stages", {}).items():
+            print(f"{name:<28} {stage:<8} {timing['seconds']:>9.3f} {timing['frames_per_s'] or 0:>10.1f}")
+        run = result["run"]
+        print(f"{name:<28} {'run':<8} {run['seconds']:>9.3f} {run['frames_per_s'] or 0:>10.1f}")
+        rss = f"{run['peak_rss_bytes'] / 2 ** 20:.1f} MB" if run["peak_rss_bytes"] else "n/a"
+        written = f"{run['disk_write_bytes']:,} bytes" if run["disk_write_bytes"] is not None else "n/a"
+        print(f"{'':<28} peak RSS {rss}, peak temp {run['peak_temp_bytes']:,} bytes, "
+              f"disk writes {written}, output {run['output_bytes']:,} bytes")
+
+
+def main():
+    """Command-line interface for the benchmark suite."""
+    parser = argparse.ArgumentParser(description="Benchmark the video-to-e-paper pipeline on synthetic videos")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick", help="Set of cases to run (default: quick)")
+    parser.add_argument("--case", action="append", help="Only run cases with this name (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement; the best is kept (default: 1)")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help=f"Generated videos and scratch output (default: {DEFAULT_WORK_DIR})")
+    parser.add_argument("--dither", default="floyd-steinberg", help="Dithering method (default: floyd-steinberg)")
+    parser.add_argument("--tone", default="shot", help="Tone mapping mode (default: shot)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for whole runs (default: 1)")
+    parser.add_argument("--runs-only", action="store_true", help="Skip the per-stage measurements")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Compare against an earlier results JSON")
+    parser.add_argument("--golden", help="Golden output hashes to check against")
+    parser.add_argument("--update-golden", action="store_true", help="Record the current output hashes in --golden")
+
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        print("Error: FFmpeg is not installed or not in system PATH.")
+        sys.exit(1)
+
+    cases = SUITES[args.suite]
+    if args.case:
+        cases = [case for case in cases if case["name"] in args.case]
+        if not cases:
+            print(f"Error: No cases named {', '.join(args.case)} in the {args.suite} suite")
+            sys.exit(1)
+
+    try:
+        results = run_suite(cases, args.work_dir, args.repeat, dither=args.dither, tone=args.tone,
+                            workers=args.workers, skip_stages=args.runs_only)
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if args.golden:
+        failed |= bool(check_golden(results, args.golden, args.update_golden))
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed |= bool(compare(results, json.load(f)))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
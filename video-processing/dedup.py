@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash deduplication of sampled frames.
+
+Long static shots and black or fade frames produce runs of nearly identical
+stills. Each one costs dithering time, SD card space and one of the
+firmware's ``MAX_PICTURE_INDEX`` slots. This stage sits between decoding and
+``process_frame``: it hashes a tiny grayscale copy of every frame and drops
+frames that are within a Hamming distance of a recently kept one, recording
+which source timestamps each kept frame stands for.
+"""
+import json
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+
+
+def difference_hash(frame, hash_size=HASH_SIZE):
+    """
+    Compute a difference hash (dHash) of a frame.
+
+    Args:
+        frame (numpy.ndarray): RGB or grayscale frame
+        hash_size (int): Hash is ``hash_size ** 2`` bits
+
+    Returns:
+        tuple: ``(hash, mean)`` with the hash as an int and the mean
+        brightness of the thumbnail in the range [0, 255]
+    """
+    thumb = Image.fromarray(frame).convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big"), float(pixels.mean())
+
+
+def hamming_distance(a, b):
+    """
+    Count differing bits between two hashes.
+
+    Args:
+        a (int): First hash
+        b (int): Second hash
+
+    Returns:
+        int: Number of differing bits
+    """
+    return bin(a ^ b).count("1")
+
+
+class FrameDeduplicator:
+    """
+    Rolling index of recently kept frame hashes.
+
+    Flat frames (black, white, fades) all hash to zero because they have no
+    gradients, so matches must also agree on mean brightness.
+
+    Args:
+        max_distance (int): Largest Hamming distance treated as a duplicate
+        window (int): Number of recently kept frames to compare against
+        max_brightness_delta (float): Largest mean brightness difference
+            treated as a duplicate
+    """
+
+    def __init__(self, max_distance=4, window=4, max_brightness_delta=16):
+        self.max_distance = max_distance
+        self.max_brightness_delta = max_brightness_delta
+        self.recent = deque(maxlen=window)
+        # Timestamps collapsed into each kept frame, keyed by its timestamp
+        self.groups = {}
+        # Hash and mean brightness of each kept frame, keyed by its timestamp
+        self.hashes = {}
+        self.skipped = 0
+
+    def find_match(self, frame_hash, mean):
+        """
+        Find a recently kept frame that the given hash duplicates.
+
+        Args:
+            frame_hash (int): Hash of the candidate frame
+            mean (float): Mean brightness of the candidate frame
+
+        Returns:
+            float: Timestamp of the matching kept frame, or None
+        """
+        for kept_hash, kept_mean, kept_timestamp in reversed(self.recent):
+            if (hamming_distance(frame_hash, kept_hash) <= self.max_distance
+                    and abs(mean - kept_mean) <= self.max_brightness_delta):
+                return kept_timestamp
+        return None
+
+    def filter(self, frames, kept=None, until=None):
+        """
+        Drop near-duplicate frames from a frame stream.
+
+        Duplicates are compared against the frame that started their run,
+        not the previous one, so a slow pan cannot drift arbitrarily far.
+
+        Args:
+            frames (iterable): ``(timestamp, frame)`` pairs
+            kept (set, optional): Timestamps an earlier run kept; up to
+                ``until``, exactly these frames are kept, so a resumed run
+                continues that run's selection
+            until (float, optional): Last timestamp ``kept`` decides
+
+        Yields:
+            tuple: ``(timestamp, frame)`` for each kept frame
+        """
+        for timestamp, frame in frames:
+            frame_hash, mean = difference_hash(frame)
+            if kept is not None and timestamp <= until:
+                if timestamp not in kept:
+                    # The earlier run skipped it, possibly at another size
+                    match = self.find_match(frame_hash, mean)
+                    if match is None and self.recent:
+                        match = self.recent[-1][2]
+                    if match is not None:
+                        self.groups[match].append(timestamp)
+                    self.skipped += 1
+                    continue
+                match = None
+            else:
+                match = self.find_match(frame_hash, mean)
+            if match is not None:
+                self.groups[match].append(timestamp)
+                self.skipped += 1
+                continue
+            self.recent.append((frame_hash, mean, timestamp))
+            self.groups[timestamp] = [timestamp]
+            self.hashes[timestamp] = (frame_hash, mean)
+            yield timestamp, frame
+
+    def state(self, until):
+        """
+        Capture the selection up to a timestamp, so a resumed run can
+        continue it without decoding the frames again.
+
+        Args:
+            until (float): Last timestamp to include, normally that of the
+                last committed frame
+
+        Returns:
+            list: ``{"timestamp", "hash", "mean", "timestamps"}`` for each
+            frame kept up to ``until``, in order
+        """
+        return [{"timestamp": timestamp, "hash": frame_hash, "mean": mean,
+                 "timestamps": [t for t in self.groups[timestamp] if t <= until]}
+                for timestamp, (frame_hash, mean) in self.hashes.items() if timestamp <= until]
+
+    def restore(self, state, until):
+        """
+        Continue a selection captured by ``state``.
+
+        Every frame up to ``until`` has then been seen: the window holds the
+        last kept frames and their groups stay open for the frames after.
+
+        Args:
+            state (list): Output of ``state``
+            until (float): Timestamp the run resumes after; later entries
+                are ignored
+        """
+        for entry in state:
+            timestamp = entry["timestamp"]
+            if timestamp > until:
+                continue
+            self.recent.append((entry["hash"], entry["mean"], timestamp))
+            self.hashes[timestamp] = (entry["hash"], entry["mean"])
+            self.groups[timestamp] = [t for t in entry["timestamps"] if t <= until]
+            self.skipped += len(self.groups[timestamp]) - 1
+
+    def write_manifest(self, path, written):
+        """
+        Write a JSON manifest mapping output frames to source timestamps.
+
+        Args:
+            path (str): Manifest path
+            written (list): ``(filename, timestamp)`` for each saved frame
+        """
+        manifest = {
+            "max_distance": self.max_distance,
+            "window": self.recent.maxlen,
+            "skipped": self.skipped,
+            "frames": [
+                {"file": filename, "timestamps": self.groups.get(timestamp, [timestamp])}
+                for filename, timestamp in written
+            ]
+        }
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
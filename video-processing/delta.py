@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Inter-frame dirty regions for partial-refresh updates.
+
+Consecutive stills from one shot often differ in a small area only. This
+module XORs every output frame with the one before it, in packed panel
+form, and records what changed: the range of changed rows and a bounding
+box whose left and right edges are aligned to 8-pixel columns, so it
+covers whole bytes of a 1bpp row and whole 4-byte groups of a 4bpp row.
+
+The regions are written to a sidecar index the firmware can read next to
+the frames:
+
+    offset  size  field
+    0       4     magic "SIMD"
+    4       2     version
+    6       2     bits per pixel (1 or 4)
+    8       2     width in pixels
+    10      2     height in pixels
+    12      4     frame count
+    16      8*N   one record per frame: uint16 top, bottom, left, right
+
+All integers are little-endian. ``bottom`` and ``right`` are exclusive,
+and ``left`` and ``right`` are in pixels. Record ``i`` is frame ``i``
+compared with frame ``i - 1``, so record 0 always covers the whole frame.
+An all-zero record means the frame is identical to the previous one and
+needs no refresh at all.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+from PIL import Image
+
+from epd_container import ContainerReader
+
+MAGIC = b"SIMD"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHI")
+RECORD = np.dtype([("top", "<u2"), ("bottom", "<u2"), ("left", "<u2"), ("right", "<u2")])
+
+# Frames XORed per vectorized pass, bounding memory on long films
+CHUNK_FRAMES = 256
+
+# Pixel alignment of the bounding box's left and right edges
+COLUMN_ALIGN = 8
+
+
+def frame_plane(img):
+    """
+    Pack a frame into rows of panel bytes.
+
+    Args:
+        img (PIL.Image): Mode "1" frame, or mode "P" frame with palette
+            indices below 16
+
+    Returns:
+        tuple: ``(plane, bits)`` with ``plane`` a ``(height, row_bytes)``
+        uint8 array and ``bits`` the bits per pixel
+
+    Raises:
+        ValueError: If the frame is in another mode
+    """
+    width, height = img.size
+    if img.mode == "1":
+        return np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(height, (width + 7) // 8), 1
+    if img.mode == "P":
+        indices = np.asarray(img)
+        if width % 2:
+            indices = np.pad(indices, ((0, 0), (0, 1)))
+        return (indices[:, 0::2] << 4) | (indices[:, 1::2] & 0x0F), 4
+    raise ValueError(f"Unsupported frame mode {img.mode}")
+
+
+def dirty_regions(planes, previous=None, bits=1, width=None):
+    """
+    Find what changed between consecutive frames in one vectorized pass.
+
+    Args:
+        planes (numpy.ndarray): ``(N, height, row_bytes)`` packed frames
+        previous (numpy.ndarray, optional): Packed frame before
+            ``planes[0]``; without it the first frame is all dirty
+        bits (int): Bits per pixel of the planes
+        width (int, optional): Frame width in pixels; defaults to the full
+            width of the rows
+
+    Returns:
+        numpy.ndarray: N ``RECORD`` entries
+    """
+    count, height, row_bytes = planes.shape
+    if width is None:
+        width = row_bytes * 8 // bits
+    records = np.zeros(count, dtype=RECORD)
+    if count == 0:
+        return records
+    before = np.concatenate([previous[None] if previous is not None else ~planes[:1], planes[:-1]])
+    changed = planes ^ before
+    rows = changed.any(axis=2)
+    # Bytes per aligned column group
+    group = COLUMN_ALIGN * bits // 8
+    columns = changed.any(axis=1)
+    columns = np.pad(columns, ((0, 0), (0, -row_bytes % group)))
+    columns = columns.reshape(count, -1, group).any(axis=2)
+    dirty = rows.any(axis=1)
+
+    records["top"] = np.where(dirty, rows.argmax(axis=1), 0)
+    records["bottom"] = np.where(dirty, height - rows[:, ::-1].argmax(axis=1), 0)
+    left = columns.argmax(axis=1) * COLUMN_ALIGN
+    right = (columns.shape[1] - columns[:, ::-1].argmax(axis=1)) * COLUMN_ALIGN
+    records["left"] = np.where(dirty, left, 0)
+    records["right"] = np.where(dirty, np.minimum(right, width), 0)
+    return records
+
+
+def iter_planes(source):
+    """
+    Read packed frames from a BMP folder or a frame container.
+
+    Args:
+        source (str): Folder of ``frame_XXXX.bmp`` files or ``.simf`` file
+
+    Yields:
+        tuple: ``(plane, bits, width)`` per frame in order
+    """
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.endswith(".bmp"))
+        for name in names:
+            with Image.open(os.path.join(source, name)) as img:
+                plane, bits = frame_plane(img)
+                yield plane, bits, img.size[0]
+    else:
+        reader = ContainerReader(source)
+        row_bytes = (reader.width + 7) // 8
+        for index in range(reader.count):
+            plane = np.frombuffer(reader.read_plane(index), dtype=np.uint8).reshape(reader.height, row_bytes)
+            yield plane, 1, reader.width
+
+
+def build_index(source, chunk=CHUNK_FRAMES):
+    """
+    Compute the dirty region of every frame.
+
+    Args:
+        source (str): Folder of ``frame_XXXX.bmp`` files or ``.simf`` file
+        chunk (int): Frames XORed per pass
+
+    Returns:
+        dict: ``records`` (``RECORD`` array), ``bits``, ``width``, ``height``
+
+    Raises:
+        ValueError: If there are no frames or their format changes
+    """
+    chunks = []
+    batch = []
+    previous = None
+    fmt = None
+    for plane, bits, width in iter_planes(source):
+        if fmt is None:
+            fmt = (bits, width, plane.shape)
+        elif (bits, width, plane.shape) != fmt:
+            raise ValueError("Frames differ in size or format")
+        batch.append(plane)
+        if len(batch) == chunk:
+            chunks.append(dirty_regions(np.stack(batch), previous, bits, width))
+            previous = batch[-1]
+            batch = []
+    if fmt is None:
+        raise ValueError(f"No frames found in {source}")
+    if batch:
+        chunks.append(dirty_regions(np.stack(batch), previous, fmt[0], fmt[1]))
+    bits, width, (height, _) = fmt
+    return {"records": np.concatenate(chunks), "bits": bits, "width": width, "height": height}
+
+
+def write_index(index, path):
+    """
+    Write a dirty-region index as a sidecar file.
+
+    Args:
+        index (dict): Index from ``build_index``
+        path (str): Output path
+    """
+    records = index["records"]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, index["bits"], index["width"], index["height"], len(records)))
+        f.write(records.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_index(path):
+    """
+    Read a sidecar index.
+
+    Args:
+        path (str): Index path
+
+    Returns:
+        dict: Index as from ``build_index``
+
+    Raises:
+        ValueError: If the file is not a valid index
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("File is too short for an index header")
+        magic, version, bits, width, height, count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not a dirty-region index (bad magic)")
+        if version != VERSION:
+            raise ValueError(f"Unsupported index version {version}")
+        records = np.frombuffer(f.read(RECORD.itemsize * count), dtype=RECORD)
+    if len(records) != count:
+        raise ValueError("Index records are truncated")
+    return {"records": records, "bits": bits, "width": width, "height": height}
+
+
+def savings_report(index):
+    """
+    Estimate the SD card and SPI bytes partial refreshes would save.
+
+    A full update reads every row of the frame from the card and sends
+    every byte to the panel. A partial update reads only the changed row
+    range, which is contiguous in the file, and sends only the bytes of the
+    bounding box. Identical frames need neither.
+
+    Args:
+        index (dict): Index from ``build_index`` or ``read_index``
+
+    Returns:
+        dict: Frame counts and full and partial byte totals
+    """
+    records = index["records"]
+    row_bytes = (index["width"] * index["bits"] + 7) // 8
+    # BMP rows are padded to four bytes on the card
+    stride = (row_bytes + 3) // 4 * 4
+    rows = records["bottom"].astype(np.int64) - records["top"]
+    box_bytes = (records["right"].astype(np.int64) - records["left"]) * index["bits"] // 8
+    full_sd = len(records) * index["height"] * stride
+    full_spi = len(records) * index["height"] * row_bytes
+    partial_sd = int((rows * stride).sum())
+    partial_spi = int((rows * box_bytes).sum())
+    area = rows * (records["right"].astype(np.int64) - records["left"]) / (index["width"] * index["height"])
+    return {
+        "frames": len(records),
+        "unchanged_frames": int((rows == 0).sum()),
+        "mean_dirty_area": float(area.mean()) if len(records) else 0.0,
+        "sd_bytes_full": full_sd,
+        "sd_bytes_partial": partial_sd,
+        "spi_bytes_full": full_spi,
+        "spi_bytes_partial": partial_spi
+    }
+
+
+def print_report(report):
+    """Print a savings report."""
+    def saved(full, partial):
+        return f"{partial:,} of {full:,} bytes ({1 - partial / full:.0%} saved)" if full else "n/a"
+
+    print(f"Frames: {report['frames']}, unchanged: {report['unchanged_frames']}, "
+          f"mean dirty area {report['mean_dirty_area']:.0%}")
+    print(f"SD reads:  {saved(report['sd_bytes_full'], report['sd_bytes_partial'])}")
+    print(f"SPI sends: {saved(report['spi_bytes_full'], report['spi_bytes_partial'])}")
+
+
+def main():
+    """Command-line interface for building dirty-region indexes."""
+    parser = argparse.ArgumentParser(description="Build a partial-refresh index for a frame folder or container")
+    parser.add_argument("source", help="Folder of frame_XXXX.bmp files or a .simf container")
+    parser.add_argument("--output", help="Index path (default: <source>.delta)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the savings report as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        index = build_index(args.source)
+        output = args.output or args.source.rstrip(os.sep) + ".delta"
+        write_index(index, output)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    report = savings_report(index)
+    print(f"Wrote {report['frames']} dirty regions to {output}")
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
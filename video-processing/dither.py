@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Vectorized 1-bit dithering for stacks of grayscale frames.
+
+Every function takes a single ``(H, W)`` frame or a batch of frames as an
+``(N, H, W)`` uint8 array and returns an array of the same shape holding
+0 (black) or 255 (white).
+
+Threshold modes (``bayer``, ``blue-noise``) are a single vectorized
+comparison. Error-diffusion modes process the whole batch at once:
+Floyd-Steinberg and Atkinson sweep anti-diagonal wavefronts so every pixel
+whose neighbours are already final is updated in one step, and serpentine
+Floyd-Steinberg sweeps each row in alternating directions across the batch.
+
+``floyd-steinberg`` reproduces Pillow's ``convert("1")`` bit for bit, so it
+can be validated against the PIL path used by ``process_frame``.
+"""
+import numpy as np
+from PIL import Image
+
+from options import DITHER_METHODS as METHODS
+
+# (dy, dx, weight) neighbours receiving error, and the divisor of the weights
+FLOYD_STEINBERG = (((0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1)), 16)
+ATKINSON = (((0, 1, 1), (0, 2, 1), (1, -1, 1), (1, 0, 1), (1, 1, 1), (2, 0, 1)), 8)
+
+# Batch size from which a NumPy step per pixel beats per-frame Python sweeps
+SERPENTINE_BATCH_MIN = 48
+
+# Threshold Pillow's bilevel conversion uses: values above it become white
+PIL_THRESHOLD = 128
+
+_blue_noise_cache = {}
+
+
+def luma(frames):
+    """
+    Convert RGB frames to 8-bit luma with Pillow's bilevel formula.
+
+    Pillow's ``convert("1")`` truncates ``(299 R + 587 G + 114 B) / 1000``
+    rather than rounding, so this is what the dithered result must start
+    from to match it exactly.
+
+    Args:
+        frames (numpy.ndarray): ``(..., 3)`` uint8 RGB frames
+
+    Returns:
+        numpy.ndarray: ``(...)`` uint8 luma
+    """
+    rgb = frames.astype(np.int32)
+    return ((rgb[..., 0] * 299 + rgb[..., 1] * 587 + rgb[..., 2] * 114) // 1000).astype(np.uint8)
+
+
+def bayer_matrix(order=3):
+    """
+    Build a normalised Bayer threshold matrix.
+
+    Args:
+        order (int): Matrix is ``2**order`` square
+
+    Returns:
+        numpy.ndarray: Thresholds in the range [0, 255]
+    """
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    for _ in range(order):
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix + 0.5) * 255.0 / matrix.size
+
+
+def blue_noise_matrix(size=64, seed=0, iterations=8):
+    """
+    Build a tileable blue-noise threshold matrix.
+
+    White noise is repeatedly high-pass filtered on a torus and then
+    rank-ordered, which pushes its energy to high frequencies while keeping
+    the thresholds uniformly distributed. The result is cached.
+
+    Args:
+        size (int): Matrix is ``size`` square
+        seed (int): Random seed, so the mask is reproducible between runs
+        iterations (int): Number of high-pass filter passes
+
+    Returns:
+        numpy.ndarray: Thresholds in the range [0, 255]
+    """
+    key = (size, seed, iterations)
+    if key not in _blue_noise_cache:
+        rng = np.random.default_rng(seed)
+        noise = rng.random((size, size))
+        freqs = np.fft.fftfreq(size)
+        radius_sq = freqs[:, None] ** 2 + freqs[None, :] ** 2
+        lowpass = np.exp(-radius_sq * (2 * np.pi * 1.5) ** 2 / 2)
+        for _ in range(iterations):
+            noise = noise - np.real(np.fft.ifft2(np.fft.fft2(noise) * lowpass))
+            ranks = np.argsort(np.argsort(noise, axis=None)).reshape(size, size)
+            noise = ranks / (size * size)
+        _blue_noise_cache[key] = (noise * (size * size) + 0.5) * 255.0 / (size * size)
+    return _blue_noise_cache[key]
+
+
+def _as_batch(frames):
+    frames = np.asarray(frames)
+    if frames.dtype != np.uint8:
+        raise ValueError("Frames must be uint8 grayscale")
+    if frames.ndim == 2:
+        return frames[None], True
+    if frames.ndim == 3:
+        return frames, False
+    raise ValueError("Frames must have shape (H, W) or (N, H, W)")
+
+
+def _threshold(frames, matrix):
+    batch, single = _as_batch(frames)
+    _, height, width = batch.shape
+    reps = (-(-height // matrix.shape[0]), -(-width // matrix.shape[1]))
+    thresholds = np.tile(matrix, reps)[:height, :width]
+    out = np.where(batch > thresholds, 255, 0).astype(np.uint8)
+    return out[0] if single else out
+
+
+def ordered(frames, order=3):
+    """
+    Ordered dither against a tiled Bayer matrix.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W)`` or ``(N, H, W)`` uint8 frames
+        order (int): Bayer matrix is ``2**order`` square
+
+    Returns:
+        numpy.ndarray: Dithered frames, 0 or 255
+    """
+    return _threshold(frames, bayer_matrix(order))
+
+
+def blue_noise(frames, size=64, seed=0):
+    """
+    Threshold dither against a tiled blue-noise mask.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W)`` or ``(N, H, W)`` uint8 frames
+        size (int): Mask size
+        seed (int): Mask seed
+
+    Returns:
+        numpy.ndarray: Dithered frames, 0 or 255
+    """
+    return _threshold(frames, blue_noise_matrix(size, seed))
+
+
+def _truncating_div(values, divisor):
+    """Integer division rounding toward zero, as C does."""
+    quotient = np.abs(values) // divisor
+    return np.where(values < 0, -quotient, quotient)
+
+
+def _diffuse_pixels(batch, acc, out, ys, xs, kernel, divisor):
+    """
+    Quantize a set of independent pixels and push their error onwards.
+
+    ``acc`` is padded by two pixels on every side, so neighbour writes never
+    need bounds checks.
+    """
+    value = batch[:, ys, xs].astype(np.int32) + _truncating_div(acc[:, ys + 2, xs + 2], divisor)
+    value = np.clip(value, 0, 255)
+    quantized = np.where(value > PIL_THRESHOLD, 255, 0)
+    out[:, ys, xs] = quantized
+    error = value - quantized
+    for dy, dx, weight in kernel:
+        acc[:, ys + 2 + dy, xs + 2 + dx] += weight * error
+
+
+def _diffuse_wavefront(frames, kernel, divisor):
+    batch, single = _as_batch(frames)
+    count, height, width = batch.shape
+    acc = np.zeros((count, height + 4, width + 4), dtype=np.int32)
+    out = np.empty_like(batch)
+    # Kernels only reach one pixel back along the previous row, so every
+    # pixel on the line x + 2y = t depends only on earlier lines.
+    rows = np.arange(height)
+    for t in range(width + 2 * (height - 1)):
+        xs = t - 2 * rows
+        valid = (xs >= 0) & (xs < width)
+        _diffuse_pixels(batch, acc, out, rows[valid], xs[valid], kernel, divisor)
+    # Errors pushed past the right/bottom edge land in the padding and are
+    # dropped, exactly as Pillow drops them
+    return out[0] if single else out
+
+
+def floyd_steinberg(frames):
+    """
+    Floyd-Steinberg error diffusion, bit-identical to Pillow.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W)`` or ``(N, H, W)`` uint8 frames
+
+    Returns:
+        numpy.ndarray: Dithered frames, 0 or 255
+    """
+    return _diffuse_wavefront(frames, *FLOYD_STEINBERG)
+
+
+def atkinson(frames):
+    """
+    Atkinson error diffusion (diffuses 6/8 of the error).
+
+    Args:
+        frames (numpy.ndarray): ``(H, W)`` or ``(N, H, W)`` uint8 frames
+
+    Returns:
+        numpy.ndarray: Dithered frames, 0 or 255
+    """
+    return _diffuse_wavefront(frames, *ATKINSON)
+
+
+def _serpentine_frame(frame):
+    """Serpentine sweep of one frame with plain Python integers."""
+    height, width = frame.shape
+    pixels = frame.tolist()
+    acc = [[0] * (width + 2) for _ in range(height + 1)]
+    out = [[0] * width for _ in range(height)]
+    for y in range(height):
+        step = -1 if y % 2 else 1
+        columns = range(width - 1, -1, -1) if step < 0 else range(width)
+        row, below, row_pixels, row_out = acc[y], acc[y + 1], pixels[y], out[y]
+        for x in columns:
+            total = row[x + 1]
+            value = row_pixels[x] + (total // 16 if total >= 0 else -(-total // 16))
+            value = 0 if value < 0 else 255 if value > 255 else value
+            quantized = 255 if value > PIL_THRESHOLD else 0
+            row_out[x] = quantized
+            error = value - quantized
+            row[x + 1 + step] += 7 * error
+            below[x + 1 - step] += 3 * error
+            below[x + 1] += 5 * error
+            below[x + 1 + step] += error
+    return np.array(out, dtype=np.uint8)
+
+
+def _serpentine_batch(batch):
+    """Serpentine sweep of a whole batch, one NumPy step per pixel position."""
+    count, height, width = batch.shape
+    # Pixel-major layout so each step touches one contiguous run of N values
+    pixels = np.ascontiguousarray(batch.transpose(1, 2, 0)).astype(np.int32)
+    acc = np.zeros((height + 1, width + 2, count), dtype=np.int32)
+    out = np.empty((height, width, count), dtype=np.uint8)
+    for y in range(height):
+        step = -1 if y % 2 else 1
+        columns = range(width - 1, -1, -1) if step < 0 else range(width)
+        row, below = acc[y], acc[y + 1]
+        for x in columns:
+            value = np.clip(pixels[y, x] + _truncating_div(row[x + 1], 16), 0, 255)
+            quantized = np.where(value > PIL_THRESHOLD, 255, 0)
+            out[y, x] = quantized
+            error = value - quantized
+            row[x + 1 + step] += 7 * error
+            below[x + 1 - step] += 3 * error
+            below[x + 1] += 5 * error
+            below[x + 1 + step] += error
+    return out.transpose(2, 0, 1)
+
+
+def serpentine(frames):
+    """
+    Floyd-Steinberg error diffusion with alternating row direction.
+
+    Rows cannot be pipelined when their direction alternates, so every
+    pixel position is its own step. Large batches share each step across
+    all frames; small batches are faster swept frame by frame.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W)`` or ``(N, H, W)`` uint8 frames
+
+    Returns:
+        numpy.ndarray: Dithered frames, 0 or 255
+    """
+    batch, single = _as_batch(frames)
+    if len(batch) >= SERPENTINE_BATCH_MIN:
+        out = _serpentine_batch(batch)
+    else:
+        out = np.stack([_serpentine_frame(frame) for frame in batch]) if len(batch) else batch.copy()
+    return out[0] if single else out
+
+
+def dither(frames, method="floyd-steinberg"):
+    """
+    Dither grayscale frames to 1 bit with the named method.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W)`` or ``(N, H, W)`` uint8 frames
+        method (str): One of ``METHODS``
+
+    Returns:
+        numpy.ndarray: Dithered frames, 0 or 255
+
+    Raises:
+        ValueError: If the method is unknown
+    """
+    if method == "floyd-steinberg":
+        return floyd_steinberg(frames)
+    if method == "atkinson":
+        return atkinson(frames)
+    if method == "serpentine":
+        return serpentine(frames)
+    if method == "bayer":
+        return ordered(frames)
+    if method == "blue-noise":
+        return blue_noise(frames)
+    raise ValueError(f"Unknown dither method: {method}")
+
+
+def dither_image(img, method="floyd-steinberg"):
+    """
+    Dither a PIL image to a 1-bit PIL image with the named method.
+
+    Args:
+        img (PIL.Image): RGB or grayscale image
+        method (str): One of ``METHODS``
+
+    Returns:
+        PIL.Image: Mode "1" image
+    """
+    if img.mode == "RGB":
+        gray = luma(np.asarray(img))
+    else:
+        gray = np.asarray(img.convert("L"))
+    return Image.fromarray(dither(gray, method)).convert("1", dither=Image.NONE)
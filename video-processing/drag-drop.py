@@ -1,29 +1,44 @@
 import os
-import sys
+import queue
 import shutil
-import subprocess
-import tempfile
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from moviepy.editor import VideoFileClip
-from PIL import Image, ImageOps
-from tqdm import tqdm
+from options import DITHER_METHODS, PALETTES, RESAMPLE_PRESETS, TONE_MODES
+from video_processor import ProcessingCancelled, process_video
+
+# Milliseconds between checks of the worker's event queue
+POLL_INTERVAL = 100
 
 class VideoProcessorApp:
     def __init__(self, master):
         self.master = master
         master.title("E-Paper Video Processor")
-        master.geometry("500x600")
-        
+        master.geometry("500x780")
+
+        # Jobs waiting for the worker, and events coming back from it
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.job_count = 0
+        # States of the jobs finished since the queue last ran empty
+        self.pending = 0
+        self.finished = []
+
         self.create_widgets()
 
+        self.worker = threading.Thread(target=self.run_jobs, daemon=True)
+        self.worker.start()
+        self.master.after(POLL_INTERVAL, self.poll_events)
+
     def create_widgets(self):
         # Input Video
         tk.Label(self.master, text="Input Video:").pack(pady=(10,0))
         self.input_video_path = tk.StringVar()
         input_frame = tk.Frame(self.master)
         input_frame.pack(pady=5)
-        
+
         tk.Entry(input_frame, textvariable=self.input_video_path, width=50).pack(side=tk.LEFT, padx=(0,5))
         tk.Button(input_frame, text="Browse", command=self.browse_input_video).pack(side=tk.LEFT)
 
@@ -32,7 +47,7 @@ class VideoProcessorApp:
         self.subtitle_path = tk.StringVar()
         subtitle_frame = tk.Frame(self.master)
         subtitle_frame.pack(pady=5)
-        
+
         tk.Entry(subtitle_frame, textvariable=self.subtitle_path, width=50).pack(side=tk.LEFT, padx=(0,5))
         tk.Button(subtitle_frame, text="Browse", command=self.browse_subtitle).pack(side=tk.LEFT)
 
@@ -55,97 +70,55 @@ class VideoProcessorApp:
         self.height = tk.IntVar(value=300)
         tk.Entry(config_frame, textvariable=self.height, width=10).grid(row=2, column=1, padx=5)
 
-        # Keep Intermediate Files
-        self.keep_intermediate = tk.BooleanVar(value=False)
-        tk.Checkbutton(self.master, text="Keep Intermediate Files", variable=self.keep_intermediate).pack(pady=5)
+        # Dithering method
+        tk.Label(config_frame, text="Dithering:").grid(row=3, column=0, padx=5)
+        self.dither = tk.StringVar(value="floyd-steinberg")
+        ttk.Combobox(config_frame, textvariable=self.dither, values=DITHER_METHODS,
+                     state="readonly", width=16).grid(row=3, column=1, padx=5)
+
+        # Tone mapping
+        tk.Label(config_frame, text="Contrast:").grid(row=4, column=0, padx=5)
+        self.tone = tk.StringVar(value="shot")
+        ttk.Combobox(config_frame, textvariable=self.tone, values=TONE_MODES,
+                     state="readonly", width=16).grid(row=4, column=1, padx=5)
+
+        # Output palette
+        tk.Label(config_frame, text="Palette:").grid(row=5, column=0, padx=5)
+        self.palette = tk.StringVar(value="mono")
+        ttk.Combobox(config_frame, textvariable=self.palette, values=PALETTES,
+                     state="readonly", width=16).grid(row=5, column=1, padx=5)
 
-        # Process Button
-        tk.Button(self.master, text="Process Video", command=self.process_video, width=20).pack(pady=10)
+        # Resampling preset
+        tk.Label(config_frame, text="Resampling:").grid(row=6, column=0, padx=5)
+        self.resample = tk.StringVar(value="balanced")
+        ttk.Combobox(config_frame, textvariable=self.resample, values=RESAMPLE_PRESETS,
+                     state="readonly", width=16).grid(row=6, column=1, padx=5)
+
+        # Crop to aspect ratio
+        self.crop = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.master, text="Crop to Frame Aspect Ratio", variable=self.crop).pack(pady=5)
+
+        # Queue and Cancel Buttons
+        button_frame = tk.Frame(self.master)
+        button_frame.pack(pady=10)
+        tk.Button(button_frame, text="Process Video", command=self.process_video, width=16).pack(side=tk.LEFT, padx=5)
+        self.cancel_button = tk.Button(button_frame, text="Cancel", command=self.cancel_job, width=10,
+                                       state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+        # Job Queue
+        tk.Label(self.master, text="Jobs:").pack()
+        self.job_list = tk.Listbox(self.master, width=60, height=6)
+        self.job_list.pack(pady=5)
 
         # Progress Bar
-        self.progress = ttk.Progressbar(self.master, orient="horizontal", length=400, mode="indeterminate")
+        self.progress = ttk.Progressbar(self.master, orient="horizontal", length=400, mode="determinate")
         self.progress.pack(pady=10)
 
         # Status Label
         self.status_label = tk.Label(self.master, text="", wraplength=400)
         self.status_label.pack(pady=10)
 
-    def check_ffmpeg(self):
-        """Verify FFmpeg is installed and available."""
-        if not shutil.which("ffmpeg"):
-            raise SystemExit("FFmpeg is not installed or not in system PATH.")
-
-    def resize_video(self, input_path, output_path, width=400, height=300):
-        """Resize video with automatic resource management."""
-        try:
-            with VideoFileClip(input_path) as clip:
-                resized_clip = clip.resize(newsize=(width, height))
-                resized_clip.write_videofile(
-                    output_path,
-                    codec='libx264',
-                    audio_codec='aac',
-                    logger=None
-                )
-            return output_path
-        except Exception as e:
-            print(f"Error resizing video: {e}")
-            return input_path
-
-    def hardcode_subtitles(self, video_path, subtitle_path, output_path):
-        """Hardcode subtitles with improved error handling."""
-        if not os.path.exists(subtitle_path):
-            print(f"Warning: Subtitle file not found: {subtitle_path}")
-            return video_path
-
-        command = [
-            "ffmpeg",
-            "-i", video_path,
-            "-vf", f"subtitles={subtitle_path}",
-            "-c:a", "copy",
-            output_path
-        ]
-
-        try:
-            subprocess.run(command, check=True, capture_output=True)
-            return output_path
-        except subprocess.CalledProcessError as e:
-            print(f"Error adding subtitles: {e.stderr.decode()}")
-            return video_path
-
-    def process_frame(self, frame, width=400, height=300):
-        """Process a single video frame for e-paper display."""
-        img = Image.fromarray(frame)
-        img = ImageOps.exif_transpose(img)
-        img = ImageOps.autocontrast(img, cutoff=2)
-        img = img.resize((width, height), Image.LANCZOS)
-        img = img.convert("1", dither=Image.FLOYDSTEINBERG)
-        return img
-
-    def extract_frames(self, video_path, output_folder, fps=1, width=400, height=300):
-        """Extract frames from video with progress tracking."""
-        if fps <= 0:
-            raise ValueError("FPS must be positive")
-        
-        os.makedirs(output_folder, exist_ok=True)
-        
-        with VideoFileClip(video_path) as clip:
-            duration = int(clip.duration)
-            frame_count = 0
-            
-            with tqdm(total=duration // fps, desc="Processing Frames") as pbar:
-                for second in range(0, duration, max(1, int(1/fps))):
-                    try:
-                        frame = clip.get_frame(second)
-                        img = self.process_frame(frame, width, height)
-                        
-                        output_path = os.path.join(output_folder, f"frame_{frame_count:04d}.bmp")
-                        img.save(output_path, format="BMP")
-                        
-                        frame_count += 1
-                        pbar.update(1)
-                    except Exception as e:
-                        print(f"Error processing frame at {second}s: {e}")
-
     def browse_input_video(self):
         filename = filedialog.askopenfilename(filetypes=[("Video Files", "*.mp4 *.avi *.mov *.mkv")])
         self.input_video_path.set(filename)
@@ -155,61 +128,124 @@ class VideoProcessorApp:
         self.subtitle_path.set(filename)
 
     def process_video(self):
+        """Queue a job with the current settings; the worker thread runs it."""
         input_video = self.input_video_path.get()
-        subtitle = self.subtitle_path.get() or None
-        
+
         if not input_video:
             messagebox.showerror("Error", "Please select an input video")
             return
+        if not shutil.which("ffmpeg"):
+            messagebox.showerror("Error", "FFmpeg is not installed or not in system PATH.")
+            return
+
+        try:
+            # Tk variables may only be read here on the main thread
+            job = {
+                "index": self.job_count,
+                "input_video": input_video,
+                # Generate output prefix from input video name
+                "output_prefix": os.path.splitext(os.path.basename(input_video))[0],
+                "subtitle_file": self.subtitle_path.get() or None,
+                "fps": self.fps.get(),
+                "width": self.width.get(),
+                "height": self.height.get(),
+                "crop": self.crop.get(),
+                "dither": self.dither.get(),
+                "tone": self.tone.get(),
+                "palette": self.palette.get(),
+                "resample": self.resample.get()
+            }
+        except tk.TclError as e:
+            messagebox.showerror("Error", f"Invalid setting: {e}")
+            return
 
-        # Generate output prefix from input video name
-        output_prefix = os.path.splitext(os.path.basename(input_video))[0]
+        self.job_count += 1
+        self.pending += 1
+        self.job_list.insert(tk.END, f"Queued: {os.path.basename(input_video)}")
+        self.jobs.put(job)
 
-        # Start progress
-        self.progress.start()
-        self.status_label.config(text="Processing video...")
-        self.master.update_idletasks()
+    def cancel_job(self):
+        """Ask the running job to stop after its current frame."""
+        self.cancel_event.set()
+        self.status_label.config(text="Cancelling...")
 
+    def run_jobs(self):
+        """Worker thread: run queued jobs one after another."""
+        while True:
+            job = self.jobs.get()
+            self.cancel_event.clear()
+            self.events.put(("started", job["index"], None))
+            started = time.monotonic()
+
+            def report(done, total):
+                self.events.put(("progress", job["index"], (done, total, time.monotonic() - started)))
+
+            try:
+                process_video(job["input_video"], job["output_prefix"], subtitle_file=job["subtitle_file"],
+                              fps=job["fps"], width=job["width"], height=job["height"], crop=job["crop"],
+                              dither=job["dither"], tone=job["tone"], palette=job["palette"],
+                              resample=job["resample"], progress=report,
+                              cancel=self.cancel_event)
+                self.events.put(("done", job["index"], None))
+            except ProcessingCancelled:
+                self.events.put(("cancelled", job["index"], None))
+            except Exception as e:
+                self.events.put(("failed", job["index"], str(e)))
+
+    def poll_events(self):
+        """Apply events from the worker to the widgets, then poll again."""
         try:
-            # Check FFmpeg
-            self.check_ffmpeg()
-            
-            # Create temporary directory for intermediate files
-            with tempfile.TemporaryDirectory() as tmpdir:
-                # Resize video
-                resized_video = os.path.join(tmpdir, "resized.mp4")
-                resized_video = self.resize_video(input_video, resized_video, self.width.get(), self.height.get())
-                
-                # Add subtitles if available
-                video_with_subtitles = resized_video
-                if subtitle:
-                    video_with_subtitles = os.path.join(tmpdir, "subtitled.mp4")
-                    video_with_subtitles = self.hardcode_subtitles(resized_video, subtitle, video_with_subtitles)
-                
-                # Extract frames
-                output_frames_folder = f"{output_prefix}_frames"
-                self.extract_frames(video_with_subtitles, output_frames_folder, 
-                                    self.fps.get(), self.width.get(), self.height.get())
-                
-                # Optional: Copy intermediate files if requested
-                if self.keep_intermediate.get():
-                    intermediate_dir = f"{output_prefix}_intermediate"
-                    os.makedirs(intermediate_dir, exist_ok=True)
-                    if resized_video != input_video:
-                        shutil.copy(resized_video, os.path.join(intermediate_dir, "resized.mp4"))
-                    if video_with_subtitles != resized_video:
-                        shutil.copy(video_with_subtitles, os.path.join(intermediate_dir, "subtitled.mp4"))
-            
-            # Stop progress and show success
+            while True:
+                self.handle_event(*self.events.get_nowait())
+        except queue.Empty:
+            pass
+        self.master.after(POLL_INTERVAL, self.poll_events)
+
+    def handle_event(self, kind, index, data):
+        name = self.job_list.get(index).split(": ", 1)[1]
+        if kind == "started":
+            self.set_job_state(index, "Running", name)
+            self.cancel_button.config(state=tk.NORMAL)
+            self.progress.config(mode="indeterminate", value=0)
+            self.progress.start()
+            self.status_label.config(text=f"Processing {name}...")
+        elif kind == "progress":
+            done, total, elapsed = data
+            rate = done / elapsed if elapsed else 0
+            if total:
+                self.progress.stop()
+                self.progress.config(mode="determinate", maximum=total, value=min(done, total))
+                remaining = max(total - done, 0) / rate if rate else 0
+                eta = time.strftime("%H:%M:%S", time.gmtime(remaining))
+                self.status_label.config(text=f"{name}: {done}/{total} frames, {rate:.1f} frames/s, ETA {eta}")
+            else:
+                self.status_label.config(text=f"{name}: {done} frames, {rate:.1f} frames/s")
+        else:
+            state = {"done": "Done", "cancelled": "Cancelled", "failed": "Failed"}[kind]
+            self.set_job_state(index, state, name)
             self.progress.stop()
+            self.progress.config(mode="determinate", value=0)
+            self.cancel_button.config(state=tk.DISABLED)
+            self.pending -= 1
+            self.finished.append(state)
+            if kind == "failed":
+                self.status_label.config(text=f"{name}: processing failed.")
+                messagebox.showerror("Error", f"{name}: {data}")
+            else:
+                self.status_label.config(text=f"{name}: {state.lower()}.")
+            if self.pending == 0:
+                self.show_summary()
+
+    def set_job_state(self, index, state, name):
+        self.job_list.delete(index)
+        self.job_list.insert(index, f"{state}: {name}")
+
+    def show_summary(self):
+        """Report once every queued job has finished."""
+        if all(state == "Done" for state in self.finished):
             self.status_label.config(text="Video processed successfully!")
             messagebox.showinfo("Success", "Video processing completed.")
-        
-        except Exception as e:
-            # Stop progress and show error
-            self.progress.stop()
-            self.status_label.config(text="Processing failed.")
-            messagebox.showerror("Error", str(e))
+        self.finished = []
 
 def main():
     root = tk.Tk()
@@ -217,4 +253,4 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
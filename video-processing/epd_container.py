@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Packed 1bpp frame container for the e-paper firmware.
+
+Instead of one BMP per frame, which the firmware has to find by name
+through FAT and then parse, all frames go into a single file:
+
+    offset  size  field
+    0       4     magic "SIMF"
+    4       2     version
+    6       2     header size (32)
+    8       2     width in pixels
+    10      2     height in pixels
+    12      4     frame count
+    16      4     plane size in bytes
+    20      4     offset of the first plane
+    24      8     reserved, zero
+    32      4*N   offset table, one uint32 per frame
+    ...           planes
+
+All integers are little-endian, as on the AVR. Each plane is the frame in
+panel RAM order: rows top to bottom, eight pixels per byte with the
+leftmost pixel in the most significant bit, 1 = white. A 400x300 plane is
+15,000 bytes, and frame ``i`` is reached by reading table entry ``i`` at
+``32 + 4 * i`` and seeking once to the plane.
+"""
+import argparse
+import os
+import shutil
+import struct
+import sys
+
+import numpy as np
+from PIL import Image
+
+MAGIC = b"SIMF"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHIII8x")
+OFFSET = struct.Struct("<I")
+
+
+def plane_size(width, height):
+    """
+    Size of one packed frame.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+
+    Returns:
+        int: Bytes per plane
+    """
+    return (width + 7) // 8 * height
+
+
+def pack_image(img):
+    """
+    Pack an image into panel RAM order.
+
+    Args:
+        img (PIL.Image): Frame; converted to 1 bit without dithering if needed
+
+    Returns:
+        bytes: Packed plane
+    """
+    if img.mode != "1":
+        img = img.convert("1", dither=Image.NONE)
+    # Pillow packs mode "1" rows top-down, MSB first, with 1 = white
+    return img.tobytes()
+
+
+def unpack_plane(plane, width, height):
+    """
+    Unpack a plane into an image.
+
+    Args:
+        plane (bytes): Packed plane
+        width (int): Frame width
+        height (int): Frame height
+
+    Returns:
+        PIL.Image: Mode "1" image
+    """
+    return Image.frombytes("1", (width, height), bytes(plane))
+
+
+class ContainerWriter:
+    """
+    Stream frames into a container file.
+
+    The frame count is only known at the end, so planes are spooled to a
+    side file and the container is assembled with sequential writes when
+    the writer is closed.
+
+    Args:
+        path (str): Container path
+        width (int): Frame width
+        height (int): Frame height
+    """
+
+    def __init__(self, path, width=400, height=300):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.plane_size = plane_size(width, height)
+        self.count = 0
+        self._spool_path = path + ".planes"
+        # Planes may also be written here directly, such as by an OutputSink
+        self.spool = open(self._spool_path, "wb")
+
+    def add(self, img):
+        """
+        Append a frame.
+
+        Args:
+            img (PIL.Image): Frame of the container's size
+
+        Returns:
+            int: Index of the frame in the container
+        """
+        if img.size != (self.width, self.height):
+            raise ValueError(f"Frame is {img.size[0]}x{img.size[1]}, container is {self.width}x{self.height}")
+        self.spool.write(pack_image(img))
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        """Write the header and offset table, then the planes."""
+        self.count = self.spool.tell() // self.plane_size
+        self.spool.close()
+        data_offset = HEADER.size + OFFSET.size * self.count
+        with open(self.path, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, HEADER.size, self.width, self.height,
+                                  self.count, self.plane_size, data_offset))
+            offsets = data_offset + self.plane_size * np.arange(self.count, dtype="<u4")
+            out.write(offsets.astype("<u4").tobytes())
+            with open(self._spool_path, "rb") as spool:
+                shutil.copyfileobj(spool, out, 1024 * 1024)
+        os.remove(self._spool_path)
+
+    def abort(self):
+        """Discard everything written so far."""
+        self.spool.close()
+        if os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ContainerReader:
+    """
+    Read frames from a container file.
+
+    Args:
+        path (str): Container path
+
+    Raises:
+        ValueError: If the header is not a valid container header
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError("File is too short for a container header")
+            (magic, self.version, self.header_size, self.width, self.height,
+             self.count, self.plane_size, self.data_offset) = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError("Not a frame container (bad magic)")
+            if self.version != VERSION:
+                raise ValueError(f"Unsupported container version {self.version}")
+            f.seek(self.header_size)
+            table = f.read(OFFSET.size * self.count)
+        if len(table) != OFFSET.size * self.count:
+            raise ValueError("Offset table is truncated")
+        self.offsets = np.frombuffer(table, dtype="<u4")
+
+    def read_plane(self, index):
+        """
+        Read one packed plane with a single seek.
+
+        Args:
+            index (int): Frame index
+
+        Returns:
+            bytes: Packed plane
+        """
+        with open(self.path, "rb") as f:
+            f.seek(int(self.offsets[index]))
+            return f.read(self.plane_size)
+
+    def read_image(self, index):
+        """
+        Read one frame as an image.
+
+        Args:
+            index (int): Frame index
+
+        Returns:
+            PIL.Image: Mode "1" image
+        """
+        return unpack_plane(self.read_plane(index), self.width, self.height)
+
+    def verify(self, frames_dir=None):
+        """
+        Check the container's structure and optionally its contents.
+
+        Args:
+            frames_dir (str, optional): Folder of ``frame_XXXX.bmp`` files the
+                container should match frame for frame
+
+        Returns:
+            list: Problems found; empty if the container is valid
+        """
+        problems = []
+        if self.plane_size != plane_size(self.width, self.height):
+            problems.append(f"Plane size {self.plane_size} does not match {self.width}x{self.height}")
+        if self.data_offset < self.header_size + OFFSET.size * self.count:
+            problems.append("First plane overlaps the offset table")
+        for index, offset in enumerate(self.offsets):
+            if offset < self.data_offset or offset + self.plane_size > self.file_size:
+                problems.append(f"Frame {index} lies outside the file")
+            elif index and offset < self.offsets[index - 1] + self.plane_size:
+                problems.append(f"Frame {index} overlaps frame {index - 1}")
+
+        if frames_dir is not None and not problems:
+            names = sorted(name for name in os.listdir(frames_dir) if name.endswith(".bmp"))
+            if len(names) != self.count:
+                problems.append(f"Container has {self.count} frames, {frames_dir} has {len(names)}")
+            for index, name in enumerate(names[:self.count]):
+                with Image.open(os.path.join(frames_dir, name)) as img:
+                    if pack_image(img) != self.read_plane(index):
+                        problems.append(f"Frame {index} differs from {name}")
+        return problems
+
+
+def pack_folder(frames_dir, path):
+    """
+    Pack a folder of BMP frames into a container.
+
+    Args:
+        frames_dir (str): Folder of ``frame_XXXX.bmp`` files
+        path (str): Container path
+
+    Returns:
+        int: Number of frames packed
+    """
+    names = sorted(name for name in os.listdir(frames_dir) if name.endswith(".bmp"))
+    if not names:
+        raise ValueError(f"No BMP frames found in {frames_dir}")
+    with Image.open(os.path.join(frames_dir, names[0])) as first:
+        width, height = first.size
+    with ContainerWriter(path, width, height) as writer:
+        for name in names:
+            with Image.open(os.path.join(frames_dir, name)) as img:
+                writer.add(img)
+    return len(names)
+
+
+def main():
+    """Command-line interface for packing and verifying containers."""
+    parser = argparse.ArgumentParser(description="Pack and verify e-paper frame containers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Pack a folder of BMP frames into a container")
+    pack_parser.add_argument("frames_dir", help="Folder of frame_XXXX.bmp files")
+    pack_parser.add_argument("container", help="Container file to write")
+
+    verify_parser = subparsers.add_parser("verify", help="Verify a container")
+    verify_parser.add_argument("container", help="Container file to check")
+    verify_parser.add_argument("--frames", help="BMP folder the container should match")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "pack":
+            count = pack_folder(args.frames_dir, args.container)
+            print(f"Packed {count} frames into {args.container}")
+        else:
+            reader = ContainerReader(args.container)
+            problems = reader.verify(args.frames)
+            for problem in problems:
+                print(f"Error: {problem}")
+            if problems:
+                sys.exit(1)
+            print(f"{args.container}: {reader.count} frames of {reader.width}x{reader.height}, OK")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
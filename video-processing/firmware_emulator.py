@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Host-side emulator of the e-paper firmware display path.
+
+Replays what new-code/still-in-motion.ino does on every wake against a
+generated frame folder or packed container, without flashing a card:
+
+- ``getNextFileHandle``: builds the name with ``PictureIndex::getBmpFilename``
+  (which emits the hundreds, tens and units digits before the thousands
+  digit), opens it, and wraps to index 0 when the file is missing
+- ``ReadBMP::parseHeader``: reads the packed 50-byte ``BmpHeader`` and only
+  accepts 4 and 8 bits per pixel
+- ``ReadBMP::readQuarterLine`` and ``sendQuarterRow``: 1,200 quarter-line
+  reads and the bytes they push through ``Epd::SendData``
+
+For every wake it reports whether the frame decodes, the bytes read from
+the SD card and sent over SPI, and an estimated wake time and charge, then
+summarises the run against the 10 s / 40 mA budget in the top-level README.
+"""
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+
+import numpy as np
+from PIL import Image
+
+from epd_container import HEADER as CONTAINER_HEADER, OFFSET as CONTAINER_OFFSET, ContainerReader
+from options import MAX_PICTURE_INDEX
+
+# Firmware constants (epd_adapter.h, picture_index.h, still-in-motion.ino)
+EPD_WIDTH = 400
+EPD_HEIGHT = 300
+EPD_WHITE = 0x1
+SECONDS_TO_DISPLAY = 10
+NUMBER_OF_SLEEP_LOOPS = (10 * 60 - SECONDS_TO_DISPLAY) // 8
+SLEEP_LOOP_SECONDS = 8
+
+# struct BmpHeader as laid out by avr-gcc, which does not pad
+BMP_HEADER = struct.Struct("<HIHHIIIIHHIIIII")
+BMP_HEADER_FIELD_WIN = 0x4D42
+
+# Timing and power model. Clock rates follow the firmware's SPI settings on
+# a 16 MHz ATmega328; refresh times and currents are estimates to tune
+# against measurements.
+DEFAULT_MODEL = {
+    "sd_clock_hz": 16e6 / 8,            # SD.begin(SPI_QUARTER_SPEED)
+    "sd_block_overhead_s": 0.0012,      # command, token wait and CRC per 512-byte block
+    "sd_call_overhead_s": 0.00002,      # File::read bookkeeping per call
+    "sd_open_overhead_s": 0.01,         # SD.begin, FAT and root directory setup
+    "sd_dir_entry_s": 0.00002,          # scanning one 32-byte directory entry
+    "epd_clock_hz": 8e6,                # SPISettings(8000000, ...)
+    "epd_byte_overhead_s": 0.000004,    # SendData call and GxEPD2 drawPixel
+    "epd_transaction_s": 0.000005,      # begin/endSpiTransaction per quarter row
+    "epd_init_s": 0.3,
+    "epd_clear_s": 3.0,                 # full refresh to white
+    "epd_refresh_s": 3.0,               # TurnOnDisplay full refresh
+    "post_display_delay_s": 3.0,        # delay(3000)
+    "power_up_s": 0.002,
+    "awake_ma": 40.0,
+    "sleep_ma": 0.01,
+    "battery_mah": 1200.0,
+    "usable_fraction": 0.5
+}
+
+
+def get_bmp_filename(picture_index):
+    """
+    Reproduce ``PictureIndex::getBmpFilename``.
+
+    Args:
+        picture_index (int): Picture index
+
+    Returns:
+        str: File name the firmware will open
+    """
+    digits = [
+        (picture_index // 100) % 10,
+        (picture_index // 10) % 10,
+        picture_index % 10,
+        picture_index // 1000
+    ]
+    return "frame_" + "".join(str(digit) for digit in digits) + ".bmp"
+
+
+def is_8_3_name(name):
+    """
+    Check whether a name is a valid FAT 8.3 short name.
+
+    Args:
+        name (str): File name
+
+    Returns:
+        bool: True if the base is at most 8 and the extension at most 3 characters
+    """
+    return re.fullmatch(r"[^.]{1,8}(\.[^.]{1,3})?", name) is not None
+
+
+def in_range(index):
+    """Reproduce ``PictureIndex::inRange``."""
+    return 0 if index > MAX_PICTURE_INDEX or index < 0 else index
+
+
+class SdCard:
+    """
+    Emulated SD card holding the files of a frame folder.
+
+    Counts the bytes and blocks the firmware reads, and the directory
+    entries scanned by name lookups.
+
+    Args:
+        directory (str): Folder standing in for the card's root directory
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self, directory):
+        self.directory = directory
+        # FAT lookups are case-insensitive and scan entries in creation order
+        self.entries = sorted(os.listdir(directory))
+        self.lookup = {name.lower(): position for position, name in enumerate(self.entries)}
+        self.reset_counters()
+
+    def reset_counters(self):
+        """Start counting a new wake."""
+        self.bytes_read = 0
+        self.read_calls = 0
+        self.blocks = set()
+        self.dir_entries_scanned = 0
+
+    def open(self, name):
+        """
+        Look a file up by name.
+
+        Args:
+            name (str): File name
+
+        Returns:
+            EmulatedFile: Open file, or None if it does not exist
+        """
+        position = self.lookup.get(name.lower())
+        # A failed lookup scans the whole directory. Long names take an
+        # extra LFN entry per 13 characters on top of the short entry.
+        scanned = self.entries if position is None else self.entries[:position + 1]
+        self.dir_entries_scanned += sum(1 + (0 if is_8_3_name(entry) else -(-len(entry) // 13))
+                                        for entry in scanned)
+        if position is None:
+            return None
+        with open(os.path.join(self.directory, self.entries[position]), "rb") as f:
+            return EmulatedFile(self, self.entries[position], f.read())
+
+
+class EmulatedFile:
+    """
+    Open file on the emulated card.
+
+    Args:
+        card (SdCard): Card the file lives on
+        name (str): File name
+        data (bytes): File contents
+    """
+
+    def __init__(self, card, name, data):
+        self.card = card
+        self.name = name
+        self.data = data
+        self.position = 0
+
+    def read(self, size):
+        """Read up to ``size`` bytes, counting them against the card."""
+        chunk = self.data[self.position:self.position + size]
+        if chunk:
+            first = self.position // SdCard.BLOCK_SIZE
+            last = (self.position + len(chunk) - 1) // SdCard.BLOCK_SIZE
+            self.card.blocks.update((self.name, block) for block in range(first, last + 1))
+        self.position += len(chunk)
+        self.card.bytes_read += len(chunk)
+        self.card.read_calls += 1
+        return chunk
+
+    def seek(self, position):
+        """Seek like ``File::seek``, failing past the end of the file."""
+        if position > len(self.data):
+            return False
+        self.position = position
+        return True
+
+
+class EmulatedPanel:
+    """
+    Emulated ``Epd`` adapter: every ``SendData`` byte draws one pixel.
+
+    Reproduces the GxEPD2 adapter in epd_adapter.h, where 0x00 is black,
+    anything else is white and the cursor wraps after ``EPD_WIDTH`` pixels.
+    """
+
+    def __init__(self):
+        self.pixels = np.full((EPD_HEIGHT, EPD_WIDTH), 255, dtype=np.uint8)
+        self.cursor = 0
+        self.bytes_sent = 0
+        self.transactions = 0
+
+    def send_data(self, data):
+        """
+        Send a run of ``SendData`` bytes.
+
+        Args:
+            data (numpy.ndarray): uint8 bytes
+        """
+        positions = self.cursor + np.arange(len(data))
+        visible = positions < EPD_WIDTH * EPD_HEIGHT
+        self.pixels.reshape(-1)[positions[visible]] = np.where(data[visible] == 0x00, 0, 255)
+        self.cursor += len(data)
+        self.bytes_sent += len(data)
+
+    def pixels_drawn(self):
+        """Number of panel pixels the frame actually reached."""
+        return min(self.cursor, EPD_WIDTH * EPD_HEIGHT)
+
+
+def parse_bmp_header(bmp_file):
+    """
+    Reproduce ``ReadBMP::parseHeader``.
+
+    Args:
+        bmp_file (EmulatedFile): Open BMP
+
+    Returns:
+        tuple: ``(header, error)`` where ``header`` is a dict and ``error``
+        is None on success
+    """
+    raw = bmp_file.read(BMP_HEADER.size)
+    if len(raw) != BMP_HEADER.size:
+        return None, "Failed to read bmp header"
+    fields = BMP_HEADER.unpack(raw)
+    header = {
+        "header_field": fields[0],
+        "offset": fields[4],
+        "width": fields[6],
+        "height": fields[7],
+        "bits_per_pixel": fields[9],
+        "compression": fields[10]
+    }
+    if header["header_field"] != BMP_HEADER_FIELD_WIN:
+        return header, "Header field not correct"
+    if header["bits_per_pixel"] not in (4, 8):
+        return header, f"Invalid number of bits per pixel ({header['bits_per_pixel']})"
+    if not bmp_file.seek(header["offset"]):
+        return header, "Failed to seek"
+    return header, None
+
+
+def read_quarter_line(bmp_file, header):
+    """
+    Reproduce ``ReadBMP::readQuarterLine``.
+
+    Args:
+        bmp_file (EmulatedFile): BMP positioned at the pixel data
+        header (dict): Parsed header
+
+    Returns:
+        numpy.ndarray: The 50 bytes ``sendQuarterRow`` will look at, or None
+        if the read came up short
+    """
+    size = (header["width"] // 4) * header["bits_per_pixel"] // 8
+    data = bmp_file.read(size)
+    if len(data) != size:
+        return None
+    buffer = np.frombuffer(data, dtype=np.uint8).copy()
+    if header["bits_per_pixel"] == 8:
+        buffer[:size // 2] = (buffer[0::2] << 4) | buffer[1::2]
+    return buffer[:EPD_WIDTH // 8]
+
+
+def send_quarter_row(panel, buffer):
+    """
+    Reproduce ``sendQuarterRow``: one ``SendData`` per buffer byte, white
+    only if the byte equals ``EPD_WHITE``.
+    """
+    panel.send_data(np.where(buffer == EPD_WHITE, 0xFF, 0x00).astype(np.uint8))
+    panel.transactions += 1
+
+
+class FirmwareEmulator:
+    """
+    Wake-by-wake emulation of the display path with a cost model.
+
+    Args:
+        source (str): Frame folder or packed container
+        model (dict, optional): Overrides for ``DEFAULT_MODEL``
+        picture_index (int): Picture index stored in EEPROM at power-on
+    """
+
+    def __init__(self, source, model=None, picture_index=0):
+        self.model = dict(DEFAULT_MODEL, **(model or {}))
+        self.picture_index = in_range(picture_index)
+        self.container = None
+        self.card = None
+        if os.path.isdir(source):
+            self.card = SdCard(source)
+        else:
+            self.container = ContainerReader(source)
+
+    def wake(self):
+        """
+        Emulate one wake: pick the next frame and display it.
+
+        Returns:
+            dict: Report for this wake
+        """
+        if self.container is not None:
+            report = self._display_container()
+        else:
+            report = self._display_bmp()
+        report["wake_s"] = self._wake_seconds(report)
+        report["mah"] = report["wake_s"] * self.model["awake_ma"] / 3600
+        return report
+
+    def _display_bmp(self):
+        card = self.card
+        card.reset_counters()
+        panel = EmulatedPanel()
+        report = {"picture_index": self.picture_index, "warnings": []}
+
+        # getNextFileHandle
+        name = get_bmp_filename(self.picture_index)
+        bmp_file = card.open(name)
+        if bmp_file is None and self.picture_index != 0:
+            self.picture_index = 0
+            name = get_bmp_filename(self.picture_index)
+            bmp_file = card.open(name)
+            report["warnings"].append("Wrapped to picture index 0")
+        report["file"] = name
+        if bmp_file is None:
+            return self._finish(report, panel, "Failed to open any bmp file")
+        self.picture_index = in_range(self.picture_index + 1)
+        if not is_8_3_name(name):
+            report["warnings"].append("Not an 8.3 name; the Arduino SD library cannot open it")
+
+        # displayImage
+        header, error = parse_bmp_header(bmp_file)
+        if error is None and (header["width"] != EPD_WIDTH or header["height"] != EPD_HEIGHT):
+            error = f"Invalid image size {header['width']}x{header['height']}"
+        if error is not None:
+            return self._finish(report, panel, error)
+        if header["compression"] != 0:
+            report["warnings"].append("Compressed BMP; pixel data will be misread")
+        report["warnings"].append("Rows are stored bottom-up; the image is shown upside down")
+
+        for _ in range(EPD_HEIGHT * 4):
+            buffer = read_quarter_line(bmp_file, header)
+            if buffer is None:
+                return self._finish(report, panel, "Failed to read bmp line")
+            send_quarter_row(panel, buffer)
+        if panel.pixels_drawn() < EPD_WIDTH * EPD_HEIGHT:
+            report["warnings"].append(
+                f"Only {panel.pixels_drawn() // EPD_WIDTH} of {EPD_HEIGHT} rows reach the panel")
+        return self._finish(report, panel, None)
+
+    def _display_container(self):
+        reader = self.container
+        panel = EmulatedPanel()
+        index = self.picture_index if self.picture_index < reader.count else 0
+        report = {"picture_index": index, "file": f"{os.path.basename(reader.path)}:{index}", "warnings": []}
+        self.picture_index = in_range(index + 1)
+        if (reader.width, reader.height) != (EPD_WIDTH, EPD_HEIGHT):
+            return self._finish(report, panel, f"Invalid image size {reader.width}x{reader.height}")
+
+        # Header and one offset-table entry, then one seek to the plane
+        plane = np.frombuffer(reader.read_plane(index), dtype=np.uint8)
+        panel.pixels = np.unpackbits(plane).reshape(EPD_HEIGHT, EPD_WIDTH) * 255
+        panel.cursor = EPD_WIDTH * EPD_HEIGHT
+        panel.bytes_sent = len(plane)
+        panel.transactions = EPD_HEIGHT
+        report["sd_bytes"] = CONTAINER_HEADER.size + CONTAINER_OFFSET.size + len(plane)
+        report["sd_read_calls"] = 3
+        report["sd_blocks"] = 2 + -(-len(plane) // SdCard.BLOCK_SIZE)
+        report["dir_entries_scanned"] = 0
+        return self._finish(report, panel, None)
+
+    def _finish(self, report, panel, error):
+        if self.card is not None:
+            report["sd_bytes"] = self.card.bytes_read
+            report["sd_read_calls"] = self.card.read_calls
+            report["sd_blocks"] = len(self.card.blocks)
+            report["dir_entries_scanned"] = self.card.dir_entries_scanned
+        report["decoded"] = error is None
+        report["error"] = error
+        report["spi_bytes"] = panel.bytes_sent
+        report["spi_transactions"] = panel.transactions
+        report["pixels_drawn"] = panel.pixels_drawn()
+        self.last_panel = panel
+        return report
+
+    def _wake_seconds(self, report):
+        model = self.model
+        sd_s = (report["sd_bytes"] * 8 / model["sd_clock_hz"]
+                + report["sd_blocks"] * model["sd_block_overhead_s"]
+                + report["sd_read_calls"] * model["sd_call_overhead_s"]
+                + report["dir_entries_scanned"] * model["sd_dir_entry_s"]
+                + model["sd_open_overhead_s"])
+        spi_s = (report["spi_bytes"] * (8 / model["epd_clock_hz"] + model["epd_byte_overhead_s"])
+                 + report["spi_transactions"] * model["epd_transaction_s"])
+        refresh_s = model["epd_refresh_s"] + model["post_display_delay_s"] if report["decoded"] else 0
+        report["sd_s"] = sd_s
+        report["spi_s"] = spi_s
+        return model["power_up_s"] + model["epd_init_s"] + model["epd_clear_s"] + sd_s + spi_s + refresh_s
+
+
+def summarize(reports, model):
+    """
+    Summarise a run of wakes against the power budget.
+
+    Args:
+        reports (list): Per-wake reports
+        model (dict): Timing and power model
+
+    Returns:
+        dict: Run summary
+    """
+    wake = np.array([report["wake_s"] for report in reports])
+    mah = np.array([report["mah"] for report in reports])
+    cycle_s = NUMBER_OF_SLEEP_LOOPS * SLEEP_LOOP_SECONDS
+    sleep_mah = cycle_s * model["sleep_ma"] / 3600
+    cycles = model["battery_mah"] * model["usable_fraction"] / (mah.mean() + sleep_mah)
+    return {
+        "wakes": len(reports),
+        "decoded": sum(report["decoded"] for report in reports),
+        "failed": sum(not report["decoded"] for report in reports),
+        "distinct_files": len({report["file"] for report in reports if report["decoded"]}),
+        "sd_bytes": int(sum(report["sd_bytes"] for report in reports)),
+        "spi_bytes": int(sum(report["spi_bytes"] for report in reports)),
+        "wake_s_min": float(wake.min()),
+        "wake_s_mean": float(wake.mean()),
+        "wake_s_max": float(wake.max()),
+        "over_budget": int((wake > SECONDS_TO_DISPLAY).sum()),
+        "mah_per_wake": float(mah.mean()),
+        "mah_total": float(mah.sum()),
+        "battery_cycles": float(cycles),
+        "battery_days": float(cycles * (cycle_s + wake.mean()) / 86400)
+    }
+
+
+def run(source, wakes=None, model=None, picture_index=0, render_dir=None):
+    """
+    Emulate a sequence of wakes.
+
+    Args:
+        source (str): Frame folder or packed container
+        wakes (int, optional): Number of wakes; defaults to one per frame
+        model (dict, optional): Overrides for ``DEFAULT_MODEL``
+        picture_index (int): Picture index stored in EEPROM at power-on
+        render_dir (str, optional): Save what the panel shows after each wake here
+
+    Returns:
+        tuple: ``(reports, summary)``
+    """
+    emulator = FirmwareEmulator(source, model, picture_index)
+    if wakes is None:
+        if emulator.container is not None:
+            wakes = emulator.container.count
+        else:
+            wakes = sum(1 for name in emulator.card.entries if name.lower().endswith(".bmp"))
+    if render_dir:
+        os.makedirs(render_dir, exist_ok=True)
+
+    reports = []
+    for wake in range(max(wakes, 1)):
+        report = emulator.wake()
+        report["wake"] = wake
+        reports.append(report)
+        if render_dir:
+            Image.fromarray(emulator.last_panel.pixels).save(os.path.join(render_dir, f"wake_{wake:04d}.png"))
+    return reports, summarize(reports, emulator.model)
+
+
+def print_report(reports, summary, verbose=False):
+    """Print per-wake results and the run summary."""
+    if verbose:
+        print(f"{'wake':>5} {'file':<22} {'ok':<3} {'SD bytes':>9} {'SPI bytes':>9} {'wake s':>7} {'mAh':>7}")
+        for report in reports:
+            print(f"{report['wake']:>5} {report['file']:<22} {'yes' if report['decoded'] else 'no':<3} "
+                  f"{report['sd_bytes']:>9} {report['spi_bytes']:>9} {report['wake_s']:>7.2f} {report['mah']:>7.4f}")
+
+    errors = {}
+    warnings = {}
+    for report in reports:
+        if report["error"]:
+            errors[report["error"]] = errors.get(report["error"], 0) + 1
+        for warning in report["warnings"]:
+            warnings[warning] = warnings.get(warning, 0) + 1
+
+    print(f"Wakes:              {summary['wakes']} ({summary['decoded']} decoded, {summary['failed']} failed)")
+    print(f"Distinct frames:    {summary['distinct_files']}")
+    print(f"SD bytes read:      {summary['sd_bytes']:,}")
+    print(f"SPI bytes sent:     {summary['spi_bytes']:,}")
+    print(f"Wake time (s):      min {summary['wake_s_min']:.2f}  mean {summary['wake_s_mean']:.2f}  "
+          f"max {summary['wake_s_max']:.2f}  budget {SECONDS_TO_DISPLAY}")
+    print(f"Over budget:        {summary['over_budget']}")
+    print(f"Charge per wake:    {summary['mah_per_wake']:.4f} mAh")
+    print(f"Battery estimate:   {summary['battery_cycles']:.0f} wakes, {summary['battery_days']:.0f} days")
+    for message, count in sorted(errors.items()):
+        print(f"Error ({count}x): {message}")
+    for message, count in sorted(warnings.items()):
+        print(f"Warning ({count}x): {message}")
+
+
+def main():
+    """Command-line interface for the firmware emulator."""
+    parser = argparse.ArgumentParser(description="Emulate the e-paper firmware against generated frames")
+    parser.add_argument("source", help="Frame folder or packed .simf container")
+    parser.add_argument("--wakes", type=int, help="Number of wakes to emulate (default: one per frame)")
+    parser.add_argument("--start-index", type=int, default=0, help="Picture index stored in EEPROM (default: 0)")
+    parser.add_argument("--model", help="JSON file overriding timing and power model values")
+    parser.add_argument("--render", metavar="DIR", help="Save what the panel shows after each wake")
+    parser.add_argument("--json", metavar="PATH", help="Write per-wake reports and the summary as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Print a line per wake")
+
+    args = parser.parse_args()
+
+    try:
+        model = None
+        if args.model:
+            with open(args.model) as f:
+                model = json.load(f)
+        reports, summary = run(args.source, args.wakes, model, args.start_index, args.render)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_report(reports, summary, args.verbose)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "wakes": reports}, f, indent=2)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
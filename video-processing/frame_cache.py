@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of decoded, downscaled grayscale frames.
+
+Each entry holds every frame on one sampling grid as a flat uint8 file
+that is memory-mapped on reuse, so reruns that only change contrast or
+dithering read frames zero-copy instead of decoding the film again.
+Entries are keyed by the source fingerprint, the sampling rate and the
+scale/crop/subtitle settings, and evicted least-recently-used once the
+cache grows past its size cap.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from dither import luma
+from options import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+
+
+class FrameCache:
+    """
+    Directory of memory-mapped frame stacks with LRU eviction.
+
+    Args:
+        directory (str): Cache directory
+        max_bytes (int): Size cap across all cached films
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source_fingerprint, rate, width, height, crop, subtitle_fingerprint=None, resample="balanced", luma=False):
+        """
+        Build the cache key for one sampling configuration.
+
+        Args:
+            source_fingerprint (str): Fingerprint of the source video
+            rate (Fraction): Sampling rate
+            width (int): Frame width
+            height (int): Frame height
+            crop (bool): Whether frames were cropped to the aspect ratio
+            subtitle_fingerprint (str, optional): Fingerprint of burned-in subtitles
+            resample (str): Resampling preset of the scaler
+            luma (bool): Whether FFmpeg decoded luma rather than RGB that
+                was converted to luma here
+
+        Returns:
+            str: Hex key
+        """
+        settings = {
+            "source": source_fingerprint,
+            "fps": str(rate),
+            "width": width,
+            "height": height,
+            "crop": crop,
+            "subtitle": subtitle_fingerprint,
+            "resample": resample,
+            "luma": luma
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:32]
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".u8", base + ".json"
+
+    def get(self, key):
+        """
+        Open a cached frame stack.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            numpy.memmap: Read-only ``(N, H, W)`` frames, or None on a miss
+        """
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(data_path):
+            return None
+
+        meta["last_used"] = time.time()
+        self._write_meta(meta_path, meta)
+        shape = (meta["count"], meta["height"], meta["width"])
+        if shape[0] == 0:
+            return np.empty(shape, dtype=np.uint8)
+        return np.memmap(data_path, dtype=np.uint8, mode="r", shape=shape)
+
+    def iter_cached(self, frames, rate, start_frame=0):
+        """
+        Yield cached frames as ``(timestamp, frame)`` pairs.
+
+        Args:
+            frames (numpy.ndarray): Frame stack from ``get``
+            rate (Fraction): Sampling rate the stack was built with
+            start_frame (int): Grid index to start from
+
+        Yields:
+            tuple: ``(timestamp, frame)`` with frames as zero-copy views
+        """
+        for index in range(start_frame, len(frames)):
+            yield float(index / rate), frames[index]
+
+    def store(self, key, frames):
+        """
+        Convert frames to grayscale and cache them while passing them on.
+
+        The entry is only published once the stream is exhausted, so an
+        interrupted decode never leaves a truncated entry behind.
+
+        Args:
+            key (str): Cache key
+            frames (iterable): ``(timestamp, frame)`` pairs from the decoder
+
+        Yields:
+            tuple: ``(timestamp, frame)`` with grayscale frames
+        """
+        data_path, meta_path = self._paths(key)
+        partial_path = data_path + ".partial"
+        count = 0
+        shape = None
+        completed = False
+        try:
+            with open(partial_path, "wb") as f:
+                for timestamp, frame in frames:
+                    gray = luma(frame) if frame.ndim == 3 else frame
+                    shape = gray.shape
+                    f.write(gray.tobytes())
+                    count += 1
+                    yield timestamp, gray
+            completed = True
+        finally:
+            if completed:
+                os.replace(partial_path, data_path)
+                height, width = shape if shape else (0, 0)
+                self._write_meta(meta_path, {
+                    "count": count,
+                    "height": height,
+                    "width": width,
+                    "bytes": count * height * width,
+                    "last_used": time.time()
+                })
+                self.evict(keep=key)
+            elif os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def evict(self, keep=None):
+        """
+        Remove least-recently-used entries until the cache fits its cap.
+
+        Args:
+            keep (str, optional): Key that must not be evicted
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            data_path, meta_path = self._paths(key)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries.append((meta.get("last_used", 0), meta.get("bytes", 0), key))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
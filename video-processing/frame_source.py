@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""
+Streaming frame source built on a single FFmpeg process.
+
+Sampling, scaling, cropping and subtitle burn-in are expressed as one
+FFmpeg filter graph, and the filtered frames are piped back as raw video
+so nothing is written to disk between stages.
+
+NumPy is only imported once frames are decoded, so probing a video stays
+cheap enough for argument checks and ``--plan``.
+"""
+import itertools
+import json
+import math
+import os
+import re
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+# Time one seek costs beyond the frames it decodes: process start-up,
+# demuxer and decoder setup. About 10 ms was measured on an idle core; the
+# margin covers slow disks and busy machines.
+SEEK_OVERHEAD_SECONDS = 0.03
+# Single-core decode throughput, to express the overhead in source frames
+DECODE_PIXELS_PER_SECOND = 300e6
+# Source size assumed when it cannot be probed
+DEFAULT_SOURCE_PIXELS = 1920 * 1080
+SEEK_WORKERS = 4
+# Samples closer together than this many GOPs are decoded sequentially,
+# since neighbouring seeks would decode mostly the same frames
+SEEK_MIN_GOPS = 3
+
+# FFmpeg scaler per resampling preset (see resample.py); "fast" also
+# box-reduces by an integer factor first. None keeps FFmpeg's default,
+# bicubic.
+SCALE_FLAGS = {"fast": "bilinear", "balanced": None, "quality": "lanczos"}
+
+# Stretch of video scanned to measure the GOP structure, in seconds
+PROBE_SECONDS = 600
+
+# Reused read buffers of a sequential decode; a yielded frame stays valid
+# until this many more frames have been read
+FRAME_RING = 4
+
+
+def parse_rate(fps):
+    """
+    Convert a sampling rate to an exact fraction.
+
+    Args:
+        fps (float | str | Fraction): Rate such as ``1``, ``0.25``, ``"2.5"``
+            or ``"30000/1001"``
+
+    Returns:
+        Fraction: Exact frames-per-second value
+
+    Raises:
+        ValueError: If the rate is not positive
+    """
+    rate = Fraction(fps) if isinstance(fps, (int, Fraction)) else Fraction(str(fps))
+    if rate <= 0:
+        raise ValueError("FPS must be positive")
+    return rate
+
+
+def escape_filter_path(path):
+    """
+    Escape a file path for use as an FFmpeg filter option value.
+
+    Args:
+        path (str): Path to escape
+
+    Returns:
+        str: Escaped path, safe to embed in a filter graph
+    """
+    escaped = path.replace("\\", "/")
+    for char in (":", "'", ",", "[", "]", ";"):
+        escaped = escaped.replace(char, "\\" + char)
+    return f"'{escaped}'"
+
+
+def build_filter_graph(fps=1, width=400, height=300, subtitle_path=None, crop=False, start_frame=0,
+                       resample="balanced"):
+    """
+    Build the FFmpeg filter graph for sampling and scaling frames.
+
+    Frames are sampled first so the scaler and the subtitle renderer only
+    ever see the frames that are kept.
+
+    Args:
+        fps (float | str | Fraction): Frames per second to sample
+        width (int): Output frame width
+        height (int): Output frame height
+        subtitle_path (str, optional): Subtitle file to burn in
+        crop (bool): Fill the frame and crop the overflow instead of stretching
+        start_frame (int): Sampling-grid index the input was seeked to, so
+            subtitles can be rendered against the original timeline
+        resample (str): Resampling preset, one of ``SCALE_FLAGS``
+
+    Returns:
+        str: Filter graph for the ``-vf`` option
+
+    Raises:
+        ValueError: If the resampling preset is unknown
+    """
+    if resample not in SCALE_FLAGS:
+        raise ValueError(f"Unknown resampling preset: {resample}")
+    rate = parse_rate(fps)
+    # Anchor the sampling grid at t=0 so output frame n is exactly n / rate
+    filters = [f"fps=fps={rate.numerator}/{rate.denominator}:start_time=0"]
+    flags = f":flags={SCALE_FLAGS[resample]}" if SCALE_FLAGS[resample] else ""
+    if resample == "fast":
+        # Largest integer reduction that keeps both sides at least the
+        # target size, with crop as well as stretch
+        factor = f"max(1,floor(min(iw/{width},ih/{height})))"
+        filters.append(f"scale=w='iw/{factor}':h='ih/{factor}':flags=area")
+    if crop:
+        filters.append(f"scale={width}:{height}:force_original_aspect_ratio=increase{flags}")
+        filters.append(f"crop={width}:{height}")
+    else:
+        filters.append(f"scale={width}:{height}{flags}")
+    filters.append("setsar=1")
+    if subtitle_path:
+        # After the fps filter one timebase unit is exactly one grid step
+        if start_frame:
+            filters.append(f"setpts=PTS+{start_frame}")
+        filters.append(f"subtitles={escape_filter_path(subtitle_path)}")
+        if start_frame:
+            filters.append(f"setpts=PTS-{start_frame}")
+    return ",".join(filters)
+
+
+def probe_duration(video_path):
+    """
+    Read a video's duration with ffprobe.
+
+    Falls back to the ``Duration:`` line FFmpeg prints for its input when
+    ffprobe is not installed.
+
+    Args:
+        video_path (str): Path to input video
+
+    Returns:
+        float: Duration in seconds, or None if it cannot be determined
+    """
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        video_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+    except OSError:
+        pass
+
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-i", video_path],
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_video(video_path):
+    """
+    Read a video's stream metadata without decoding any frames.
+
+    Uses ffprobe, falling back to the stream summary FFmpeg prints for its
+    input when ffprobe is not installed.
+
+    Args:
+        video_path (str): Path to input video
+
+    Returns:
+        dict: ``duration`` and ``fps`` (source frames per second) as floats,
+        ``width``, ``height`` and ``codec``; values that could not be
+        determined are None
+    """
+    info = {"duration": None, "fps": None, "width": None, "height": None, "codec": None}
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height,avg_frame_rate:format=duration",
+        "-of", "json",
+        video_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError:
+        result = None
+    if result is not None:
+        try:
+            data = json.loads(result.stdout or "{}")
+        except ValueError:
+            data = {}
+        stream = (data.get("streams") or [{}])[0]
+        info["codec"] = stream.get("codec_name")
+        info["width"] = stream.get("width")
+        info["height"] = stream.get("height")
+        try:
+            info["fps"] = float(Fraction(stream.get("avg_frame_rate", ""))) or None
+        except (ValueError, ZeroDivisionError):
+            pass
+        try:
+            info["duration"] = float(data.get("format", {}).get("duration"))
+        except (TypeError, ValueError):
+            pass
+        return info
+
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-i", video_path],
+                                capture_output=True, text=True)
+    except OSError:
+        return info
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = re.search(r"Stream #.*?Video: (\w+).*", result.stderr)
+    if match:
+        info["codec"] = match.group(1)
+        size = re.search(r", (\d+)x(\d+)", match.group(0))
+        if size:
+            info["width"], info["height"] = int(size.group(1)), int(size.group(2))
+        rate = re.search(r", ([\d.]+) fps", match.group(0))
+        if rate:
+            info["fps"] = float(rate.group(1))
+    return info
+
+
+def estimate_frame_count(video_path, fps=1):
+    """
+    Estimate how many frames ``iter_frames`` will yield.
+
+    Args:
+        video_path (str): Path to input video
+        fps (float | str | Fraction): Frames per second to sample
+
+    Returns:
+        int: Expected number of sampled frames, or None if the duration is unknown
+    """
+    duration = probe_duration(video_path)
+    if duration is None:
+        return None
+    return math.ceil(Fraction(str(duration)) * parse_rate(fps))
+
+
+def probe_gop(video_path, probe_seconds=PROBE_SECONDS):
+    """
+    Measure a video's frame rate and keyframe spacing.
+
+    Only the first ``probe_seconds`` are scanned. ffprobe reads packet
+    flags without decoding; without ffprobe, FFmpeg decodes just the
+    keyframes of that stretch.
+
+    Args:
+        video_path (str): Path to input video
+        probe_seconds (float): Length of video to scan
+
+    Returns:
+        dict: ``fps`` (source frames per second), ``duration`` and
+        ``keyframe_interval`` in seconds; values that could not be
+        determined are None
+    """
+    info = {"fps": None, "duration": probe_duration(video_path), "keyframe_interval": None}
+    keyframes = []
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-read_intervals", f"%+{probe_seconds}",
+        "-show_entries", "stream=avg_frame_rate:packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+        for line in result.stdout.splitlines():
+            fields = line.split(",")
+            if len(fields) == 2 and "K" in fields[1] and fields[0] not in ("", "N/A"):
+                keyframes.append(float(fields[0]))
+            elif len(fields) == 1 and "/" in fields[0]:
+                numerator, denominator = fields[0].split("/")
+                if int(denominator):
+                    info["fps"] = int(numerator) / int(denominator)
+    except OSError:
+        command = [
+            "ffmpeg", "-hide_banner", "-nostdin",
+            "-skip_frame", "nokey", "-t", str(probe_seconds),
+            "-i", video_path,
+            "-an", "-sn", "-vf", "showinfo", "-f", "null", "-"
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+        except OSError:
+            return info
+        keyframes = [float(match) for match in re.findall(r"pts_time:\s*([\d.]+)", result.stderr)]
+        match = re.search(r"Video:.*?, ([\d.]+) fps", result.stderr)
+        if match:
+            info["fps"] = float(match.group(1))
+
+    if len(keyframes) > 1:
+        keyframes.sort()
+        info["keyframe_interval"] = (keyframes[-1] - keyframes[0]) / (len(keyframes) - 1)
+    elif keyframes and info["duration"]:
+        # A single keyframe in the probed stretch: treat it as one GOP
+        info["keyframe_interval"] = min(info["duration"], probe_seconds)
+    return info
+
+
+def strategy_costs(source_fps, keyframe_interval, grid_gap, sample_gap=None, pixels=None,
+                   seek_workers=SEEK_WORKERS):
+    """
+    Estimate the decoding cost of one sample with each strategy.
+
+    A sequential decode costs every source frame between two samples, and
+    FFmpeg spreads it over all cores with its own threads. A seek decodes
+    on average half a GOP, from the keyframe before the target up to it,
+    plus half a grid step past it, which the ``fps`` filter reads before it
+    emits the nearest frame. Each seek also pays a fixed process overhead.
+    Seeks run ``seek_workers`` at a time, but no more than there are cores.
+
+    Args:
+        source_fps (float): Source frames per second
+        keyframe_interval (float): Seconds between keyframes
+        grid_gap (float): Source frames per step of the sampling grid
+        sample_gap (float, optional): Source frames between the samples
+            actually kept; ``grid_gap`` when every grid frame is kept
+        pixels (int, optional): Source pixels per frame
+        seek_workers (int): Concurrent seeks
+
+    Returns:
+        tuple: ``(sequential, seek, workers)``, the wall-clock cost of one
+        sample in source frames per strategy, and the seeks that really
+        run at once
+    """
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(seek_workers, cpus))
+    if sample_gap is None:
+        sample_gap = grid_gap
+    overhead = SEEK_OVERHEAD_SECONDS * DECODE_PIXELS_PER_SECOND / (pixels or DEFAULT_SOURCE_PIXELS)
+    sequential = sample_gap / cpus
+    seek = (source_fps * keyframe_interval / 2 + grid_gap / 2 + overhead) / workers
+    return sequential, seek, workers
+
+
+def choose_strategy(video_path, fps=1, seek_workers=SEEK_WORKERS, samples=None):
+    """
+    Pick sequential decoding or keyframe seeks from the sampling density.
+
+    Seeking is chosen only when the samples are at least ``SEEK_MIN_GOPS``
+    GOPs apart and ``strategy_costs`` estimates it to be cheaper.
+
+    Args:
+        video_path (str): Path to input video
+        fps (float | str | Fraction): Frames per second to sample
+        seek_workers (int): Concurrent seeks
+        samples (int, optional): Number of grid points actually kept, when
+            only some are selected; spreads the sequential cost over them
+
+    Returns:
+        tuple: ``(strategy, info)`` with ``strategy`` ``"sequential"`` or
+        ``"seek"`` and ``info`` holding the probe results and estimated
+        decoded frames per sample for each strategy
+    """
+    rate = parse_rate(fps)
+    info = probe_gop(video_path)
+    if not info["fps"] or not info["keyframe_interval"]:
+        info["reason"] = "GOP structure unknown"
+        return "sequential", info
+    source = probe_video(video_path)
+    pixels = source["width"] * source["height"] if source["width"] and source["height"] else None
+    grid_gap = info["fps"] / float(rate)
+    sample_gap = grid_gap
+    if samples and info["duration"]:
+        sample_gap = info["fps"] * info["duration"] / samples
+    sequential_cost, seek_cost, workers = strategy_costs(info["fps"], info["keyframe_interval"], grid_gap,
+                                                         sample_gap, pixels, seek_workers)
+    info["sequential_cost"] = sequential_cost
+    info["seek_cost"] = seek_cost
+    gop = info["fps"] * info["keyframe_interval"]
+    if sample_gap < SEEK_MIN_GOPS * gop:
+        strategy = "sequential"
+        info["reason"] = (f"samples {sample_gap / gop:.1f} GOPs apart, closer than {SEEK_MIN_GOPS}; "
+                          f"~{sequential_cost:.0f} source frames per sample sequentially, "
+                          f"~{seek_cost:.0f} with {workers} parallel seeks")
+    else:
+        strategy = "seek" if seek_cost < sequential_cost else "sequential"
+        info["reason"] = (f"~{sequential_cost:.0f} source frames per sample sequentially, "
+                          f"~{seek_cost:.0f} with {workers} parallel seeks")
+    return strategy, info
+
+
+def _decode_command(video_path, rate, width, height, subtitle_path=None, crop=False, start_frame=0, frames=None,
+                    resample="balanced", luma=False):
+    """Build the FFmpeg command that decodes the sampling grid from ``start_frame``."""
+    start_time = start_frame / rate
+    command = [
+        "ffmpeg",
+        "-v", "error",
+        "-nostdin",
+        "-ss", f"{float(start_time):.6f}",
+        "-i", video_path,
+        "-an", "-sn",
+        "-vf", build_filter_graph(rate, width, height, subtitle_path, crop, start_frame, resample),
+        # Emit exactly the frames the filter graph produces
+        "-fps_mode", "passthrough"
+    ]
+    if frames is not None:
+        command += ["-frames:v", str(frames)]
+    # gray makes the last scaler write 8-bit luma directly
+    return command + ["-f", "rawvideo", "-pix_fmt", "gray" if luma else "rgb24", "pipe:1"]
+
+
+def _frame_shape(width, height, luma=False):
+    return (height, width) if luma else (height, width, 3)
+
+
+def _read_into(stream, frame):
+    """Fill a frame buffer from an unbuffered pipe; returns the bytes read, short only at the end."""
+    view = memoryview(frame).cast("B")
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+def _seek_frame(command):
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg decode failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def iter_frames_seek(video_path, fps=1, width=400, height=300, subtitle_path=None, crop=False, start_frame=0,
+                     workers=SEEK_WORKERS, resample="balanced", indexes=None, end_frame=None, luma=False):
+    """
+    Yield sampled frames with one fast input seek per frame.
+
+    Each frame is decoded by its own FFmpeg process that seeks to the
+    keyframe before the target (``-ss`` before ``-i``) and decodes
+    accurately up to it. This is the same command a resumed sequential
+    decode uses, so both strategies produce the same frames. Seeks run
+    ``workers`` at a time and frames are yielded in order.
+
+    Args:
+        video_path (str): Path to input video
+        fps (float | str | Fraction): Frames per second to sample
+        width (int): Output frame width
+        height (int): Output frame height
+        subtitle_path (str, optional): Subtitle file to burn in
+        crop (bool): Fill the frame and crop the overflow instead of stretching
+        start_frame (int): Index on the sampling grid to start from
+        workers (int): Concurrent seeks
+        resample (str): Resampling preset, one of ``SCALE_FLAGS``
+        indexes (list, optional): Ascending grid indices to decode instead
+            of every one from ``start_frame``
+        end_frame (int, optional): Index on the sampling grid to stop before
+        luma (bool): Decode 8-bit luma frames instead of RGB
+
+    Yields:
+        tuple: ``(timestamp, frame)`` as from ``iter_frames``
+
+    Raises:
+        RuntimeError: If FFmpeg exits with an error
+    """
+    import numpy as np
+
+    rate = parse_rate(fps)
+    shape = _frame_shape(width, height, luma)
+    frame_size = math.prod(shape)
+    if indexes is not None:
+        indexes = iter([index for index in indexes if index >= start_frame])
+    else:
+        total = estimate_frame_count(video_path, rate)
+        if end_frame is not None:
+            total = end_frame if total is None else min(total, end_frame)
+        indexes = itertools.count(start_frame) if total is None else iter(range(start_frame, total))
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        def submit():
+            index = next(indexes, None)
+            if index is not None:
+                command = _decode_command(video_path, rate, width, height, subtitle_path, crop, index, frames=1,
+                                          resample=resample, luma=luma)
+                pending.append((index, executor.submit(_seek_frame, command)))
+
+        for _ in range(workers * 2):
+            submit()
+        while pending:
+            index, future = pending.popleft()
+            buffer = future.result()
+            if len(buffer) < frame_size:
+                # Past the last frame
+                break
+            submit()
+            frame = np.frombuffer(buffer[:frame_size], dtype=np.uint8).reshape(shape)
+            yield float(index / rate), frame
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_frames(video_path, fps=1, width=400, height=300, subtitle_path=None, crop=False, start_frame=0,
+                strategy="sequential", seek_workers=SEEK_WORKERS, resample="balanced", indexes=None, end_frame=None,
+                luma=False):
+    """
+    Decode a video and yield the sampled frames.
+
+    By default the video is decoded forward exactly once. Sparse sampling
+    of long videos can instead seek to each frame; see ``choose_strategy``.
+
+    Any positive rate is honoured, above or below one frame per second.
+    Timestamps are computed from the exact sampling grid, so they do not
+    drift over long films.
+
+    A sequential decode reads each frame straight from the pipe into one of
+    ``FRAME_RING`` preallocated buffers, so no memory is allocated per
+    frame. Frames are only valid until ``FRAME_RING`` more have been read;
+    consumers that keep frames longer must copy them.
+
+    Args:
+        video_path (str): Path to input video
+        fps (float | str | Fraction): Frames per second to sample
+        width (int): Output frame width
+        height (int): Output frame height
+        subtitle_path (str, optional): Subtitle file to burn in
+        crop (bool): Fill the frame and crop the overflow instead of stretching
+        start_frame (int): Index on the sampling grid to start from; earlier
+            frames are skipped by seeking
+        strategy (str): ``"sequential"`` for one forward decode, ``"seek"``
+            for ``iter_frames_seek``, or ``"auto"`` to let
+            ``choose_strategy`` decide
+        seek_workers (int): Concurrent seeks for the seek strategy
+        resample (str): Resampling preset, one of ``SCALE_FLAGS``
+        indexes (list, optional): Ascending grid indices to keep, such as a
+            ``scene_planner`` selection; the sequential strategy decodes from
+            the first to the last of them and drops the rest
+        end_frame (int, optional): Index on the sampling grid to stop
+            before; ignored when ``indexes`` are given
+        luma (bool): Have FFmpeg convert to 8-bit luma (``gray``), a third of
+            the pipe traffic and frame memory of RGB, for 1-bit output
+
+    Yields:
+        tuple: ``(timestamp, frame)`` with the timestamp in seconds and the
+        frame as an RGB numpy.ndarray of shape (height, width, 3), or of
+        shape (height, width) with ``luma``
+
+    Raises:
+        ValueError: If the rate is not positive
+        RuntimeError: If FFmpeg exits with an error
+    """
+    rate = parse_rate(fps)
+    wanted = None
+    if indexes is not None:
+        indexes = [index for index in indexes if index >= start_frame]
+        if not indexes:
+            return
+        wanted = set(indexes)
+    if strategy == "auto":
+        strategy, _ = choose_strategy(video_path, rate, seek_workers, len(indexes) if indexes else None)
+    if strategy == "seek":
+        yield from iter_frames_seek(video_path, rate, width, height, subtitle_path, crop, start_frame, seek_workers,
+                                    resample, indexes, end_frame, luma)
+        return
+    import numpy as np
+
+    frames = None
+    if indexes:
+        start_frame = indexes[0]
+        frames = indexes[-1] - indexes[0] + 1
+    elif end_frame is not None:
+        if end_frame <= start_frame:
+            return
+        frames = end_frame - start_frame
+    command = _decode_command(video_path, rate, width, height, subtitle_path, crop, start_frame, frames, resample,
+                              luma)
+    ring = [np.empty(_frame_shape(width, height, luma), dtype=np.uint8) for _ in range(FRAME_RING)]
+
+    # Unbuffered, so readinto fills the frame buffers without a middle copy
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+    finished = False
+    frame_index = start_frame
+    slot = 0
+    try:
+        while True:
+            frame = ring[slot]
+            if _read_into(process.stdout, frame) < frame.nbytes:
+                break
+            if wanted is None or frame_index in wanted:
+                yield float(frame_index / rate), frame
+                slot = (slot + 1) % FRAME_RING
+            frame_index += 1
+        finished = True
+    finally:
+        # Stop FFmpeg if the consumer closed the generator early
+        if process.poll() is None and not finished:
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg decode failed: {stderr.decode(errors='replace').strip()}")
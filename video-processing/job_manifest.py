@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Job manifest for resumable, checkpointed processing.
+
+The manifest records a fingerprint of the source, the parameters of every
+pipeline stage and each committed output frame with the hash of its file.
+A rerun compares the stored stage parameters against the new ones:
+
+- ``decode`` (source, rate, subtitles) changed: start over
+- ``select`` (deduplication) changed: keep nothing, frames renumber
+- ``scale`` (size, crop, resampling) or ``render`` (dithering, tone)
+  changed: keep the frame selection and re-render the recorded timestamps,
+  skipping the select stage for them. After an interrupted run, selection
+  then continues past the last recorded frame.
+- nothing changed: keep every committed frame whose file still matches its
+  hash and continue decoding from the last one
+
+With deduplication, the hash of every kept frame and the timestamps it
+stands for are saved as well, so a resumed run continues the selection with
+the same window and groups instead of decoding from the start.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+FINGERPRINT_CHUNK = 4 * 1024 * 1024
+
+
+def fingerprint_file(path):
+    """
+    Fingerprint a file cheaply from its size and its first and last bytes.
+
+    Args:
+        path (str): File to fingerprint
+
+    Returns:
+        str: Hex digest, or None if the path is empty
+    """
+    if not path:
+        return None
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK:
+            f.seek(max(FINGERPRINT_CHUNK, size - FINGERPRINT_CHUNK))
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    """
+    Hash a whole output file.
+
+    Args:
+        path (str): File to hash
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class JobManifest:
+    """
+    Manifest of one conversion job, saved atomically as JSON.
+
+    Args:
+        path (str): Manifest path
+        stages (dict): Parameters of each stage, keyed by stage name
+        checkpoint_interval (int): Committed frames between saves
+    """
+
+    STAGES = ("decode", "scale", "select", "render")
+
+    def __init__(self, path, stages, checkpoint_interval=25):
+        self.path = path
+        self.stages = stages
+        self.checkpoint_interval = checkpoint_interval
+        self.frames = []
+        self.complete = False
+        # Timestamps to re-render when only the scale or render stage
+        # changed, and the last of them if the previous run was interrupted
+        self.planned = None
+        self.planned_until = None
+        # Deduplication state the previous run saved, and the deduplicator
+        # whose state this run saves
+        self.dedup = None
+        self.deduplicator = None
+        self._since_checkpoint = 0
+
+    @classmethod
+    def open(cls, path, stages, output_folder, checkpoint_interval=25):
+        """
+        Load a previous manifest and keep whatever is still valid.
+
+        Args:
+            path (str): Manifest path
+            stages (dict): Parameters of each stage for this run
+            output_folder (str): Folder the frames are written to
+            checkpoint_interval (int): Committed frames between saves
+
+        Returns:
+            JobManifest: Manifest for this run
+        """
+        job = cls(path, stages, checkpoint_interval)
+        if not os.path.exists(path):
+            return job
+
+        try:
+            with open(path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable job manifest {path}: {e}")
+            return job
+        if previous.get("version") != MANIFEST_VERSION:
+            return job
+
+        old_stages = previous.get("stages", {})
+        if old_stages.get("decode") != stages["decode"] or old_stages.get("select") != stages["select"]:
+            print("Source or sampling parameters changed; starting over.")
+            return job
+
+        if old_stages.get("scale") != stages["scale"] or old_stages.get("render") != stages["render"]:
+            planned = [frame["timestamp"] for frame in previous["frames"]]
+            if previous.get("complete"):
+                print("Only scale or render parameters changed; re-rendering the recorded frames.")
+                job.planned = planned
+            elif planned:
+                print(f"Only scale or render parameters changed; re-rendering the {len(planned)} recorded "
+                      f"frames, then continuing.")
+                job.planned = planned
+                job.planned_until = planned[-1]
+            else:
+                print("Scale or render parameters changed; starting over.")
+            return job
+
+        for frame in previous["frames"]:
+            output_path = os.path.join(output_folder, frame["file"])
+            if not os.path.exists(output_path) or hash_file(output_path) != frame["sha256"]:
+                print(f"Frame {frame['file']} is missing or changed; resuming from there.")
+                break
+            job.frames.append(frame)
+        job.dedup = previous.get("dedup")
+        job.complete = previous.get("complete", False) and len(job.frames) == len(previous["frames"])
+        return job
+
+    def resume_timestamp(self):
+        """
+        Timestamp of the last committed frame.
+
+        Returns:
+            float: Timestamp in seconds, or None if nothing is committed
+        """
+        return self.frames[-1]["timestamp"] if self.frames else None
+
+    def written(self):
+        """
+        List the committed frames.
+
+        Returns:
+            list: ``(filename, timestamp)`` for each committed frame
+        """
+        return [(frame["file"], frame["timestamp"]) for frame in self.frames]
+
+    def commit(self, filename, timestamp, output_path, sha256=None):
+        """
+        Record a frame whose file has been fully written.
+
+        Args:
+            filename (str): Output file name
+            timestamp (float): Source timestamp of the frame
+            output_path (str): Path of the written file
+            sha256 (str, optional): Hash of the written data; the file is
+                read back and hashed when not given
+        """
+        if sha256 is None:
+            sha256 = hash_file(output_path)
+        self.frames.append({"file": filename, "timestamp": timestamp, "sha256": sha256})
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_interval:
+            self.save()
+
+    def mark_complete(self):
+        """Record that every stage finished and save."""
+        self.complete = True
+        self.save()
+
+    def save(self):
+        """Write the manifest atomically."""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "stages": self.stages,
+            "complete": self.complete,
+            "frames": self.frames
+        }
+        if self.deduplicator is not None and self.frames:
+            manifest["dedup"] = self.deduplicator.state(self.resume_timestamp())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.path)
+        self._since_checkpoint = 0
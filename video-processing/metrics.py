@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and counters for the conversion pipeline.
+
+Each stage (plan, decode, subtitle, cache, select, tone, resize, dither, encode,
+write, checkpoint) records wall and CPU time per item, item counts and
+bytes.
+Stages nest: time an outer stage spends waiting on an inner one, such as
+tone mapping pulling frames from the decoder, is charged to the inner
+stage only, so the stage times add up to the run.
+
+Frame processing in worker processes cannot share a ``Metrics`` object, so
+it fills a plain ``{stage: (wall, cpu)}`` dict with ``timer`` that the main
+process merges. Background stages such as ``io``, the output writer
+thread, overlap the others and are left out of the run total.
+"""
+import bisect
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STAGES = ("plan", "decode", "subtitle", "cache", "select", "tone", "resize", "dither", "encode", "write", "checkpoint", "io")
+
+# Stages timed on background threads, concurrently with the pipeline
+BACKGROUND_STAGES = ("io",)
+
+# Upper bounds of the duration histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _clock():
+    return time.perf_counter(), time.thread_time()
+
+
+def _children_cpu():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextmanager
+def timer(timings, name):
+    """
+    Add the wall and CPU time of a block to a timings dict.
+
+    Args:
+        timings (dict): ``{stage: (wall, cpu)}`` to add to
+        name (str): Stage name
+    """
+    wall, cpu = _clock()
+    try:
+        yield
+    finally:
+        end_wall, end_cpu = _clock()
+        old_wall, old_cpu = timings.get(name, (0.0, 0.0))
+        timings[name] = (old_wall + end_wall - wall, old_cpu + end_cpu - cpu)
+
+
+class StageStats:
+    """Totals and per-item durations of one stage."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.durations = []
+
+    def add(self, wall, cpu, items=1, nbytes=0):
+        """Record one measurement covering ``items`` items."""
+        self.wall += wall
+        self.cpu += cpu
+        self.items += items
+        self.bytes += nbytes
+        if items:
+            self.durations.append(wall / items)
+
+    def percentile(self, q):
+        """Per-item wall time at percentile ``q`` in seconds."""
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def histogram(self):
+        """
+        Count per-item durations into ``HISTOGRAM_BOUNDS_MS`` buckets.
+
+        Returns:
+            dict: Bucket label to count; the last bucket is open-ended
+        """
+        counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for duration in self.durations:
+            counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, duration * 1000)] += 1
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return dict(zip(labels, counts))
+
+    def to_dict(self):
+        """Summarise the stage for JSON export."""
+        return {
+            "wall_s": self.wall,
+            "cpu_s": self.cpu,
+            "items": self.items,
+            "bytes": self.bytes,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "max_ms": max(self.durations, default=0) * 1000,
+            "histogram": self.histogram()
+        }
+
+
+class Metrics:
+    """
+    Collects stage timings, counters and queue depths for one run.
+
+    Sections must be entered and left on the thread that runs the
+    pipeline.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.gauges = {}
+        self.memory = None
+        self.cprofile_path = None
+        self.wall = None
+        self.cpu = None
+        self.children_cpu = None
+        self._stack = []
+        self._start = None
+
+    def start(self):
+        """Start timing the whole run."""
+        self._start = (time.perf_counter(), time.process_time(), _children_cpu())
+
+    def stop(self):
+        """Stop timing the whole run."""
+        if self._start is None:
+            return
+        wall, cpu, children = self._start
+        self.wall = time.perf_counter() - wall
+        self.cpu = time.process_time() - cpu
+        if children is not None:
+            # Finished FFmpeg and worker processes
+            self.children_cpu = _children_cpu() - children
+        self._start = None
+
+    def add(self, name, wall, cpu, items=1, nbytes=0):
+        """
+        Record a measurement for a stage.
+
+        Args:
+            name (str): Stage name
+            wall (float): Wall time in seconds
+            cpu (float): CPU time in seconds
+            items (int): Items the measurement covers
+            nbytes (int): Bytes produced
+        """
+        self.stages.setdefault(name, StageStats()).add(wall, cpu, items, nbytes)
+
+    def merge(self, timings, items=1):
+        """
+        Record a ``{stage: (wall, cpu)}`` dict filled by ``timer``.
+
+        Args:
+            timings (dict): Timings of one item
+            items (int): Items the timings cover
+        """
+        for name, (wall, cpu) in timings.items():
+            self.add(name, wall, cpu, items)
+
+    def _enter(self):
+        self._stack.append([0.0, 0.0])
+        return _clock()
+
+    def _exit(self, name, start, items=1, nbytes=0):
+        wall, cpu = _clock()
+        wall -= start[0]
+        cpu -= start[1]
+        child_wall, child_cpu = self._stack.pop()
+        if self._stack:
+            self._stack[-1][0] += wall
+            self._stack[-1][1] += cpu
+        self.add(name, wall - child_wall, cpu - child_cpu, items, nbytes)
+
+    @contextmanager
+    def stage(self, name, items=1, nbytes=0):
+        """
+        Time a block as one stage measurement.
+
+        Args:
+            name (str): Stage name
+            items (int): Items the block processes
+            nbytes (int): Bytes the block produces
+        """
+        start = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, start, items, nbytes)
+
+    def timed_iter(self, name, iterable):
+        """
+        Charge the time spent producing each item of an iterable to a stage.
+
+        Args:
+            name (str): Stage name
+            iterable (iterable): Items to pass through
+
+        Yields:
+            Items of ``iterable`` unchanged
+        """
+        iterator = iter(iterable)
+        while True:
+            start = self._enter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(name, start, items=0)
+                return
+            except BaseException:
+                self._exit(name, start, items=0)
+                raise
+            self._exit(name, start)
+            yield item
+
+    def gauge(self, name, value):
+        """
+        Sample a level such as a queue depth.
+
+        Args:
+            name (str): Gauge name
+            value (float): Current value
+        """
+        gauge = self.gauges.setdefault(name, {"samples": 0, "total": 0, "max": value, "last": value})
+        gauge["samples"] += 1
+        gauge["total"] += value
+        gauge["max"] = max(gauge["max"], value)
+        gauge["last"] = value
+
+    @contextmanager
+    def capture(self, cprofile_path=None, trace_memory=False):
+        """
+        Optionally profile a block with cProfile and tracemalloc.
+
+        Args:
+            cprofile_path (str, optional): Write cProfile stats here
+            trace_memory (bool): Record peak Python allocations and the top
+                allocation sites
+        """
+        profiler = cProfile.Profile() if cprofile_path else None
+        if trace_memory:
+            tracemalloc.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(cprofile_path)
+                self.cprofile_path = cprofile_path
+            if trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                tracemalloc.stop()
+                self.memory = {
+                    "current_bytes": current,
+                    "peak_bytes": peak,
+                    "top": [{"site": str(stat.traceback), "bytes": stat.size, "count": stat.count} for stat in top]
+                }
+
+    def to_dict(self):
+        """
+        Summarise the run for JSON export.
+
+        Returns:
+            dict: Run totals, per-stage statistics, gauges and memory capture
+        """
+        gauges = {
+            name: {"max": gauge["max"], "mean": gauge["total"] / gauge["samples"], "samples": gauge["samples"]}
+            for name, gauge in self.gauges.items()
+        }
+        return {
+            "wall_s": self.wall,
+            "cpu_s": self.cpu,
+            "children_cpu_s": self.children_cpu,
+            "stages": {name: self.stages[name].to_dict() for name in self._ordered()},
+            "gauges": gauges,
+            "memory": self.memory
+        }
+
+    def write_json(self, path):
+        """
+        Write the metrics as JSON.
+
+        Args:
+            path (str): Output path
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def _ordered(self):
+        known = [name for name in STAGES if name in self.stages]
+        return known + sorted(name for name in self.stages if name not in STAGES)
+
+    def summary(self):
+        """
+        Format the metrics as a table.
+
+        Returns:
+            str: Summary table
+        """
+        lines = [f"{'stage':<11} {'items':>6} {'wall s':>8} {'cpu s':>8} {'share':>6} "
+                 f"{'p50 ms':>8} {'p95 ms':>8} {'bytes':>12}"]
+        accounted = 0.0
+        for name in self._ordered():
+            stats = self.stages[name]
+            if name not in BACKGROUND_STAGES:
+                accounted += stats.wall
+            share = f"{stats.wall / self.wall:.0%}" if self.wall else ""
+            lines.append(f"{name:<11} {stats.items:>6} {stats.wall:>8.3f} {stats.cpu:>8.3f} {share:>6} "
+                         f"{stats.percentile(50) * 1000:>8.2f} {stats.percentile(95) * 1000:>8.2f} "
+                         f"{stats.bytes:>12,}")
+        if self.wall:
+            lines.append(f"{'other':<11} {'':>6} {self.wall - accounted:>8.3f}")
+            lines.append(f"{'total':<11} {'':>6} {self.wall:>8.3f} {self.cpu:>8.3f}")
+        if self.children_cpu is not None:
+            lines.append(f"Child process CPU (FFmpeg, workers): {self.children_cpu:.3f}s")
+        for name, gauge in self.gauges.items():
+            lines.append(f"{name}: max {gauge['max']}, mean {gauge['total'] / gauge['samples']:.1f}")
+        if self.memory is not None:
+            lines.append(f"Python allocations: peak {self.memory['peak_bytes'] / 2 ** 20:.1f} MB")
+            for stat in self.memory["top"][:5]:
+                lines.append(f"  {stat['bytes'] / 2 ** 10:>9.1f} KB  {stat['site']}")
+        if self.cprofile_path is not None:
+            out = io.StringIO()
+            pstats.Stats(self.cprofile_path, stream=out).sort_stats("cumulative").print_stats(15)
+            lines.append(f"cProfile stats written to {self.cprofile_path}; top functions:")
+            lines.append(out.getvalue().rstrip())
+        return "\n".join(lines)
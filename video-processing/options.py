@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Option values, defaults and firmware limits shared by the tools.
+
+Only the standard library is imported here, so command-line tools can
+build their argument parsers, print ``--help`` and plan a run without
+loading NumPy, Pillow or any other processing backend. The modules that
+implement each option re-export its values under their usual names.
+"""
+import os
+
+# dither.METHODS
+DITHER_METHODS = ("floyd-steinberg", "atkinson", "serpentine", "bayer", "blue-noise")
+
+# palette.PALETTES and palette.METHODS
+PALETTES = ("mono", "7color")
+PALETTE_METHODS = ("floyd-steinberg", "atkinson", "bayer", "blue-noise")
+
+# tone.MODES
+TONE_MODES = ("shot", "global", "frame")
+
+# resample.PRESETS
+RESAMPLE_PRESETS = ("fast", "balanced", "quality")
+
+# Decode strategies of frame_source.iter_frames, plus automatic choice
+STRATEGIES = ("auto", "sequential", "seek")
+
+# frame_cache defaults
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "still-in-motion", "frames")
+DEFAULT_CACHE_SIZE = 20 * 1024 ** 3
+
+# Highest picture index the firmware reads (picture_index.h); indices
+# start at 0
+MAX_PICTURE_INDEX = 999
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Buffered frame encoding and a background writer thread.
+
+Frames are encoded into a fixed pool of preallocated buffers, as 1bpp or
+4bpp BMP files or as packed container planes, and handed to one I/O thread that writes
+them. The pool bounds the frames waiting to be written: when it is empty,
+the producer blocks until the writer frees a buffer.
+
+With ``fsync``, written files are flushed to the device in groups, once per
+checkpoint, and a frame is only reported as written after its group is
+durable. A job manifest built from the reported frames therefore never
+points at data that could still be lost.
+"""
+import hashlib
+import io
+import os
+import queue
+import struct
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image
+
+from epd_container import pack_image, plane_size
+
+# Encoded frames that may wait for the writer
+SINK_SLOTS = 16
+
+# Frames the writer takes from the queue per wake-up
+WRITE_BATCH = 8
+
+# Frames written between fsync groups; matches the job manifest's checkpoints
+SYNC_INTERVAL = 25
+
+
+class BmpEncoder:
+    """
+    Encode 1-bit frames as BMP files into caller-supplied buffers.
+
+    The header and palette are taken once from Pillow, and only the pixel
+    rows are filled in per frame, so the files are byte-identical to
+    ``Image.save(path, format="BMP")``.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+    """
+
+    def __init__(self, width=400, height=300):
+        self.width = width
+        self.height = height
+        buffer = io.BytesIO()
+        Image.new("1", (width, height)).save(buffer, format="BMP")
+        blank = buffer.getvalue()
+        self.header = blank[:int.from_bytes(blank[10:14], "little")]
+        self.row_bytes = (width + 7) // 8
+        # BMP rows are padded to four bytes
+        self.stride = (self.row_bytes + 3) // 4 * 4
+        self.size = len(blank)
+
+    def encode(self, img, buffer):
+        """
+        Encode a frame into ``buffer``.
+
+        Args:
+            img (PIL.Image): Frame
+            buffer (bytearray): At least ``size`` bytes
+
+        Returns:
+            memoryview: The encoded file, a view of ``buffer`` when the frame
+            is a 1-bit image of the encoder's size
+        """
+        if img.mode != "1" or img.size != (self.width, self.height) or img.info:
+            # Anything unusual goes through Pillow
+            out = io.BytesIO()
+            img.save(out, format="BMP")
+            return memoryview(out.getvalue())
+        view = memoryview(buffer)
+        view[:len(self.header)] = self.header
+        rows = np.frombuffer(buffer, dtype=np.uint8, count=self.size - len(self.header), offset=len(self.header))
+        rows = rows.reshape(self.height, self.stride)
+        # Pillow packs rows top-down; BMP stores them bottom-up
+        rows[::-1, :self.row_bytes] = np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(self.height, self.row_bytes)
+        rows[:, self.row_bytes:] = 0
+        return view[:self.size]
+
+
+class Bmp4Encoder:
+    """
+    Encode palette frames as 4bpp BMP files into caller-supplied buffers.
+
+    Pixel values are written as they are, two per byte with the left pixel
+    in the high nibble, so indices that are panel colour codes reach the
+    panel unchanged through ``readQuarterLine``.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+        palette (numpy.ndarray): Up to 16 RGB colours stored in the colour
+            table, so the files also open in image viewers
+    """
+
+    def __init__(self, width, height, palette):
+        self.width = width
+        self.height = height
+        self.row_bytes = (width + 1) // 2
+        self.stride = (self.row_bytes + 3) // 4 * 4
+        colours = np.zeros((16, 4), dtype=np.uint8)
+        # Colour table entries are BGR plus a reserved byte
+        colours[:len(palette), :3] = np.asarray(palette, dtype=np.uint8)[:, ::-1]
+        offset = 14 + 40 + colours.nbytes
+        self.size = offset + self.stride * height
+        self.header = (struct.pack("<2sIHHI", b"BM", self.size, 0, 0, offset)
+                       + struct.pack("<IiiHHIIiiII", 40, width, height, 1, 4, 0, self.stride * height,
+                                     3780, 3780, 16, 0)
+                       + colours.tobytes())
+
+    def encode(self, img, buffer):
+        """
+        Encode a frame into ``buffer``.
+
+        Args:
+            img (PIL.Image): Mode "P" frame of the encoder's size
+            buffer (bytearray): At least ``size`` bytes
+
+        Returns:
+            memoryview: The encoded file, a view of ``buffer``
+
+        Raises:
+            ValueError: If the frame is not a palette image of the encoder's size
+        """
+        if img.mode != "P" or img.size != (self.width, self.height):
+            raise ValueError(f"Expected a {self.width}x{self.height} palette frame, got {img.mode} "
+                             f"{img.size[0]}x{img.size[1]}")
+        indices = np.asarray(img)
+        if self.width % 2:
+            indices = np.pad(indices, ((0, 0), (0, 1)))
+        view = memoryview(buffer)
+        view[:len(self.header)] = self.header
+        rows = np.frombuffer(buffer, dtype=np.uint8, count=self.size - len(self.header), offset=len(self.header))
+        rows = rows.reshape(self.height, self.stride)
+        # Rows are stored bottom-up
+        rows[::-1, :self.row_bytes] = (indices[:, 0::2] << 4) | (indices[:, 1::2] & 0x0F)
+        rows[:, self.row_bytes:] = 0
+        return view[:self.size]
+
+
+class PlaneEncoder:
+    """
+    Encode frames as packed container planes into caller-supplied buffers.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+    """
+
+    def __init__(self, width=400, height=300):
+        self.width = width
+        self.height = height
+        self.size = plane_size(width, height)
+
+    def encode(self, img, buffer):
+        """
+        Encode a frame into ``buffer``.
+
+        Args:
+            img (PIL.Image): Frame of the encoder's size
+            buffer (bytearray): At least ``size`` bytes
+
+        Returns:
+            memoryview: The packed plane, a view of ``buffer``
+
+        Raises:
+            ValueError: If the frame has the wrong size
+        """
+        if img.size != (self.width, self.height):
+            raise ValueError(f"Frame is {img.size[0]}x{img.size[1]}, container is {self.width}x{self.height}")
+        view = memoryview(buffer)
+        view[:self.size] = pack_image(img)
+        return view[:self.size]
+
+
+class OutputSink:
+    """
+    Write encoded frames on a background thread.
+
+    Frames go either to one file each under ``folder`` or, in order, to
+    ``stream`` (such as a container's plane spool). Call ``completed``
+    regularly to collect the frames that have been written, and ``close``
+    to finish. The first error on the writer thread stops further writes
+    and is raised by the next ``write`` or by ``check``.
+
+    Args:
+        encoder (BmpEncoder | Bmp4Encoder | PlaneEncoder): Encodes frames
+            into buffers
+        folder (str, optional): Write each frame to its own file here
+        stream (file, optional): Write frames one after another to this
+            binary file instead
+        slots (int): Preallocated buffers, and so frames that may wait for
+            the writer
+        batch (int): Frames written per writer wake-up
+        fsync (bool): Flush written frames to the device every
+            ``sync_interval`` frames and before reporting them
+        sync_interval (int): Frames per fsync group
+        hash_frames (bool): Report the SHA-256 of each written frame
+        metrics (Metrics, optional): Records the writer thread's time as
+            the ``io`` stage and the queue depth
+    """
+
+    def __init__(self, encoder, folder=None, stream=None, slots=SINK_SLOTS, batch=WRITE_BATCH, fsync=False,
+                 sync_interval=SYNC_INTERVAL, hash_frames=False, metrics=None):
+        self.encoder = encoder
+        self.folder = folder
+        self.stream = stream
+        self.batch = batch
+        self.fsync = fsync
+        self.sync_interval = sync_interval
+        self.hash_frames = hash_frames
+        self.metrics = metrics
+        self._free = queue.Queue()
+        for _ in range(slots):
+            self._free.put(bytearray(encoder.size))
+        self._queue = queue.Queue()
+        self._done = queue.Queue()
+        self._error = None
+        self._closed = False
+        # Written but not yet durable: (tag, sha256, nbytes, fd)
+        self._unsynced = []
+        self._thread = threading.Thread(target=self._run, name="output-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, name, img, tag=None):
+        """
+        Encode a frame and queue it for writing.
+
+        Blocks while every buffer is waiting for the writer. That wait is
+        recorded as the ``write`` stage and the encoding as ``encode``.
+
+        Args:
+            name (str): File name under ``folder``; ignored for a stream
+            img (PIL.Image): Frame
+            tag (object, optional): Returned by ``completed`` with the frame
+
+        Returns:
+            int: Size of the encoded frame in bytes
+        """
+        self.check()
+        with self._stage("write"):
+            buffer = self._free.get()
+        with self._stage("encode"):
+            data = self.encoder.encode(img, buffer)
+        self._queue.put((name, buffer, data, tag))
+        if self.metrics is not None:
+            self.metrics.gauge("write_queue", self._queue.qsize())
+        return len(data)
+
+    def completed(self):
+        """
+        Collect the frames written since the last call.
+
+        Returns:
+            list: ``(tag, sha256, nbytes)`` in write order; ``sha256`` is None
+            unless ``hash_frames`` is set
+        """
+        done = []
+        while True:
+            try:
+                done.append(self._done.get_nowait())
+            except queue.Empty:
+                return done
+
+    def close(self):
+        """
+        Write and sync everything queued, then stop the writer.
+
+        Returns:
+            list: Frames written since the last ``completed`` call
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        return self.completed()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _stage(self, name):
+        return self.metrics.stage(name) if self.metrics is not None else nullcontext()
+
+    def check(self):
+        """Raise the first error from the writer thread, if any."""
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = items[-1] is None
+            if stop:
+                items.pop()
+            start = time.perf_counter(), time.thread_time()
+            nbytes = 0
+            for name, buffer, data, tag in items:
+                try:
+                    if self._error is None:
+                        nbytes += self._write_one(name, data, tag)
+                except Exception as e:
+                    self._error = e
+                finally:
+                    self._free.put(buffer)
+            try:
+                if self._error is None and (stop or len(self._unsynced) >= self.sync_interval or not self.fsync):
+                    self._sync()
+            except Exception as e:
+                self._error = e
+            if self.metrics is not None and items:
+                self.metrics.add("io", time.perf_counter() - start[0], time.thread_time() - start[1],
+                                 len(items), nbytes)
+            if stop:
+                self._release()
+                return
+
+    def _write_one(self, name, data, tag):
+        sha256 = hashlib.sha256(data).hexdigest() if self.hash_frames else None
+        fd = None
+        if self.stream is not None:
+            self.stream.write(data)
+        elif self.fsync:
+            # Kept open until its group is synced
+            fd = os.open(os.path.join(self.folder, name), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            self._unsynced.append((tag, sha256, len(data), fd))
+            with open(fd, "wb", closefd=False) as f:
+                f.write(data)
+            return len(data)
+        else:
+            with open(os.path.join(self.folder, name), "wb") as f:
+                f.write(data)
+        self._unsynced.append((tag, sha256, len(data), fd))
+        return len(data)
+
+    def _sync(self):
+        if self.fsync and self._unsynced:
+            if self.stream is not None:
+                self.stream.flush()
+                os.fsync(self.stream.fileno())
+            else:
+                for _, _, _, fd in self._unsynced:
+                    os.fsync(fd)
+                if hasattr(os, "O_DIRECTORY"):
+                    # Make the new directory entries durable too
+                    dir_fd = os.open(self.folder, os.O_RDONLY | os.O_DIRECTORY)
+                    try:
+                        os.fsync(dir_fd)
+                    finally:
+                        os.close(dir_fd)
+        self._release(report=True)
+
+    def _release(self, report=False):
+        for tag, sha256, nbytes, fd in self._unsynced:
+            if fd is not None:
+                os.close(fd)
+            if report:
+                self._done.put((tag, sha256, nbytes))
+        self._unsynced = []
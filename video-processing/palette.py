@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+7-colour palette quantization for the epd7in3f panel.
+
+Frames are mapped to the panel's seven inks through a precomputed
+``32 x 32 x 32`` lookup table: each RGB value is reduced to five bits per
+channel and looked up, so matching a pixel is one gather instead of a
+distance computation against every ink. The table is built once from
+nearest-colour distances in CIELAB.
+
+Palette indices are the panel's colour codes from ``epd7in3f.h``
+(``EPD_7IN3F_BLACK`` = 0 ... ``EPD_7IN3F_ORANGE`` = 6), so a 4bpp BMP of
+the indices can be sent to the panel exactly as ``readQuarterLine`` reads
+it.
+
+- ``floyd-steinberg`` and ``atkinson`` diffuse the colour error along
+  anti-diagonal wavefronts, as in ``dither.py``, on a sheared copy of the
+  frames so each wavefront is a slice
+- ``bayer`` and ``blue-noise`` offset each pixel by a tiled threshold
+  matrix before the lookup, one vectorized step per batch
+"""
+import numpy as np
+from PIL import Image
+
+from dither import ATKINSON, FLOYD_STEINBERG, bayer_matrix, blue_noise_matrix
+from options import PALETTE_METHODS as METHODS, PALETTES
+
+# (name, panel colour code, RGB) in code order, as in epd7in3f.h and the
+# vendor's reference palette
+INKS = (
+    ("black", 0x0, (0, 0, 0)),
+    ("white", 0x1, (255, 255, 255)),
+    ("green", 0x2, (0, 255, 0)),
+    ("blue", 0x3, (0, 0, 255)),
+    ("red", 0x4, (255, 0, 0)),
+    ("yellow", 0x5, (255, 255, 0)),
+    ("orange", 0x6, (255, 128, 0))
+)
+PALETTE = np.array([rgb for _, _, rgb in INKS], dtype=np.int32)
+
+# Bits per channel of the lookup table
+LUT_BITS = 5
+
+# Peak-to-peak RGB offset of the threshold dithers
+THRESHOLD_SPREAD = 128
+
+# Methods whose per-wavefront overhead is shared by the frames of a batch,
+# and the batch size that amortizes most of it (about 3.5x at 400x300)
+BATCHED_METHODS = ("floyd-steinberg", "atkinson")
+BATCH_SIZE = 16
+
+_lut_cache = {}
+
+
+def _srgb_to_lab(rgb):
+    """Convert sRGB values in [0, 255] to CIELAB (D65)."""
+    c = rgb / 255.0
+    linear = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = linear @ np.array([[0.4124, 0.2126, 0.0193],
+                             [0.3576, 0.7152, 0.1192],
+                             [0.1805, 0.0722, 0.9505]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def palette_lut(bits=LUT_BITS):
+    """
+    Build the RGB to palette-index lookup table.
+
+    Every cell maps to the ink nearest to the cell's centre in CIELAB. The
+    table is cached.
+
+    Args:
+        bits (int): Bits per channel; the table has ``2**bits`` cells per axis
+
+    Returns:
+        numpy.ndarray: ``(2**bits, 2**bits, 2**bits)`` uint8 palette indices
+    """
+    if bits not in _lut_cache:
+        size = 1 << bits
+        centres = (np.arange(size) << (8 - bits)) + (1 << (7 - bits))
+        grid = np.stack(np.meshgrid(centres, centres, centres, indexing="ij"), axis=-1).reshape(-1, 3)
+        distances = ((_srgb_to_lab(grid)[:, None, :] - _srgb_to_lab(PALETTE)[None, :, :]) ** 2).sum(axis=-1)
+        _lut_cache[bits] = distances.argmin(axis=1).astype(np.uint8).reshape(size, size, size)
+    return _lut_cache[bits]
+
+
+def _lookup(rgb, lut):
+    shift = 8 - LUT_BITS
+    return lut[rgb[..., 0] >> shift, rgb[..., 1] >> shift, rgb[..., 2] >> shift]
+
+
+def _as_batch(frames):
+    frames = np.asarray(frames)
+    if frames.dtype != np.uint8 or frames.shape[-1:] != (3,):
+        raise ValueError("Frames must be uint8 RGB")
+    if frames.ndim == 3:
+        return frames[None], True
+    if frames.ndim == 4:
+        return frames, False
+    raise ValueError("Frames must have shape (H, W, 3) or (N, H, W, 3)")
+
+
+def quantize(frames):
+    """
+    Map RGB frames to the nearest inks without dithering.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W, 3)`` or ``(N, H, W, 3)`` uint8 frames
+
+    Returns:
+        numpy.ndarray: ``(H, W)`` or ``(N, H, W)`` uint8 palette indices
+    """
+    batch, single = _as_batch(frames)
+    out = _lookup(batch, palette_lut())
+    return out[0] if single else out
+
+
+def _threshold(frames, matrix):
+    batch, single = _as_batch(frames)
+    _, height, width, _ = batch.shape
+    reps = (-(-height // matrix.shape[0]), -(-width // matrix.shape[1]))
+    offsets = (np.tile(matrix, reps)[:height, :width] / 255.0 - 0.5) * THRESHOLD_SPREAD
+    rgb = np.clip(batch + offsets[None, :, :, None].astype(np.int32), 0, 255)
+    out = _lookup(rgb, palette_lut())
+    return out[0] if single else out
+
+
+def _diffuse_wavefront(frames, kernel, divisor):
+    batch, single = _as_batch(frames)
+    count, height, width, _ = batch.shape
+    lut = palette_lut().reshape(-1)
+    shift = 8 - LUT_BITS
+    # Shear the frames so pixel (y, x) sits in wavefront x + 2y. Every
+    # kernel only reaches one pixel back along later rows, so a wavefront
+    # holds independent pixels. Stored wavefront-major, a wavefront and the
+    # cells its error goes to are contiguous slices rather than gathers.
+    span = width + 2 * (height - 1)
+    skewed = np.zeros((count, span, height, 3), dtype=np.int32)
+    for y in range(height):
+        skewed[:, 2 * y:2 * y + width, y] = batch[:, y]
+    # The taps of each kernel row reach a run of consecutive wavefronts
+    taps = []
+    for dy in sorted({dy for dy, _, _ in kernel}):
+        row = {dx: weight for tap_dy, dx, weight in kernel if tap_dy == dy}
+        weights = [row.get(dx, 0) for dx in range(min(row), max(row) + 1)]
+        taps.append((dy, min(row) + 2 * dy, np.array(weights, dtype=np.int32)[None, :, None, None]))
+    # Room for the kernel to reach two rows down and five wavefronts on
+    acc = np.zeros((count, span + 5, height + 2, 3), dtype=np.int32)
+    indices = np.zeros((count, span, height), dtype=np.uint8)
+    for t in range(span):
+        first = max(0, (t - width + 2) // 2)
+        last = min(height, t // 2 + 1)
+        value = skewed[:, t, first:last] + (acc[:, t, first:last] + divisor // 2) // divisor
+        np.clip(value, 0, 255, out=value)
+        key = value >> shift
+        index = lut[(key[..., 0] << 2 * LUT_BITS) | (key[..., 1] << LUT_BITS) | key[..., 2]]
+        indices[:, t, first:last] = index
+        error = (value - PALETTE[index])[:, None]
+        for dy, offset, weights in taps:
+            # Error pushed off the frame lands in cells no wavefront reads
+            acc[:, t + offset:t + offset + weights.shape[1], first + dy:last + dy] += weights * error
+    out = np.empty((count, height, width), dtype=np.uint8)
+    for y in range(height):
+        out[:, y] = indices[:, 2 * y:2 * y + width, y]
+    return out[0] if single else out
+
+
+def dither_palette(frames, method="floyd-steinberg"):
+    """
+    Dither RGB frames to the 7-colour palette.
+
+    Args:
+        frames (numpy.ndarray): ``(H, W, 3)`` or ``(N, H, W, 3)`` uint8 frames
+        method (str): One of ``METHODS``
+
+    Returns:
+        numpy.ndarray: ``(H, W)`` or ``(N, H, W)`` uint8 palette indices
+
+    Raises:
+        ValueError: If the method is not available for the palette
+    """
+    if method == "floyd-steinberg":
+        return _diffuse_wavefront(frames, *FLOYD_STEINBERG)
+    if method == "atkinson":
+        return _diffuse_wavefront(frames, *ATKINSON)
+    if method == "bayer":
+        return _threshold(frames, bayer_matrix())
+    if method == "blue-noise":
+        return _threshold(frames, blue_noise_matrix())
+    raise ValueError(f"Dither method {method} is not available for the 7-colour palette")
+
+
+def palette_image(indices):
+    """
+    Wrap palette indices in a PIL image carrying the panel palette.
+
+    Args:
+        indices (numpy.ndarray): ``(H, W)`` uint8 palette indices
+
+    Returns:
+        PIL.Image: Mode "P" image
+    """
+    img = Image.fromarray(indices, mode="P")
+    img.putpalette(PALETTE.astype(np.uint8).ravel().tolist())
+    return img
+
+
+def dither_palette_image(img, method="floyd-steinberg"):
+    """
+    Dither a PIL image to a 7-colour mode "P" image.
+
+    Args:
+        img (PIL.Image): Image in any mode
+        method (str): One of ``METHODS``
+
+    Returns:
+        PIL.Image: Mode "P" image whose indices are panel colour codes
+    """
+    return palette_image(dither_palette(np.asarray(img.convert("RGB")), method))
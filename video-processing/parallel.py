@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Process-pool frame processing with shared-memory hand-off.
+
+Decoded frames are copied into a small ring of shared-memory slots and
+processed by a pool of worker processes. Results are yielded strictly in
+frame order, and the number of frames in flight is bounded by the ring
+size so memory stays flat regardless of film length.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shared-memory blocks attached by this worker process, keyed by name
+_attached = {}
+
+
+def _process_shared(slot_name, shape, dtype, func):
+    """
+    Run ``func`` on a frame stored in a shared-memory slot.
+
+    Executed inside a worker process. Attachments are cached so each slot
+    is mapped once per worker rather than once per frame.
+
+    Args:
+        slot_name (str): Name of the shared-memory block
+        shape (tuple): Frame shape
+        dtype (str): Frame dtype
+        func (callable): Frame processing function
+
+    Returns:
+        object: Whatever ``func`` returns
+    """
+    shm = _attached.get(slot_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=slot_name)
+        _attached[slot_name] = shm
+    frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return func(frame)
+
+
+def process_frames_parallel(frames, func, workers, max_in_flight=None, metrics=None):
+    """
+    Apply ``func`` to every frame on a process pool, preserving order.
+
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs
+        func (callable): Picklable function taking a frame
+        workers (int): Number of worker processes
+        max_in_flight (int, optional): Frames queued or being processed at
+            once. Defaults to twice the number of workers.
+        metrics (Metrics, optional): Records the number of frames in flight
+
+    Yields:
+        tuple: ``(timestamp, result, error)`` in frame order, where exactly
+        one of ``result`` and ``error`` is set
+    """
+    max_in_flight = max_in_flight or workers * 2
+    slots = []
+    free_slots = []
+    pending = deque()
+
+    def drain_oldest():
+        timestamp, future, slot = pending.popleft()
+        try:
+            result = future.result(), None
+        except Exception as e:
+            result = None, e
+        free_slots.append(slot)
+        return (timestamp,) + result
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for timestamp, frame in frames:
+            if not free_slots and len(slots) >= max_in_flight:
+                yield drain_oldest()
+
+            if free_slots:
+                slot = free_slots.pop()
+            else:
+                slot = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+                slots.append(slot)
+            if frame.nbytes > slot.size:
+                raise ValueError("Frame size changed during decoding")
+
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=slot.buf)[...] = frame
+            future = executor.submit(_process_shared, slot.name, frame.shape, frame.dtype.str, func)
+            pending.append((timestamp, future, slot))
+            if metrics is not None:
+                metrics.gauge("frames_in_flight", len(pending))
+
+        while pending:
+            yield drain_oldest()
+    finally:
+        for _, future, _ in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        for slot in slots:
+            slot.close()
+            slot.unlink()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Resampling presets for downscaling frames to the panel resolution.
+
+Frames are normally scaled by FFmpeg's ``scale`` filter in the decode
+graph (see ``frame_source.SCALE_FLAGS``); the functions here apply the same
+presets to frames resized in Python, such as ``process_frame`` inputs that
+are not yet at the output size.
+
+- ``fast``: an integer-factor box reduction first, which touches each
+  source pixel once, then a bilinear filter over the small remaining step.
+  After 1-bit dithering it is hard to tell apart from Lanczos.
+- ``balanced``: bicubic, FFmpeg's default scaler. In Python, Pillow reduces
+  by an integer factor first while keeping the kernel at least twice the
+  remaining scale.
+- ``quality``: Lanczos over the full reduction in one step.
+"""
+from PIL import Image
+
+from options import RESAMPLE_PRESETS as PRESETS
+
+# Final filter per preset, and whether to box-reduce before it
+FILTERS = {
+    "fast": (Image.BILINEAR, True),
+    "balanced": (Image.BICUBIC, False),
+    "quality": (Image.LANCZOS, False)
+}
+
+# Pillow's reducing_gap for the balanced preset
+BALANCED_REDUCING_GAP = 2.0
+
+
+def reduce_factor(size, target):
+    """
+    Largest integer factor that keeps a frame at least as large as the target.
+
+    Args:
+        size (tuple): Source ``(width, height)``
+        target (tuple): Output ``(width, height)``
+
+    Returns:
+        int: Reduction factor, 1 when the frame is not larger than the target
+    """
+    return max(1, min(size[0] // target[0], size[1] // target[1]))
+
+
+def resample_image(img, width, height, preset="balanced"):
+    """
+    Resize an image with a preset.
+
+    Args:
+        img (PIL.Image): Image
+        width (int): Output width
+        height (int): Output height
+        preset (str): One of ``PRESETS``
+
+    Returns:
+        PIL.Image: Resized image, or ``img`` itself when it already has the
+        output size
+
+    Raises:
+        ValueError: If the preset is unknown
+    """
+    if preset not in FILTERS:
+        raise ValueError(f"Unknown resampling preset: {preset}")
+    if img.size == (width, height):
+        return img
+    resample, reduce_first = FILTERS[preset]
+    if reduce_first:
+        factor = reduce_factor(img.size, (width, height))
+        if factor > 1:
+            # Box average in C, one pass over the source
+            img = img.reduce(factor)
+        return img.resize((width, height), resample)
+    if preset == "balanced":
+        return img.resize((width, height), resample, reducing_gap=BALANCED_REDUCING_GAP)
+    return img.resize((width, height), resample)
+
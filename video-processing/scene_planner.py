@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Budgeted selection of representative frames.
+
+Sampling on a fixed time grid spends the firmware's picture indices evenly
+on static dialogue and fast action alike. The planner instead scores the
+whole film in one cheap pass: FFmpeg decodes a dense grid of tiny
+grayscale frames, and for every frame two vectorized metrics are computed
+against the one before it:
+
+- mean absolute pixel difference, for motion and change within a shot
+- L1 distance between coarse histograms, the cut detector ``tone.py`` uses
+
+Cuts split the film into shots. Given a frame budget, every shot gets at
+least one frame (the frame closest to the shot's average image) while the
+budget lasts, and the rest of the budget goes to shots in proportion to
+their length and how much they change. Within a shot, extra frames are
+placed at even steps of accumulated change, so they cluster where the
+picture moves.
+
+The result is a timestamp manifest on the scoring grid:
+
+    {"version": 1, "source": <fingerprint>, "rate": "2", "count": 999,
+     "shots": 412, "indexes": [...], "timestamps": [...]}
+
+``video_processor.py --timestamps`` decodes exactly those frames at full
+quality, and ``--budget N`` plans and converts in one run.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from frame_source import iter_frames, parse_rate
+from job_manifest import fingerprint_file
+from options import MAX_PICTURE_INDEX
+from tone import SHOT_BINS, SHOT_THRESHOLD
+
+PLAN_VERSION = 1
+
+# Scoring grid and frame size; 64x36 keeps a two-hour film at 2 fps to
+# about 33 MB of frames
+SCORE_FPS = 2
+SCORE_WIDTH = 64
+SCORE_HEIGHT = 36
+# Frames gathered per allocation and scored per step
+SCORE_CHUNK = 1024
+
+# Share of the budget spread over shots by duration; the rest follows the
+# amount of change
+TIME_WEIGHT = 0.25
+
+# Mean pixel difference treated as grain and compression noise, not change
+NOISE_FLOOR = 0.01
+
+
+def score_frames(frames):
+    """
+    Compute change metrics between consecutive tiny frames.
+
+    Frames are scored ``SCORE_CHUNK`` at a time, each chunk overlapping the
+    previous one by a frame, so the temporaries stay small however long
+    the film is.
+
+    Args:
+        frames (numpy.ndarray): ``(N, H, W)`` uint8 grayscale frames
+
+    Returns:
+        dict: ``difference`` (mean absolute pixel difference in [0, 1]) and
+        ``histogram`` (L1 distance of coarse normalised histograms in
+        [0, 2]) per frame, both 0 for the first frame, and ``cuts``, a
+        boolean array marking frames that start a new shot
+    """
+    count = len(frames)
+    difference = np.zeros(count)
+    histogram = np.zeros(count)
+    flat = frames.reshape(count, -1) if count else frames
+    # Offset each frame's bins so one bincount covers a whole chunk
+    offsets = np.arange(SCORE_CHUNK + 1, dtype=np.int32)[:, None] * SHOT_BINS
+    for start in range(1, count, SCORE_CHUNK):
+        window = flat[start - 1:start + SCORE_CHUNK]
+        size = len(window)
+        difference[start:start + size - 1] = np.abs(window[1:].astype(np.int16) - window[:-1]).mean(axis=1) / 255
+        bins = window // (256 // SHOT_BINS) + offsets[:size]
+        hist = np.bincount(bins.ravel(), minlength=size * SHOT_BINS).reshape(size, SHOT_BINS) / flat.shape[1]
+        histogram[start:start + size - 1] = np.abs(hist[1:] - hist[:-1]).sum(axis=1)
+    return {"difference": difference, "histogram": histogram, "cuts": histogram > SHOT_THRESHOLD}
+
+
+def score_video(video_path, fps=SCORE_FPS, width=SCORE_WIDTH, height=SCORE_HEIGHT):
+    """
+    Decode a video once at a tiny size and score every grid frame.
+
+    FFmpeg delivers the frames as 8-bit luma.
+
+    Args:
+        video_path (str): Path to input video
+        fps (float | str | Fraction): Scoring grid rate
+        width (int): Scoring frame width
+        height (int): Scoring frame height
+
+    Returns:
+        dict: ``frames`` (``(N, height, width)`` uint8) and the metrics from
+        ``score_frames``
+
+    Raises:
+        RuntimeError: If FFmpeg exits with an error
+    """
+    chunks = []
+    chunk = np.empty((SCORE_CHUNK, height, width), dtype=np.uint8)
+    filled = 0
+    # Frames arrive in reused buffers, so each is copied into the chunk
+    for _, frame in iter_frames(video_path, fps, width, height, resample="fast", luma=True):
+        chunk[filled] = frame
+        filled += 1
+        if filled == SCORE_CHUNK:
+            chunks.append(chunk)
+            chunk = np.empty_like(chunk)
+            filled = 0
+    chunks.append(chunk[:filled])
+    frames = np.concatenate(chunks)
+    scores = score_frames(frames)
+    scores["frames"] = frames
+    return scores
+
+
+def _allocate(weights, count, capacity):
+    """Split ``count`` over weights by largest remainder, capped per entry."""
+    allocation = np.zeros(len(weights), dtype=np.int64)
+    open_ = capacity > 0
+    while count > 0 and open_.any():
+        share = np.where(open_, weights, 0.0)
+        share = share / share.sum() * count if share.sum() > 0 else open_ / open_.sum() * count
+        extra = np.floor(share).astype(np.int64)
+        remainder = count - extra.sum()
+        order = np.argsort(-(share - extra), kind="stable")
+        extra[order[:remainder]] += 1
+        extra = np.minimum(extra, capacity - allocation)
+        allocation += extra
+        count -= int(extra.sum())
+        open_ = allocation < capacity
+    return allocation
+
+
+def _spread(change, count):
+    """Pick ``count`` distinct positions at even steps of accumulated change."""
+    length = len(change)
+    cumulative = np.cumsum(change)
+    targets = (np.arange(count) + 0.5) / count * cumulative[-1]
+    positions = np.searchsorted(cumulative, targets)
+    # Keep positions distinct and inside the shot
+    positions = np.maximum.accumulate(positions - np.arange(count)) + np.arange(count)
+    return np.minimum(positions, length - count + np.arange(count))
+
+
+def select_frames(scores, count):
+    """
+    Choose the grid frames that best cover a film within a budget.
+
+    Args:
+        scores (dict): Result of ``score_video``
+        count (int): Frame budget
+
+    Returns:
+        tuple: ``(indexes, shots)`` with the chosen grid indices in
+        ascending order and the number of shots detected
+    """
+    frames = scores["frames"]
+    total = len(frames)
+    starts = np.concatenate([[0], np.flatnonzero(scores["cuts"][1:]) + 1]) if total else np.zeros(0, dtype=int)
+    ends = np.append(starts[1:], total)
+    if count >= total:
+        return list(range(total)), len(starts)
+
+    # Within-shot change, without the jump into the shot
+    change = np.maximum(scores["difference"] - NOISE_FLOOR, 0)
+    change[starts] = 0
+    lengths = ends - starts
+    activity = np.add.reduceat(change, starts) if total else np.zeros(0)
+    weights = TIME_WEIGHT * lengths / total
+    if activity.sum() > 0:
+        weights += (1 - TIME_WEIGHT) * activity / activity.sum()
+    else:
+        weights += (1 - TIME_WEIGHT) * lengths / total
+
+    if count <= len(starts):
+        # Not even one frame per shot: keep the weightiest shots
+        allocation = np.zeros(len(starts), dtype=np.int64)
+        allocation[np.argsort(-weights, kind="stable")[:count]] = 1
+    else:
+        allocation = 1 + _allocate(weights, count - len(starts), lengths - 1)
+
+    indexes = []
+    for start, end, picks in zip(starts, ends, allocation):
+        if picks == 0:
+            continue
+        if picks == 1:
+            # The frame closest to the shot's average image
+            shot = frames[start:end].astype(np.float32)
+            distance = np.abs(shot - shot.mean(axis=0)).reshape(len(shot), -1).mean(axis=1)
+            indexes.append(int(start + distance.argmin()))
+            continue
+        # A time floor keeps static stretches from collapsing to one point
+        steps = change[start:end] + TIME_WEIGHT * max(change[start:end].mean(), 1e-3)
+        indexes.extend(int(start + position) for position in _spread(steps, int(picks)))
+    return sorted(indexes), len(starts)
+
+
+def plan_frames(video_path, count=MAX_PICTURE_INDEX + 1, fps=SCORE_FPS):
+    """
+    Score a video and choose a budget of representative frames.
+
+    Args:
+        video_path (str): Path to input video
+        count (int): Frame budget
+        fps (float | str | Fraction): Scoring grid rate; chosen frames lie
+            on this grid
+
+    Returns:
+        dict: Timestamp manifest
+
+    Raises:
+        ValueError: If the budget is not positive
+        RuntimeError: If FFmpeg exits with an error
+    """
+    if count < 1:
+        raise ValueError("The frame budget must be at least 1")
+    rate = parse_rate(fps)
+    scores = score_video(video_path, rate)
+    indexes, shots = select_frames(scores, count)
+    return {
+        "version": PLAN_VERSION,
+        "source": fingerprint_file(video_path),
+        "rate": str(rate),
+        "count": count,
+        "scored": len(scores["frames"]),
+        "shots": shots,
+        "indexes": indexes,
+        "timestamps": [float(index / rate) for index in indexes]
+    }
+
+
+def write_plan(plan, path):
+    """Write a timestamp manifest atomically."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(plan, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_plan(path, video_path=None):
+    """
+    Read a timestamp manifest.
+
+    Args:
+        path (str): Manifest path
+        video_path (str, optional): Video the manifest must have been made for
+
+    Returns:
+        dict: Timestamp manifest
+
+    Raises:
+        ValueError: If the file is not a valid manifest or belongs to
+            another video
+    """
+    with open(path) as f:
+        plan = json.load(f)
+    if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION or "indexes" not in plan:
+        raise ValueError(f"{path} is not a timestamp manifest")
+    if video_path is not None and plan.get("source") != fingerprint_file(video_path):
+        raise ValueError(f"{path} was planned for a different video")
+    if plan["indexes"] != sorted(set(plan["indexes"])):
+        raise ValueError(f"{path} has unsorted or repeated frames")
+    return plan
+
+
+def load_or_plan(video_path, count, path, fps=SCORE_FPS):
+    """
+    Reuse a matching timestamp manifest, or plan and write a new one.
+
+    Args:
+        video_path (str): Path to input video
+        count (int): Frame budget
+        path (str): Manifest path
+        fps (float | str | Fraction): Scoring grid rate
+
+    Returns:
+        tuple: ``(plan, reused)``
+    """
+    if os.path.exists(path):
+        try:
+            plan = read_plan(path, video_path)
+            if plan["count"] == count and plan["rate"] == str(parse_rate(fps)):
+                return plan, True
+        except ValueError:
+            pass
+    plan = plan_frames(video_path, count, fps)
+    write_plan(plan, path)
+    return plan, False
+
+
+def main():
+    """Command-line interface for planning a frame budget."""
+    parser = argparse.ArgumentParser(description="Choose a budget of representative frames from a video")
+    parser.add_argument("input_video", help="Path to input video file")
+    parser.add_argument("--count", type=int, default=MAX_PICTURE_INDEX + 1,
+                        help=f"Frames to choose (default: {MAX_PICTURE_INDEX + 1}, the firmware's picture indices)")
+    parser.add_argument("--score-fps", default=str(SCORE_FPS),
+                        help=f"Scoring grid rate; chosen frames lie on it (default: {SCORE_FPS})")
+    parser.add_argument("--output", help="Manifest path (default: <input>_plan.json)")
+
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.input_video)[0] + "_plan.json"
+
+    try:
+        plan = plan_frames(args.input_video, args.count, args.score_fps)
+        write_plan(plan, output)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Scored {plan['scored']} frames, found {plan['shots']} shots, chose {len(plan['indexes'])} frames")
+    print(f"Wrote timestamp manifest to {output}")
+
+
+if __name__ == "__main__":
+    main()
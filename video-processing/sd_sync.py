@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Incremental sync of a frame folder to an SD card.
+
+Copying a whole ``<prefix>_frames`` folder to the card after every rerun
+rewrites thousands of unchanged files, which is slow and wears the flash.
+``sync`` instead keeps a manifest on the card with the size and SHA-256 of
+every frame it wrote:
+
+    {"version": 1, "files": {"frame_0000.bmp": {"size": 15062, "sha256": ...}}}
+
+Each run hashes the frames of the current conversion, as listed in its
+job manifest or passed in by ``video_processor``, and compares them with the
+manifest. Without such a list every file in the folder is synced.
+
+- frames missing on the card or with a different hash are written, in
+  playback order, each with a single write of the whole file to a
+  temporary name that is then renamed, so an interrupted sync never leaves
+  a torn frame under its real name
+- frames whose hash matches are left alone, as long as the card file still
+  exists with the recorded size
+- frames the card has but the conversion no longer does are removed, as
+  are leftovers of interrupted writes; other files on the card are kept
+
+A card without a manifest, such as one filled by a plain copy, is read and
+hashed once instead, so matching frames are still not rewritten. The
+report compares the bytes written with a full copy.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from job_manifest import hash_file
+
+MANIFEST_VERSION = 1
+# An 8.3 name, so the firmware's directory scans pay one entry for it
+MANIFEST_NAME = "SYNC.JSN"
+PARTIAL_SUFFIX = ".part"
+FRAME_PATTERN = re.compile(r"^frame_\d+\.bmp$", re.IGNORECASE)
+
+# Files written between manifest saves
+CHECKPOINT_INTERVAL = 50
+
+
+def read_manifest(target):
+    """
+    Read the sync manifest of a card.
+
+    Args:
+        target (str): Card directory
+
+    Returns:
+        dict: ``{name: {"size", "sha256"}}``, or None if the card has no
+        readable manifest
+    """
+    path = os.path.join(target, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest.get("files", {})
+
+
+def write_manifest(target, files, fsync=False):
+    """
+    Write the sync manifest of a card atomically.
+
+    Args:
+        target (str): Card directory
+        files (dict): ``{name: {"size", "sha256"}}`` of the frames on the card
+        fsync (bool): Flush the manifest to the card before returning
+    """
+    path = os.path.join(target, MANIFEST_NAME)
+    tmp_path = path + PARTIAL_SUFFIX
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": dict(sorted(files.items()))}, f)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def list_frames(source):
+    """
+    List the files of a frame folder in playback order.
+
+    Args:
+        source (str): Frame folder
+
+    Returns:
+        list: File names, sorted by name (``frame_XXXX.bmp`` sorts in
+        playback order)
+
+    Raises:
+        ValueError: If the folder does not exist
+    """
+    if not os.path.isdir(source):
+        raise ValueError(f"{source} is not a folder")
+    return sorted(name for name in os.listdir(source)
+                  if not name.startswith(".") and os.path.isfile(os.path.join(source, name)))
+
+
+def job_frames(path):
+    """
+    List the frames of a finished conversion from its job manifest.
+
+    Stale frames of an earlier, longer run may still sit in the frame
+    folder; the manifest names only the frames of the run it records.
+
+    Args:
+        path (str): ``<prefix>_job.json`` of a ``--resume`` run or a merge
+
+    Returns:
+        list: File names in playback order
+
+    Raises:
+        ValueError: If the manifest is unreadable or its run unfinished
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read job manifest {path}: {e}")
+    if not manifest.get("complete"):
+        raise ValueError(f"The run recorded in {path} is unfinished; finish it with --resume first")
+    return [frame["file"] for frame in manifest["frames"]]
+
+
+def card_state(target, manifest):
+    """
+    Hashes of the frames already on the card.
+
+    Entries of the manifest are trusted while the file exists with the
+    recorded size. Without a manifest, frame files on the card are hashed.
+
+    Args:
+        target (str): Card directory
+        manifest (dict): Files of the card's manifest, or None
+
+    Returns:
+        dict: ``{name: {"size", "sha256"}}`` of usable card files
+    """
+    present = {name: os.path.getsize(os.path.join(target, name)) for name in os.listdir(target)
+               if os.path.isfile(os.path.join(target, name))}
+    if manifest is not None:
+        return {name: entry for name, entry in manifest.items() if present.get(name) == entry["size"]}
+    return {name: {"size": size, "sha256": hash_file(os.path.join(target, name))}
+            for name, size in present.items() if FRAME_PATTERN.match(name)}
+
+
+def _copy(source_path, target_path, fsync=False):
+    """Copy one file with a single write to a temporary name, then rename it."""
+    with open(source_path, "rb") as f:
+        data = f.read()
+    tmp_path = target_path + PARTIAL_SUFFIX
+    with open(tmp_path, "wb", buffering=0) as f:
+        f.write(data)
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, target_path)
+    return len(data)
+
+
+def sync(source, target, dry_run=False, fsync=False, progress=None, names=None):
+    """
+    Bring a card directory up to date with a frame folder.
+
+    Args:
+        source (str): Frame folder, such as ``<prefix>_frames``
+        target (str): Card directory; created if missing
+        dry_run (bool): Only report what would be written and removed
+        fsync (bool): Flush every written frame and the manifest to the card
+        progress (callable, optional): Called as ``progress(done, total)``
+            after each written frame
+        names (list, optional): Frame files of the current conversion in
+            playback order; every file in the folder when not given
+
+    Returns:
+        dict: Counts of ``new``, ``changed``, ``unchanged`` and ``removed``
+        files, ``bytes_total`` of a full copy, ``bytes_written``,
+        ``bytes_saved`` and ``seconds``
+
+    Raises:
+        ValueError: If the source is not a folder or a listed frame is missing
+    """
+    started = time.monotonic()
+    if names is None:
+        names = list_frames(source)
+    else:
+        missing = [name for name in names if not os.path.isfile(os.path.join(source, name))]
+        if missing:
+            raise ValueError(f"{len(missing)} listed frames are missing from {source}, such as {missing[0]}")
+    if not dry_run:
+        os.makedirs(target, exist_ok=True)
+    manifest = read_manifest(target) if os.path.isdir(target) else None
+    on_card = card_state(target, manifest) if os.path.isdir(target) else {}
+
+    wanted = {}
+    for name in names:
+        path = os.path.join(source, name)
+        wanted[name] = {"size": os.path.getsize(path), "sha256": hash_file(path)}
+    to_write = [name for name in names if on_card.get(name, {}).get("sha256") != wanted[name]["sha256"]]
+    existing = os.listdir(target) if os.path.isdir(target) else []
+    stale = sorted(name for name in existing
+                   if name not in wanted and name != MANIFEST_NAME
+                   and (name in (manifest or {}) or FRAME_PATTERN.match(name) or name.endswith(PARTIAL_SUFFIX)))
+
+    report = {
+        "new": sum(1 for name in to_write if name not in on_card),
+        "changed": sum(1 for name in to_write if name in on_card),
+        "unchanged": len(names) - len(to_write),
+        "removed": len(stale),
+        "bytes_total": sum(entry["size"] for entry in wanted.values()),
+        "bytes_written": sum(wanted[name]["size"] for name in to_write),
+        "dry_run": dry_run
+    }
+    report["bytes_saved"] = report["bytes_total"] - report["bytes_written"]
+    if dry_run:
+        report["seconds"] = time.monotonic() - started
+        return report
+
+    # Only frames known to be intact are recorded, so an interrupted sync
+    # rewrites whatever it had not finished
+    files = {name: entry for name, entry in on_card.items() if name in wanted}
+    # Free space before writing
+    for name in stale:
+        files.pop(name, None)
+        os.remove(os.path.join(target, name))
+    if stale:
+        write_manifest(target, files, fsync)
+
+    since_checkpoint = 0
+    for done, name in enumerate(to_write, 1):
+        files.pop(name, None)
+        _copy(os.path.join(source, name), os.path.join(target, name), fsync)
+        files[name] = wanted[name]
+        since_checkpoint += 1
+        if since_checkpoint >= CHECKPOINT_INTERVAL:
+            write_manifest(target, files, fsync)
+            since_checkpoint = 0
+        if progress is not None:
+            progress(done, len(to_write))
+    write_manifest(target, files, fsync)
+    report["seconds"] = time.monotonic() - started
+    return report
+
+
+def print_report(report):
+    """Print the summary of ``sync``."""
+    verb = "Would write" if report["dry_run"] else "Wrote"
+    print(f"{verb} {report['new']} new and {report['changed']} changed frames, "
+          f"kept {report['unchanged']}, removed {report['removed']} stale files")
+    total = report["bytes_total"]
+    saved = report["bytes_saved"] / total if total else 0
+    print(f"{report['bytes_written']:,} of {total:,} bytes written "
+          f"({report['bytes_saved']:,} bytes, {saved:.0%}, saved against a full copy)")
+
+
+def main():
+    """Command-line interface for syncing frames to a card."""
+    parser = argparse.ArgumentParser(description="Copy only new and changed frames to an SD card")
+    parser.add_argument("source", help="Frame folder, such as <prefix>_frames")
+    parser.add_argument("target", help="Card directory, such as the mounted card's root")
+    parser.add_argument("--job", metavar="PATH", help="Sync only the frames recorded in this job manifest, such as <prefix>_job.json")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--fsync", action="store_true", help="Flush every frame to the card as it is written")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        names = job_frames(args.job) if args.job else None
+        report = sync(args.source, args.target, dry_run=args.dry_run, fsync=args.fsync, names=names)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
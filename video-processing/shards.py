@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Time-range shards of one conversion, and the merge that stitches them.
+
+A film is split into ``N`` contiguous ranges of its sampling grid (or of
+the frames of a ``scene_planner`` timestamp manifest). Shard ``i`` of ``N``
+seeks to the start of its range, decodes and processes it on its own, and
+names every frame by its position in the whole film, so shards running on
+several cores or build machines can share one ``<prefix>_frames`` folder
+without renumbering.
+
+Each shard records its frames in its own job manifest,
+``<prefix>_shard<i>of<N>_job.json``, with the shard's range as an extra
+``shard`` stage. The merge checks that every shard ran to completion with
+the same settings, that the ranges tile the film and that every position
+has exactly one frame, then writes the stitched ``<prefix>_job.json`` an
+unsharded ``--resume`` run would have written.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+
+from job_manifest import JobManifest
+
+FRAME_PATTERN = re.compile(r"^frame_(\d+)\.bmp$")
+
+# Frame numbers listed per problem before the rest are summarised
+MAX_LISTED = 10
+
+
+def parse_shard(spec):
+    """
+    Parse a shard specification.
+
+    Args:
+        spec (str): ``"i/N"`` with ``1 <= i <= N``
+
+    Returns:
+        tuple: ``(index, count)``
+
+    Raises:
+        ValueError: If the specification is malformed or out of range
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec)
+    if not match:
+        raise ValueError(f"Shard must be given as i/N, not {spec!r}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {index}/{count} is out of range; use 1/{count} to {count}/{count}")
+    return index, count
+
+
+def shard_range(total, index, count):
+    """
+    Positions a shard converts.
+
+    Args:
+        total (int): Frames in the whole film, as estimated from its duration
+            or counted in a timestamp manifest
+        index (int): Shard number, from 1
+        count (int): Number of shards
+
+    Returns:
+        tuple: ``(first, end)`` with ``end`` exclusive, or None for the last
+        shard, which runs to the end of the video in case the estimate is short
+    """
+    first = total * (index - 1) // count
+    end = total * index // count if index < count else None
+    return first, end
+
+
+def shard_manifest_path(output_prefix, index, count):
+    """Path of the job manifest of shard ``index`` of ``count``."""
+    return f"{output_prefix}_shard{index}of{count}_job.json"
+
+
+def frame_number(filename):
+    """
+    Position of a frame in the film, read from its file name.
+
+    Returns:
+        int: Frame number, or None if the name is not ``frame_XXXX.bmp``
+    """
+    match = FRAME_PATTERN.match(filename)
+    return int(match.group(1)) if match else None
+
+
+def _listing(numbers):
+    """Format frame numbers for an error message."""
+    numbers = sorted(numbers)
+    listed = ", ".join(str(number) for number in numbers[:MAX_LISTED])
+    if len(numbers) > MAX_LISTED:
+        listed += f" and {len(numbers) - MAX_LISTED} more"
+    return listed
+
+
+def merge_shards(output_prefix):
+    """
+    Check the shards of a film and stitch their manifests.
+
+    Args:
+        output_prefix (str): Output prefix the shards were run with
+
+    Returns:
+        dict: ``shards`` and ``frames`` counts and the ``path`` of the
+        stitched job manifest
+
+    Raises:
+        ValueError: If a shard is missing, unfinished or ran with other
+            settings, or if frames are missing or claimed twice
+    """
+    pattern = f"{glob.escape(output_prefix)}_shard*of*_job.json"
+    manifests = {}
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            manifest = json.load(f)
+        shard = manifest.get("stages", {}).get("shard")
+        if shard is None or path != shard_manifest_path(output_prefix, shard["index"], shard["count"]):
+            raise ValueError(f"{path} is not a shard manifest")
+        manifests.setdefault(shard["count"], {})[shard["index"]] = manifest
+    if not manifests:
+        raise ValueError(f"No shard manifests found for {output_prefix}")
+    if len(manifests) > 1:
+        raise ValueError(f"Shards of different splits ({', '.join(map(str, sorted(manifests)))} shards) "
+                         f"share {output_prefix}; remove the stale manifests")
+    (count, shards), = manifests.items()
+
+    missing = sorted(set(range(1, count + 1)) - set(shards))
+    if missing:
+        raise ValueError(f"No manifest for shards {', '.join(map(str, missing))} of {count}; have they run?")
+    unfinished = [index for index in sorted(shards) if not shards[index].get("complete")]
+    if unfinished:
+        raise ValueError(f"Shards {', '.join(map(str, unfinished))} of {count} are unfinished")
+
+    stages = {name: params for name, params in shards[1]["stages"].items() if name != "shard"}
+    for index in sorted(shards):
+        other = {name: params for name, params in shards[index]["stages"].items() if name != "shard"}
+        if other != stages:
+            raise ValueError(f"Shard {index} ran with different settings from shard 1")
+
+    expected_first = 0
+    for index in range(1, count + 1):
+        shard = shards[index]["stages"]["shard"]
+        if shard["first"] != expected_first or (shard["end"] is None) != (index == count):
+            raise ValueError(f"Shard ranges do not tile the film at shard {index}; "
+                             f"were the shards split from the same video and settings?")
+        expected_first = shard["end"]
+
+    frames_folder = f"{output_prefix}_frames"
+    claimed = {}
+    overlaps = set()
+    gaps = set()
+    for index in range(1, count + 1):
+        shard = shards[index]["stages"]["shard"]
+        last = shard["first"] - 1
+        for frame in shards[index]["frames"]:
+            number = frame_number(frame["file"])
+            if number is None:
+                raise ValueError(f"Shard {index} wrote {frame['file']}; only BMP frames can be merged")
+            if number in claimed or number < shard["first"] or (shard["end"] is not None and number >= shard["end"]):
+                overlaps.add(number)
+            claimed[number] = frame
+            last = max(last, number)
+        end = shard["end"] if shard["end"] is not None else last + 1
+        gaps.update(number for number in range(shard["first"], end) if number not in claimed)
+    gaps.update(number for number, frame in claimed.items()
+                if not os.path.exists(os.path.join(frames_folder, frame["file"])))
+
+    problems = []
+    if gaps:
+        problems.append(f"missing frames {_listing(gaps)}")
+    if overlaps:
+        problems.append(f"frames written by more than one shard or outside their range: {_listing(overlaps)}")
+    if problems:
+        raise ValueError(f"Cannot merge {count} shards of {output_prefix}: " + "; ".join(problems))
+
+    job = JobManifest(f"{output_prefix}_job.json", stages)
+    job.frames = [claimed[number] for number in sorted(claimed)]
+    job.mark_complete()
+    return {"shards": count, "frames": len(job.frames), "path": job.path}
+
+
+def main():
+    """Command-line interface for merging shards."""
+    parser = argparse.ArgumentParser(description="Check the shards of a conversion and stitch their manifests")
+    parser.add_argument("output_prefix", help="Output prefix the shards were run with")
+
+    args = parser.parse_args()
+
+    try:
+        merged = merge_shards(args.output_prefix)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Merged {merged['shards']} shards: {merged['frames']} frames, no gaps or overlaps")
+    print(f"Wrote job manifest to {merged['path']}")
+
+
+if __name__ == "__main__":
+    main()
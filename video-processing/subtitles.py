@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+In-process subtitle rendering on sampled, downscaled frames.
+
+SRT and WebVTT files are parsed once into a sorted index of disjoint
+intervals, each holding the text on screen during it, so each sampled
+frame's cue is found with one bisect. Text is drawn at output resolution
+after scaling and before dithering, only on frames with an active cue,
+from a cache of rendered glyphs: white with a black outline so it stays
+legible at 1 bit.
+
+Styled ``.ass``/``.ssa`` subtitles are still rendered by FFmpeg's
+``subtitles`` filter in the decode graph.
+"""
+import bisect
+import html
+import re
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Subtitle formats parsed here; anything else goes to FFmpeg
+FORMATS = (".srt", ".vtt")
+
+# Bold sans font looked up in the system font folders, before Pillow's own
+FONT_NAME = "DejaVuSans-Bold.ttf"
+
+# Font size as a fraction of the frame height, with a floor for small frames
+FONT_SCALE = 1 / 15
+MIN_FONT_SIZE = 10
+
+# Fraction of the frame width text may span, and the bottom margin
+MAX_TEXT_WIDTH = 0.9
+BOTTOM_MARGIN = 1 / 20
+
+_TIMING = re.compile(r"((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})")
+_TAG = re.compile(r"<[^>]*>|\{\\[^}]*\}")
+
+
+def parse_timestamp(text):
+    """
+    Parse an SRT or WebVTT timestamp.
+
+    Args:
+        text (str): ``HH:MM:SS,mmm``, ``HH:MM:SS.mmm`` or ``MM:SS.mmm``
+
+    Returns:
+        float: Seconds
+    """
+    fields = text.replace(",", ".").split(":")
+    hours = int(fields[-3]) if len(fields) > 2 else 0
+    return hours * 3600 + int(fields[-2]) * 60 + float(fields[-1])
+
+
+def parse_cues(text):
+    """
+    Extract cues from SRT or WebVTT text.
+
+    Both formats are blocks separated by blank lines with a
+    ``start --> end`` timing line followed by the cue text, so one parser
+    handles both. Formatting tags are stripped.
+
+    Args:
+        text (str): Subtitle file contents
+
+    Returns:
+        list: ``(start, end, text)`` tuples in file order
+    """
+    cues = []
+    for block in re.split(r"\n\s*\n", text.replace("\r\n", "\n").replace("\r", "\n")):
+        lines = block.strip("\n").split("\n")
+        for i, line in enumerate(lines):
+            match = _TIMING.search(line)
+            if match:
+                body = "\n".join(_TAG.sub("", cue_line).strip() for cue_line in lines[i + 1:]).strip()
+                start, end = parse_timestamp(match.group(1)), parse_timestamp(match.group(2))
+                if body and end > start:
+                    cues.append((start, end, html.unescape(body)))
+                break
+    return cues
+
+
+class CueIndex:
+    """
+    Sorted, disjoint intervals of on-screen subtitle text.
+
+    Overlapping cues are split at every start and end, and each piece shows
+    the text of all cues covering it, in file order.
+
+    Args:
+        cues (list): ``(start, end, text)`` tuples
+    """
+
+    def __init__(self, cues):
+        bounds = sorted({time for start, end, _ in cues for time in (start, end)})
+        # Sweep the boundaries once, opening and closing cues in time order;
+        # cues are keyed by file position so pieces list them in file order
+        spans = [(start, end, i) for i, (start, end, _) in enumerate(cues) if start < end]
+        opening = sorted(spans)
+        closing = sorted(spans, key=lambda span: span[1])
+        active = set()
+        opened = closed = 0
+        self.starts = []
+        self.ends = []
+        self.texts = []
+        for start, end in zip(bounds, bounds[1:]):
+            while opened < len(opening) and opening[opened][0] <= start:
+                active.add(opening[opened][2])
+                opened += 1
+            while closed < len(closing) and closing[closed][1] <= start:
+                active.discard(closing[closed][2])
+                closed += 1
+            if active:
+                self.starts.append(start)
+                self.ends.append(end)
+                self.texts.append("\n".join(cues[i][2] for i in sorted(active)))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Parse an SRT or WebVTT file.
+
+        Args:
+            path (str): Subtitle file
+
+        Returns:
+            CueIndex: Index of the file's cues
+        """
+        with open(path, encoding="utf-8-sig", errors="replace") as f:
+            return cls(parse_cues(f.read()))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, timestamp):
+        """
+        Find the text on screen at a timestamp.
+
+        Args:
+            timestamp (float): Seconds
+
+        Returns:
+            str: Cue text, or None if no cue is active
+        """
+        i = bisect.bisect_right(self.starts, timestamp) - 1
+        if i >= 0 and timestamp < self.ends[i]:
+            return self.texts[i]
+        return None
+
+
+def load_font(size, font_path=None):
+    """
+    Load a TrueType font, falling back to Pillow's built-in font.
+
+    Args:
+        size (int): Font size in pixels
+        font_path (str, optional): Font file; defaults to ``FONT_NAME``
+
+    Returns:
+        PIL.ImageFont.ImageFont: Font
+    """
+    try:
+        return ImageFont.truetype(font_path or FONT_NAME, size)
+    except OSError:
+        if font_path:
+            raise
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow before 10.1 only has a fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+class GlyphAtlas:
+    """
+    Rendered glyph masks and advances, cached per character.
+
+    Args:
+        size (int): Font size in pixels
+        font_path (str, optional): Font file
+    """
+
+    def __init__(self, size, font_path=None):
+        self.font = load_font(size, font_path)
+        ascent, descent = self.font.getmetrics()
+        self.line_height = ascent + descent
+        self.glyphs = {}
+
+    def glyph(self, char):
+        """
+        Render a character once.
+
+        Args:
+            char (str): Character
+
+        Returns:
+            tuple: ``(mask, advance)`` with ``mask`` a boolean
+            ``(line_height, width)`` array and ``advance`` in pixels
+        """
+        if char not in self.glyphs:
+            advance = int(round(self.font.getlength(char)))
+            right = self.font.getbbox(char)[2] if char.strip() else advance
+            img = Image.new("L", (max(advance, right, 1), self.line_height))
+            ImageDraw.Draw(img).text((0, 0), char, font=self.font, fill=255)
+            self.glyphs[char] = (np.asarray(img) > 127, advance)
+        return self.glyphs[char]
+
+    def width(self, text):
+        """Advance width of a line in pixels."""
+        return sum(self.glyph(char)[1] for char in text)
+
+    def wrap(self, text, max_width):
+        """
+        Break text into lines no wider than ``max_width`` where possible.
+
+        Args:
+            text (str): Text with optional explicit line breaks
+            max_width (int): Width in pixels
+
+        Returns:
+            list: Lines
+        """
+        lines = []
+        for paragraph in text.split("\n"):
+            line = ""
+            for word in paragraph.split():
+                candidate = f"{line} {word}" if line else word
+                if line and self.width(candidate) > max_width:
+                    lines.append(line)
+                    line = word
+                else:
+                    line = candidate
+            if line:
+                lines.append(line)
+        return lines
+
+    def render_line(self, line):
+        """
+        Compose a line from cached glyphs.
+
+        Args:
+            line (str): Text without line breaks
+
+        Returns:
+            numpy.ndarray: Boolean ``(line_height, width)`` mask
+        """
+        glyphs = [self.glyph(char) for char in line]
+        width, x = 1, 0
+        for mask, advance in glyphs:
+            # Italic and wide glyphs can reach past their advance
+            width = max(width, x + mask.shape[1])
+            x += advance
+        out = np.zeros((self.line_height, width), dtype=bool)
+        x = 0
+        for mask, advance in glyphs:
+            out[:, x:x + mask.shape[1]] |= mask
+            x += advance
+        return out
+
+
+class SubtitleRenderer:
+    """
+    Draw cue text onto frames of one size.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+        font_path (str, optional): Font file
+    """
+
+    def __init__(self, width, height, font_path=None):
+        self.width = width
+        self.height = height
+        self.atlas = GlyphAtlas(max(MIN_FONT_SIZE, round(height * FONT_SCALE)), font_path)
+        self.outline = max(1, self.atlas.line_height // 12)
+        # Consecutive samples usually share a cue, so keep recent layouts
+        self.layout = lru_cache(maxsize=32)(self._layout)
+
+    def _layout(self, text):
+        """Render text to ``(top, left, text_mask, outline_mask)`` for this frame size."""
+        pad = self.outline
+        lines = [self.atlas.render_line(line) for line in
+                 self.atlas.wrap(text, int(self.width * MAX_TEXT_WIDTH) - 2 * pad)]
+        if not lines:
+            return None
+        block_width = max(line.shape[1] for line in lines) + 2 * pad
+        block = np.zeros((self.atlas.line_height * len(lines) + 2 * pad, block_width), dtype=bool)
+        for i, line in enumerate(lines):
+            # Centre each line
+            left = pad + (block_width - 2 * pad - line.shape[1]) // 2
+            top = pad + i * self.atlas.line_height
+            block[top:top + line.shape[0], left:left + line.shape[1]] = line
+        outline = block.copy()
+        for dy in range(-pad, pad + 1):
+            for dx in range(-pad, pad + 1):
+                outline |= np.roll(np.roll(block, dy, axis=0), dx, axis=1)
+        top = self.height - int(self.height * BOTTOM_MARGIN) - block.shape[0]
+        left = (self.width - block_width) // 2
+        # Clip blocks larger than the frame
+        crop_top, crop_left = max(0, -top), max(0, -left)
+        block = block[crop_top:crop_top + self.height, crop_left:crop_left + self.width]
+        outline = outline[crop_top:crop_top + self.height, crop_left:crop_left + self.width]
+        return max(top, 0), max(left, 0), block, outline
+
+    def draw(self, frame, text):
+        """
+        Draw text onto a copy of a frame.
+
+        Args:
+            frame (numpy.ndarray): ``(H, W)`` grayscale or ``(H, W, 3)`` RGB
+                uint8 frame
+            text (str): Cue text
+
+        Returns:
+            numpy.ndarray: Frame with the text burned in
+        """
+        layout = self.layout(text)
+        if layout is None:
+            return frame
+        top, left, block, outline = layout
+        out = np.array(frame)
+        region = out[top:top + block.shape[0], left:left + block.shape[1]]
+        region[outline] = 0
+        region[block] = 255
+        return out
+
+
+def burn_subtitles(frames, cues, renderer):
+    """
+    Draw each frame's active cue onto it.
+
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs at output resolution
+        cues (CueIndex): Subtitle cues
+        renderer (SubtitleRenderer): Renderer for the frame size
+
+    Yields:
+        tuple: ``(timestamp, frame)``; frames without a cue are passed
+        through untouched
+    """
+    for timestamp, frame in frames:
+        text = cues.lookup(timestamp)
+        if text is not None:
+            frame = renderer.draw(frame, text)
+        yield timestamp, frame
@@ -0,0 +1,28 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# The tools are flat scripts; make them importable as modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="FFmpeg is not installed")
+
+
+@pytest.fixture(scope="session")
+def scenes_video(tmp_path_factory):
+    """A 6 s, 3-scene clip with a shot change every 2 s."""
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("FFmpeg is not installed")
+    path = str(tmp_path_factory.mktemp("video") / "scenes.mp4")
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc=s=320x240:r=10:d=2",
+        "-f", "lavfi", "-i", "smptebars=s=320x240:r=10:d=2",
+        "-f", "lavfi", "-i", "color=c=0x303030:s=320x240:r=10:d=2,noise=alls=40:allf=t",
+        "-filter_complex", "[0][1][2]concat=n=3:v=1:a=0,format=yuv420p",
+        path
+    ], check=True)
+    return path
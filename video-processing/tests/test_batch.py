@@ -0,0 +1,97 @@
+import json
+import os
+import time
+
+import pytest
+
+from batch import DEFAULT_OPTIONS, BatchScheduler, Job, group_jobs, load_jobs_file
+from conftest import requires_ffmpeg
+
+
+def make_job(video, prefix, **options):
+    return Job(video, prefix, dict(DEFAULT_OPTIONS, **options))
+
+
+def test_mono_jobs_on_one_source_share_a_decode(scenes_video, tmp_path):
+    jobs = [make_job(scenes_video, str(tmp_path / "a")), make_job(scenes_video, str(tmp_path / "b"), dither="atkinson")]
+    groups, failed = group_jobs(jobs)
+    assert failed == []
+    assert groups == [jobs]
+    assert "--cache" in jobs[0].command(1, str(tmp_path / "cache"), shared=True)
+
+
+def test_colour_jobs_never_share_or_force_the_cache(scenes_video, tmp_path):
+    jobs = [make_job(scenes_video, str(tmp_path / "a"), palette="7color"),
+            make_job(scenes_video, str(tmp_path / "b"), palette="7color", dither="atkinson")]
+    groups, _ = group_jobs(jobs)
+    assert groups == [[jobs[0]], [jobs[1]]]
+    assert "--cache" not in jobs[0].command(1, str(tmp_path / "cache"), shared=True)
+
+
+def test_palette_is_part_of_the_decode_key(scenes_video, tmp_path):
+    mono = make_job(scenes_video, str(tmp_path / "a"))
+    colour = make_job(scenes_video, str(tmp_path / "b"), palette="7color")
+    assert mono.decode_key() != colour.decode_key()
+
+
+def test_unreadable_source_fails_its_job_only(scenes_video, tmp_path):
+    jobs = [make_job(str(tmp_path / "missing.mp4"), str(tmp_path / "a")), make_job(scenes_video, str(tmp_path / "b"))]
+    groups, failed = group_jobs(jobs)
+    assert failed == [jobs[0]] and jobs[0].status == "failed"
+    assert groups == [[jobs[1]]]
+
+
+@requires_ffmpeg
+def test_two_colour_jobs_on_one_source_both_finish(scenes_video, tmp_path):
+    scheduler = BatchScheduler(str(tmp_path / "out"), decodes=2, workers=2, cache_dir=str(tmp_path / "cache"))
+    options = dict(DEFAULT_OPTIONS, palette="7color", width=80, height=60)
+    jobs = [scheduler.make_job(scenes_video, dict(options)),
+            scheduler.make_job(scenes_video, dict(options, dither="bayer"))]
+    scheduler.submit(jobs)
+    scheduler.wait()
+    scheduler.shutdown()
+    for job in jobs:
+        assert job.status == "done", open(job.log_path).read()
+        assert job.frames == 6
+        assert os.path.isdir(job.prefix + "_frames")
+
+
+def test_planned_jobs_never_share_or_force_the_cache(scenes_video, tmp_path):
+    plan = tmp_path / "plan.json"
+    plan.write_text("{}")
+    for options in ({"budget": 3}, {"timestamps": str(plan)}):
+        jobs = [make_job(scenes_video, str(tmp_path / "a"), **options),
+                make_job(scenes_video, str(tmp_path / "b"), dither="atkinson", **options)]
+        groups, _ = group_jobs(jobs)
+        assert groups == [[jobs[0]], [jobs[1]]]
+        assert "--cache" not in jobs[0].command(1, str(tmp_path / "cache"), shared=True)
+
+
+def test_jobs_file_rejects_unknown_option_values(tmp_path):
+    jobs = tmp_path / "jobs.json"
+    jobs.write_text(json.dumps([{"input": "a.mp4", "options": {"dither": "halftone"}}]))
+    with pytest.raises(ValueError, match="Invalid dither"):
+        load_jobs_file(str(jobs))
+
+
+def test_frame_count_leaves_out_stale_frames(tmp_path):
+    job = make_job("a.mp4", str(tmp_path / "a"))
+    frames_dir = tmp_path / "a_frames"
+    frames_dir.mkdir()
+    for index in range(5):
+        (frames_dir / f"frame_{index:05d}.bmp").write_bytes(b"")
+        os.utime(frames_dir / f"frame_{index:05d}.bmp", (1000, 1000))
+    job.started = time.time()
+    for index in range(2):
+        (frames_dir / f"frame_{index:05d}.bmp").write_bytes(b"BM")
+    assert job.count_frames() == 2
+
+
+def test_resumed_frame_count_comes_from_the_job_manifest(tmp_path):
+    job = make_job("a.mp4", str(tmp_path / "a"), resume=True)
+    (tmp_path / "a_job.json").write_text(json.dumps({"frames": [{"timestamp": 0.0}, {"timestamp": 1.0}]}))
+    frames_dir = tmp_path / "a_frames"
+    frames_dir.mkdir()
+    for index in range(4):
+        (frames_dir / f"frame_{index:05d}.bmp").write_bytes(b"")
+    assert job.count_frames() == 2
@@ -0,0 +1,26 @@
+import frame_source
+from conftest import requires_ffmpeg
+from frame_source import choose_strategy, strategy_costs
+
+
+def test_seeks_are_capped_at_the_cpu_count(monkeypatch):
+    monkeypatch.setattr(frame_source.os, "cpu_count", lambda: 1)
+    _, single, workers = strategy_costs(25, 2, 25, pixels=1280 * 720, seek_workers=4)
+    assert workers == 1
+    monkeypatch.setattr(frame_source.os, "cpu_count", lambda: 8)
+    _, parallel, workers = strategy_costs(25, 2, 25, pixels=1280 * 720, seek_workers=4)
+    assert workers == 4 and parallel == single / 4
+
+
+def test_default_rate_on_a_two_second_gop_decodes_sequentially(monkeypatch):
+    # 1 fps from 25 fps with a 2 s GOP: a seek decodes more than the gap
+    for cpus in (1, 4, 16):
+        monkeypatch.setattr(frame_source.os, "cpu_count", lambda: cpus)
+        sequential, seek, _ = strategy_costs(25, 2, 25, pixels=1280 * 720)
+        assert seek > sequential
+
+
+@requires_ffmpeg
+def test_auto_needs_samples_several_gops_apart(scenes_video):
+    strategy, info = choose_strategy(scenes_video, 1)
+    assert strategy == "sequential" and "GOPs apart" in info["reason"]
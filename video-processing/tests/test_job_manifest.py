@@ -0,0 +1,106 @@
+import filecmp
+import json
+import os
+import threading
+
+import pytest
+
+from conftest import requires_ffmpeg
+from job_manifest import JobManifest
+from video_processor import ProcessingCancelled, process_video
+
+STAGES = {
+    "decode": {"source": "abc", "fps": "1"},
+    "scale": {"width": 400, "height": 300, "crop": False, "resample": "balanced"},
+    "select": {"dedup_distance": None, "dedup_window": 4},
+    "render": {"dither": "floyd-steinberg", "tone": "shot", "palette": "mono"}
+}
+
+
+def previous_run(tmp_path, complete, frames=3):
+    path = str(tmp_path / "out_job.json")
+    job = JobManifest(path, STAGES)
+    for index in range(frames):
+        (tmp_path / f"frame_{index:04d}.bmp").write_bytes(b"frame")
+        job.commit(f"frame_{index:04d}.bmp", float(index), str(tmp_path / f"frame_{index:04d}.bmp"))
+    job.complete = complete
+    job.save()
+    return path
+
+
+def changed(stage, **params):
+    return dict(STAGES, **{stage: dict(STAGES[stage], **params)})
+
+
+@pytest.mark.parametrize("stage, params", [("scale", {"width": 800}), ("render", {"dither": "bayer"})])
+def test_scale_or_render_change_keeps_the_selection(tmp_path, stage, params):
+    path = previous_run(tmp_path, complete=True)
+    job = JobManifest.open(path, changed(stage, **params), str(tmp_path))
+    assert job.frames == [] and job.planned == [0.0, 1.0, 2.0] and job.planned_until is None
+
+
+def test_interrupted_run_continues_after_its_selection(tmp_path):
+    path = previous_run(tmp_path, complete=False)
+    job = JobManifest.open(path, changed("scale", height=480), str(tmp_path))
+    assert job.planned == [0.0, 1.0, 2.0] and job.planned_until == 2.0
+
+
+@pytest.mark.parametrize("stage, params", [("decode", {"fps": "2"}), ("select", {"dedup_distance": 4})])
+def test_decode_or_select_change_starts_over(tmp_path, stage, params):
+    path = previous_run(tmp_path, complete=True)
+    job = JobManifest.open(path, changed(stage, **params), str(tmp_path))
+    assert job.frames == [] and job.planned is None
+
+
+def test_unchanged_run_keeps_matching_frames(tmp_path):
+    path = previous_run(tmp_path, complete=False)
+    (tmp_path / "frame_0001.bmp").write_bytes(b"edited")
+    job = JobManifest.open(path, STAGES, str(tmp_path))
+    assert [frame["file"] for frame in job.frames] == ["frame_0000.bmp"] and not job.complete
+
+
+@requires_ffmpeg
+def test_render_change_after_an_interrupted_run_matches_a_fresh_run(scenes_video, tmp_path):
+    options = dict(fps=5, width=80, height=60, dedup_distance=6, tone="frame")
+    fresh, resumed = str(tmp_path / "fresh"), str(tmp_path / "resumed")
+    process_video(scenes_video, fresh, dither="atkinson", **options)
+
+    cancel = threading.Event()
+
+    def stop_after_four(done, total):
+        if done >= 4:
+            cancel.set()
+
+    with pytest.raises(ProcessingCancelled):
+        process_video(scenes_video, resumed, resume=True, progress=stop_after_four, cancel=cancel, **options)
+    process_video(scenes_video, resumed, resume=True, dither="atkinson", **options)
+
+    names = sorted(os.listdir(fresh + "_frames"))
+    assert sorted(os.listdir(resumed + "_frames")) == names
+    _, mismatch, errors = filecmp.cmpfiles(fresh + "_frames", resumed + "_frames", names, shallow=False)
+    assert mismatch == [] and errors == []
+
+
+@requires_ffmpeg
+def test_resumed_deduplication_keeps_its_window_and_groups(scenes_video, tmp_path):
+    # At distance 2 the frame at 1.8s matches the one at 0.0s, three kept frames back
+    options = dict(fps=5, width=80, height=60, dedup_distance=2, tone="frame")
+    fresh, resumed = str(tmp_path / "fresh"), str(tmp_path / "resumed")
+    process_video(scenes_video, fresh, **options)
+
+    cancel = threading.Event()
+
+    def stop_after_three(done, total):
+        if done >= 3:
+            cancel.set()
+
+    with pytest.raises(ProcessingCancelled):
+        process_video(scenes_video, resumed, resume=True, progress=stop_after_three, cancel=cancel, **options)
+    process_video(scenes_video, resumed, resume=True, **options)
+
+    names = sorted(os.listdir(fresh + "_frames"))
+    assert sorted(os.listdir(resumed + "_frames")) == names
+    _, mismatch, errors = filecmp.cmpfiles(fresh + "_frames", resumed + "_frames", names, shallow=False)
+    assert mismatch == [] and errors == []
+    with open(fresh + "_dedup.json") as f, open(resumed + "_dedup.json") as g:
+        assert json.load(f) == json.load(g)
@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from firmware_emulator import EPD_HEIGHT, EPD_WIDTH, FirmwareEmulator, get_bmp_filename
+from output_sink import Bmp4Encoder
+from palette import PALETTE
+
+
+def palette_frame(indices):
+    img = Image.fromarray(indices.astype(np.uint8), mode="P")
+    img.putpalette(np.asarray(PALETTE, dtype=np.uint8).tobytes())
+    return img
+
+
+def encode(indices):
+    height, width = indices.shape
+    encoder = Bmp4Encoder(width, height, PALETTE)
+    return bytes(encoder.encode(palette_frame(indices), bytearray(encoder.size))), encoder
+
+
+def test_4bpp_rows_are_stored_bottom_up_with_a_positive_height():
+    indices = np.zeros((4, 6), dtype=np.uint8)
+    indices[0] = [1, 2, 3, 4, 5, 6]
+    data, encoder = encode(indices)
+    assert int.from_bytes(data[22:26], "little", signed=True) == 4
+    offset = int.from_bytes(data[10:14], "little")
+    last_row = offset + 3 * encoder.stride
+    assert data[last_row:last_row + encoder.row_bytes] == bytes([0x12, 0x34, 0x56])
+    assert data[offset:offset + encoder.row_bytes] == bytes(3)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(data))), indices)
+
+
+def test_firmware_accepts_4bpp_frames_as_they_are(tmp_path):
+    data, _ = encode(np.ones((EPD_HEIGHT, EPD_WIDTH), dtype=np.uint8))
+    (tmp_path / get_bmp_filename(0)).write_bytes(data)
+    report = FirmwareEmulator(str(tmp_path)).wake()
+    assert report["decoded"], report["error"]
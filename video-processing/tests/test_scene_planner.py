@@ -0,0 +1,14 @@
+import numpy as np
+
+from scene_planner import SCORE_CHUNK, score_frames
+
+
+def test_cuts_are_found_across_chunk_edges():
+    frames = np.full((2 * SCORE_CHUNK + 10, 4, 8), 20, dtype=np.uint8)
+    cuts = [5, SCORE_CHUNK, SCORE_CHUNK + 1, 2 * SCORE_CHUNK + 1]
+    for index, cut in enumerate(cuts):
+        frames[cut:] = 200 if index % 2 == 0 else 20
+    scores = score_frames(frames)
+    assert list(np.flatnonzero(scores["cuts"])) == cuts
+    assert np.allclose(scores["difference"][cuts], 180 / 255)
+    assert scores["difference"].sum() == scores["difference"][cuts].sum()
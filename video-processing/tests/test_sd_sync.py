@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from conftest import requires_ffmpeg
+from job_manifest import JobManifest
+from sd_sync import MANIFEST_NAME, job_frames, read_manifest, sync
+from video_processor import process_video
+
+
+def make_frames(folder, count, content=b"frame"):
+    folder.mkdir(exist_ok=True)
+    for index in range(count):
+        (folder / f"frame_{index:04d}.bmp").write_bytes(content + bytes([index]))
+
+
+def test_rerun_writes_only_changed_frames(tmp_path):
+    source, card = tmp_path / "frames", tmp_path / "card"
+    make_frames(source, 3)
+    assert sync(str(source), str(card))["new"] == 3
+
+    (source / "frame_0001.bmp").write_bytes(b"edited")
+    report = sync(str(source), str(card))
+    assert (report["new"], report["changed"], report["unchanged"]) == (0, 1, 2)
+    assert report["bytes_written"] == len(b"edited")
+    assert read_manifest(str(card))["frame_0001.bmp"]["size"] == len(b"edited")
+    assert sync(str(source), str(card))["bytes_written"] == 0
+
+
+def test_listed_frames_leave_stale_ones_behind(tmp_path):
+    source, card = tmp_path / "frames", tmp_path / "card"
+    make_frames(source, 5)
+    sync(str(source), str(card))
+    (card / "notes.txt").write_text("kept")
+
+    report = sync(str(source), str(card), names=["frame_0000.bmp", "frame_0001.bmp"])
+    assert report["removed"] == 3
+    assert sorted(path.name for path in card.iterdir()) == [MANIFEST_NAME, "frame_0000.bmp", "frame_0001.bmp",
+                                                            "notes.txt"]
+    assert sorted(read_manifest(str(card))) == ["frame_0000.bmp", "frame_0001.bmp"]
+    with pytest.raises(ValueError, match="missing"):
+        sync(str(source), str(card), names=["frame_0009.bmp"])
+
+
+def test_job_frames_needs_a_finished_run(tmp_path):
+    make_frames(tmp_path / "frames", 2)
+    job = JobManifest(str(tmp_path / "out_job.json"), {})
+    for index in range(2):
+        job.commit(f"frame_{index:04d}.bmp", float(index), str(tmp_path / "frames" / f"frame_{index:04d}.bmp"))
+    job.save()
+    with pytest.raises(ValueError, match="unfinished"):
+        job_frames(job.path)
+    job.mark_complete()
+    assert job_frames(job.path) == ["frame_0000.bmp", "frame_0001.bmp"]
+
+
+@requires_ffmpeg
+def test_conversion_syncs_only_its_own_frames(scenes_video, tmp_path):
+    prefix, card = str(tmp_path / "out"), tmp_path / "card"
+    process_video(scenes_video, prefix, fps=2, width=80, height=60)
+    process_video(scenes_video, prefix, fps=1, width=80, height=60, sync_target=str(card))
+    with open(card / MANIFEST_NAME) as f:
+        assert sorted(json.load(f)["files"]) == [f"frame_{index:04d}.bmp" for index in range(6)]
@@ -0,0 +1,58 @@
+import filecmp
+import json
+import os
+
+import pytest
+
+from conftest import requires_ffmpeg
+from shards import merge_shards, shard_manifest_path, shard_range
+from video_processor import process_video, process_video_sharded
+
+
+def test_shard_ranges_tile_the_grid():
+    ranges = [shard_range(60, index, 4) for index in range(1, 5)]
+    assert ranges == [(0, 15), (15, 30), (30, 45), (45, None)]
+
+
+def test_global_tone_is_rejected_when_sharding(tmp_path):
+    with pytest.raises(ValueError, match="global tone"):
+        process_video("missing.mp4", str(tmp_path / "out"), tone="global", shard=(1, 2))
+    with pytest.raises(ValueError, match="global tone"):
+        process_video_sharded("missing.mp4", str(tmp_path / "out"), 2, tone="global")
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize("tone", ["frame", "shot"])
+def test_merged_shards_match_an_unsharded_run(scenes_video, tmp_path, tone):
+    # Shard edges at 1.5 s, 3 s and 4.5 s fall inside the 2 s shots
+    whole, sharded = str(tmp_path / "whole"), str(tmp_path / "sharded")
+    options = dict(fps=10, width=80, height=60, tone=tone)
+    process_video(scenes_video, whole, **options)
+    for index in (1, 2, 3, 4):
+        process_video(scenes_video, sharded, shard=(index, 4), **options)
+
+    merged = merge_shards(sharded)
+    assert merged["shards"] == 4 and merged["frames"] == 60
+    names = sorted(os.listdir(whole + "_frames"))
+    assert sorted(os.listdir(sharded + "_frames")) == names
+    _, mismatch, errors = filecmp.cmpfiles(whole + "_frames", sharded + "_frames", names, shallow=False)
+    assert mismatch == [] and errors == []
+    with open(merged["path"]) as f:
+        assert [frame["file"] for frame in json.load(f)["frames"]] == names
+
+
+@requires_ffmpeg
+def test_merge_reports_missing_frames(scenes_video, tmp_path):
+    prefix = str(tmp_path / "out")
+    for index in (1, 2):
+        process_video(scenes_video, prefix, fps=2, width=80, height=60, tone="frame", shard=(index, 2))
+    with pytest.raises(ValueError, match="No shard manifests"):
+        merge_shards(str(tmp_path / "other"))
+
+    os.remove(os.path.join(prefix + "_frames", "frame_0003.bmp"))
+    with pytest.raises(ValueError, match="missing frames 3"):
+        merge_shards(prefix)
+
+    os.remove(shard_manifest_path(prefix, 2, 2))
+    with pytest.raises(ValueError, match="shards 2 of 2"):
+        merge_shards(prefix)
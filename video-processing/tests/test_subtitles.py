@@ -0,0 +1,28 @@
+import random
+
+from subtitles import CueIndex
+
+
+def covering_texts(cues, start, end):
+    return [text for cue_start, cue_end, text in cues if cue_start <= start and cue_end >= end]
+
+
+def test_overlapping_cues_split_into_disjoint_pieces():
+    index = CueIndex([(0.0, 4.0, "a"), (2.0, 6.0, "b"), (3.0, 3.0, "empty"), (7.0, 5.0, "backwards")])
+    assert index.starts == [0.0, 2.0, 3.0, 4.0, 5.0]
+    assert index.ends == [2.0, 3.0, 4.0, 5.0, 6.0]
+    assert index.texts == ["a", "a\nb", "a\nb", "b", "b"]
+    assert index.lookup(6.0) is None
+
+
+def test_sweep_matches_every_piece_checked_against_every_cue():
+    rng = random.Random(7)
+    cues = []
+    for i in range(300):
+        start = rng.randrange(200) / 2
+        cues.append((start, start + rng.randrange(0, 20) / 2, f"cue {i}"))
+    index = CueIndex(cues)
+    bounds = sorted({time for start, end, _ in cues for time in (start, end)})
+    expected = [(start, end, "\n".join(texts)) for start, end in zip(bounds, bounds[1:])
+                for texts in [covering_texts(cues, start, end)] if texts]
+    assert list(zip(index.starts, index.ends, index.texts)) == expected
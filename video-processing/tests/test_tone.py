@@ -0,0 +1,15 @@
+import numpy as np
+
+from tone import shot_tone
+
+
+def test_shot_splits_depend_only_on_position():
+    rng = np.random.default_rng(0)
+    # One long, slowly brightening shot: only the position splits it
+    frames = [(index / 10, np.clip(rng.normal(60 + index, 20, (12, 16)), 0, 255).astype(np.uint8))
+              for index in range(50)]
+    whole = list(shot_tone(frames, max_shot=8))
+    for start in (8, 24, 40):
+        tail = list(shot_tone(frames[start:], max_shot=8, start=start))
+        assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(whole[start:], tail))
+        assert len(tail) == len(whole) - start
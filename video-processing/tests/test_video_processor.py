@@ -0,0 +1,35 @@
+import numpy as np
+
+from palette import BATCH_SIZE
+from video_processor import process_frame, process_frames_serial
+
+
+def test_batched_palette_dither_matches_single_frames():
+    rng = np.random.default_rng(0)
+    frames = [(index / 10, rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)) for index in range(BATCH_SIZE + 3)]
+    results = list(process_frames_serial(frames, width=16, height=12, palette="7color", tone="frame"))
+    assert [timestamp for timestamp, _, _ in results] == [timestamp for timestamp, _ in frames]
+    for (_, frame), (_, result, error) in zip(frames, results):
+        assert error is None
+        img, timings = result
+        expected = process_frame(frame, width=16, height=12, palette="7color", tone="frame")
+        assert img.mode == "P" and np.array_equal(np.asarray(img), np.asarray(expected))
+        assert set(timings) == {"tone", "resize", "dither"}
+
+
+def test_batched_palette_dither_owns_reused_buffers():
+    rng = np.random.default_rng(1)
+    sources = [rng.integers(0, 256, (24, 32, 3), dtype=np.uint8) for _ in range(BATCH_SIZE)]
+    ring = [np.empty_like(sources[0]) for _ in range(4)]
+
+    def reused_frames():
+        # Like frame_source.iter_frames: each frame is only valid until four more are read
+        for index, source in enumerate(sources):
+            buffer = ring[index % len(ring)]
+            buffer[...] = source
+            yield index / 10, buffer
+
+    results = list(process_frames_serial(reused_frames(), width=16, height=12, palette="7color", tone="frame"))
+    for source, (_, (img, _), _) in zip(sources, results):
+        expected = process_frame(source, width=16, height=12, palette="7color", tone="frame")
+        assert np.array_equal(np.asarray(img), np.asarray(expected))
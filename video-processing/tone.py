@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Streaming tone mapping with precomputed lookup tables.
+
+Per-frame ``ImageOps.autocontrast`` stretches every still on its own, so
+brightness jumps between consecutive frames of the same shot. Here the
+histogram statistics are gathered in one streaming pass, either over the
+whole film or over each detected shot, turned into a 256-entry LUT with
+the same 2% cutoff, and applied to the downscaled luma frames (or to every
+channel for colour output) as a single vectorized lookup.
+
+- ``frame``: per-frame ``autocontrast`` in ``process_frame``, as before
+- ``global``: one LUT for the whole run; frames are spooled to a temporary
+  file while the histogram is gathered, then replayed through the LUT
+- ``shot``: one LUT per shot; frames are buffered until a histogram jump
+  marks a cut. Long shots are also split at every ``MAX_SHOT_FRAMES``-th
+  position of the film, so memory stays bounded, and every split depends
+  only on nearby frames: a shard that starts decoding at such a position
+  splits and tones its frames exactly as a whole-film run does
+"""
+import tempfile
+
+import numpy as np
+
+from dither import luma
+from options import TONE_MODES as MODES
+
+# Percentage of pixels clipped at each end, as in autocontrast(cutoff=2)
+CUTOFF = 2
+
+# L1 distance between normalised 32-bin histograms that marks a cut
+SHOT_THRESHOLD = 0.5
+SHOT_BINS = 32
+
+# Long shots are split at multiples of this many frame positions
+MAX_SHOT_FRAMES = 120
+
+
+def _gray(frame):
+    return luma(frame) if frame.ndim == 3 else frame
+
+
+def histogram(frame):
+    """
+    Luma histogram of a frame, sampled on every other row and column.
+
+    Args:
+        frame (numpy.ndarray): RGB or grayscale uint8 frame
+
+    Returns:
+        numpy.ndarray: 256 int64 bin counts
+    """
+    return np.bincount(_gray(frame)[::2, ::2].ravel(), minlength=256)
+
+
+def contrast_lut(hist, cutoff=CUTOFF):
+    """
+    Build an autocontrast LUT from a histogram.
+
+    Mirrors ``ImageOps.autocontrast``: ``cutoff`` percent of the pixels are
+    clipped at each end and the remaining range is stretched to 0-255.
+
+    Args:
+        hist (numpy.ndarray): 256 bin counts
+        cutoff (float): Percentage to clip at each end
+
+    Returns:
+        numpy.ndarray: 256-entry uint8 LUT
+    """
+    identity = np.arange(256, dtype=np.uint8)
+    total = int(hist.sum())
+    if total == 0:
+        return identity
+    cut = total * cutoff // 100
+    low = int(np.searchsorted(np.cumsum(hist), cut, side="right"))
+    high = 255 - int(np.searchsorted(np.cumsum(hist[::-1]), cut, side="right"))
+    if high <= low:
+        return identity
+    # Same float expression as Pillow so the truncated values agree
+    scale = 255.0 / (high - low)
+    return np.clip(identity * scale - low * scale, 0, 255).astype(np.uint8)
+
+
+def global_tone(frames, cutoff=CUTOFF, color=False):
+    """
+    Map all frames through one LUT built from the whole stream.
+
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs
+        cutoff (float): Percentage to clip at each end
+        color (bool): Keep RGB frames, mapping every channel through the
+            luma LUT, instead of reducing them to grayscale
+
+    Yields:
+        tuple: ``(timestamp, frame)`` with tone-mapped frames
+    """
+    hist = np.zeros(256, dtype=np.int64)
+    timestamps = []
+    shape = None
+    with tempfile.TemporaryFile() as spool:
+        for timestamp, frame in frames:
+            kept = frame if color else _gray(frame)
+            shape = kept.shape
+            hist += histogram(kept)
+            spool.write(np.ascontiguousarray(kept).tobytes())
+            timestamps.append(timestamp)
+        if not timestamps:
+            return
+        lut = contrast_lut(hist, cutoff)
+        spool.flush()
+        stack = np.memmap(spool, dtype=np.uint8, mode="r", shape=(len(timestamps),) + shape)
+        for timestamp, kept in zip(timestamps, stack):
+            yield timestamp, lut[kept]
+        del stack
+
+
+def shot_tone(frames, cutoff=CUTOFF, threshold=SHOT_THRESHOLD, max_shot=MAX_SHOT_FRAMES, color=False, start=0):
+    """
+    Map frames through one LUT per detected shot.
+
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs
+        cutoff (float): Percentage to clip at each end
+        threshold (float): Histogram distance between consecutive frames
+            that starts a new shot
+        max_shot (int): Shots are also split at positions that are
+            multiples of this, bounding the frames buffered
+        color (bool): Keep RGB frames, mapping every channel through the
+            luma LUT, instead of reducing them to grayscale
+        start (int): Position of the first frame in the whole film
+
+    Yields:
+        tuple: ``(timestamp, frame)`` with tone-mapped frames
+    """
+    shot = []
+    hist = np.zeros(256, dtype=np.int64)
+    previous = None
+    for position, (timestamp, frame) in enumerate(frames, start):
+        gray = _gray(frame)
+        frame_hist = histogram(gray)
+        coarse = frame_hist.reshape(SHOT_BINS, -1).sum(axis=1) / max(frame_hist.sum(), 1)
+        cut = previous is not None and np.abs(coarse - previous).sum() > threshold
+        if shot and (cut or position % max_shot == 0):
+            lut = contrast_lut(hist, cutoff)
+            for shot_timestamp, shot_gray in shot:
+                yield shot_timestamp, lut[shot_gray]
+            shot = []
+            hist[:] = 0
+        # Frames may be views into a reused buffer, so keep a copy
+        shot.append((timestamp, np.array(frame if color else gray)))
+        hist += frame_hist
+        previous = coarse
+    if shot:
+        lut = contrast_lut(hist, cutoff)
+        for shot_timestamp, shot_gray in shot:
+            yield shot_timestamp, lut[shot_gray]
+
+
+def tone_map(frames, mode="shot", color=False, start=0):
+    """
+    Apply a tone-mapping mode to a frame stream.
+
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs
+        mode (str): One of ``MODES``
+        color (bool): Keep frames in RGB for colour output
+        start (int): Position of the first frame in the whole film, for
+            ``shot``
+
+    Returns:
+        iterable: ``(timestamp, frame)`` pairs; unchanged for ``frame`` mode,
+        which is handled per frame in ``process_frame``
+    """
+    if mode == "global":
+        return global_tone(frames, color=color)
+    if mode == "shot":
+        return shot_tone(frames, color=color, start=start)
+    if mode == "frame":
+        return frames
+    raise ValueError(f"Unknown tone mapping mode: {mode}")
@@ -3,11 +3,29 @@ import os
 import sys
 import shutil
 import argparse
-import subprocess
-import tempfile
-from moviepy.editor import VideoFileClip
-from PIL import Image, ImageOps
-from tqdm import tqdm
+import functools
+from frame_source import (DECODE_PIXELS_PER_SECOND, SEEK_MIN_GOPS, choose_strategy, estimate_frame_count,
+                          iter_frames, parse_rate, probe_video, strategy_costs)
+from job_manifest import JobManifest, fingerprint_file
+from metrics import Metrics, timer
+from options import (DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, DITHER_METHODS, MAX_PICTURE_INDEX, PALETTE_METHODS,
+                     PALETTES, RESAMPLE_PRESETS, STRATEGIES, TONE_MODES)
+# NumPy, Pillow and the stages built on them are imported by the functions
+# that use them, so --help, argument errors and --plan start instantly
+
+# Rough single-core throughput behind --plan's runtime estimate; --profile
+# measures the real figures for a machine
+PLAN_DECODE_PIXELS_PER_SECOND = DECODE_PIXELS_PER_SECOND
+PLAN_DITHER_NS_PER_PIXEL = {
+    "mono": {"floyd-steinberg": 12, "atkinson": 1100, "serpentine": 800, "bayer": 17, "blue-noise": 18},
+    "7color": {"floyd-steinberg": 110, "atkinson": 130, "bayer": 34, "blue-noise": 32}
+}
+
+# Keyframe spacing assumed for seek estimates, since measuring it decodes
+PLAN_KEYFRAME_INTERVAL = 2.0
+
+class ProcessingCancelled(Exception):
+    """Raised when a run is stopped through its cancel event."""
 
 def check_ffmpeg():
     """
@@ -21,123 +39,550 @@ def check_ffmpeg():
         print("Please install FFmpeg and ensure it's accessible in your system's PATH.")
         sys.exit(1)
 
-def resize_video(input_path, output_path, width=400, height=300):
+def process_frame(frame, width=400, height=300, dither="floyd-steinberg", tone="shot", timings=None, palette="mono",
+                  resample="balanced"):
     """
-    Resize video with automatic resource management.
+    Process a single video frame for e-paper display.
     
     Args:
-        input_path (str): Path to input video
-        output_path (str): Path for output video
-        width (int): Desired width
-        height (int): Desired height
+        frame (numpy.ndarray): Video frame
+        width (int): Target width
+        height (int): Target height
+        dither (str): Dithering method, one of ``dither.METHODS``
+        tone (str): Tone mapping mode; only ``frame`` is applied here, the
+            other modes have already mapped the frame in ``tone.tone_map``
+        timings (dict, optional): Filled with ``{stage: (wall, cpu)}`` for
+            the tone, resize and dither steps
+        palette (str): ``mono`` for a 1-bit image, ``7color`` for a palette
+            image whose indices are the epd7in3f colour codes
+        resample (str): Resampling preset for frames that are not yet at the
+            output size, one of ``resample.PRESETS``
     
     Returns:
-        str: Path to resized video
+        PIL.Image: Processed image
     """
-    try:
-        with VideoFileClip(input_path) as clip:
-            resized_clip = clip.resize(newsize=(width, height))
-            resized_clip.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                logger=None  # Suppress verbose output
-            )
-        return output_path
-    except Exception as e:
-        print(f"Error resizing video: {e}")
-        return input_path
+    from PIL import Image
+    from dither import dither_image
+    from palette import dither_palette_image
+    
+    if timings is None:
+        timings = {}
+    img = prepare_frame(frame, width, height, tone, timings, resample)
+    with timer(timings, "dither"):
+        if palette == "7color":
+            img = dither_palette_image(img, dither)
+        elif dither == "floyd-steinberg":
+            # Pillow's C implementation; dither.floyd_steinberg matches it bit for bit
+            img = img.convert("1", dither=Image.FLOYDSTEINBERG)
+        else:
+            img = dither_image(img, dither)
+    return img
 
-def hardcode_subtitles(video_path, subtitle_path, output_path):
+def prepare_frame(frame, width=400, height=300, tone="shot", timings=None, resample="balanced"):
     """
-    Hardcode subtitles with improved error handling.
+    Tone map and resize a frame, the steps of ``process_frame`` before dithering.
     
     Args:
-        video_path (str): Path to input video
-        subtitle_path (str): Path to subtitle file
-        output_path (str): Path for output video
+        frame (numpy.ndarray): Video frame
+        width (int): Target width
+        height (int): Target height
+        tone (str): Tone mapping mode
+        timings (dict, optional): Filled with ``{stage: (wall, cpu)}`` for
+            the tone and resize steps
+        resample (str): Resampling preset, one of ``resample.PRESETS``
     
     Returns:
-        str: Path to video with subtitles
+        PIL.Image: Frame at the output size
     """
-    if not os.path.exists(subtitle_path):
-        print(f"Warning: Subtitle file not found: {subtitle_path}")
-        print("Continuing without subtitles.")
-        return video_path
-
-    command = [
-        "ffmpeg",
-        "-i", video_path,
-        "-vf", f"subtitles={subtitle_path}",
-        "-c:a", "copy",
-        output_path
-    ]
+    from PIL import Image, ImageOps
+    from resample import resample_image
+    
+    if timings is None:
+        timings = {}
+    img = Image.fromarray(frame)
+    img = ImageOps.exif_transpose(img)
+    if tone == "frame":
+        with timer(timings, "tone"):
+            img = ImageOps.autocontrast(img, cutoff=2)
+    with timer(timings, "resize"):
+        img = resample_image(img, width, height, resample)
+    return img
 
+def process_palette_batch(frames, width=400, height=300, dither="floyd-steinberg", tone="shot",
+                          resample="balanced"):
+    """
+    Process a batch of frames for the 7-colour panel with one dither call.
+    
+    The wavefront kernels in ``palette`` step through every frame of a
+    batch at once, so dithering a batch is several times faster per frame
+    than dithering frames one by one, with identical results.
+    
+    Args:
+        frames (list): ``(timestamp, frame)`` pairs
+        width (int): Frame width
+        height (int): Frame height
+        dither (str): Dithering method, one of ``palette.METHODS``
+        tone (str): Tone mapping mode
+        resample (str): Resampling preset, one of ``resample.PRESETS``
+    
+    Returns:
+        list: ``(timestamp, (image, timings), error)`` in frame order, as
+        yielded by ``process_frames_serial``; the dither time is shared
+        evenly between the frames
+    """
+    import numpy as np
+    from palette import dither_palette, palette_image
+    
+    results = []
+    prepared = []
+    for timestamp, frame in frames:
+        timings = {}
+        try:
+            img = prepare_frame(frame, width, height, tone, timings, resample)
+            prepared.append((len(results), np.asarray(img.convert("RGB"))))
+            results.append((timestamp, (None, timings), None))
+        except Exception as e:
+            results.append((timestamp, None, e))
+    if not prepared:
+        return results
+    
+    batch_timings = {}
     try:
-        subprocess.run(command, check=True, capture_output=True)
-        print(f"Subtitles added successfully to: {output_path}")
-        return output_path
-    except subprocess.CalledProcessError as e:
-        print(f"Error adding subtitles: {e.stderr.decode()}")
-        return video_path
+        with timer(batch_timings, "dither"):
+            indices = dither_palette(np.stack([rgb for _, rgb in prepared]), dither)
+    except Exception as e:
+        for position, _ in prepared:
+            results[position] = (results[position][0], None, e)
+        return results
+    wall, cpu = batch_timings["dither"]
+    for (position, _), frame_indices in zip(prepared, indices):
+        timestamp, (_, timings), _ = results[position]
+        timings["dither"] = (wall / len(prepared), cpu / len(prepared))
+        results[position] = (timestamp, (palette_image(frame_indices), timings), None)
+    return results
 
-def process_frame(frame, width=400, height=300):
+def process_frame_timed(frame, width=400, height=300, dither="floyd-steinberg", tone="shot", palette="mono",
+                        resample="balanced"):
     """
-    Process a single video frame for e-paper display.
+    Process a frame and report where the time went.
+    
+    Returns:
+        tuple: ``(image, timings)`` with ``timings`` as filled by ``process_frame``
+    """
+    timings = {}
+    return process_frame(frame, width, height, dither, tone, timings, palette, resample), timings
+
+def process_frames_serial(frames, width=400, height=300, dither="floyd-steinberg", tone="shot", palette="mono",
+                          resample="balanced"):
+    """
+    Process frames one after another in the current process.
     
     Args:
-        frame (numpy.ndarray): Video frame
-        width (int): Target width
-        height (int): Target height
+        frames (iterable): ``(timestamp, frame)`` pairs from the frame source
+        width (int): Frame width
+        height (int): Frame height
+        dither (str): Dithering method
+        tone (str): Tone mapping mode
+        palette (str): Output palette, one of ``palette.PALETTES``
+        resample (str): Resampling preset, one of ``resample.PRESETS``
+    
+    Yields:
+        tuple: ``(timestamp, (image, timings), error)`` where exactly one of
+        the result and ``error`` is set
+    """
+    import numpy as np
+    from palette import BATCH_SIZE, BATCHED_METHODS
+    
+    if palette == "7color" and dither in BATCHED_METHODS:
+        batch = []
+        for timestamp, frame in frames:
+            # The frame source reuses a small ring of buffers, so a batch
+            # must own its frames
+            batch.append((timestamp, np.array(frame)))
+            if len(batch) == BATCH_SIZE:
+                yield from process_palette_batch(batch, width, height, dither, tone, resample)
+                batch = []
+        if batch:
+            yield from process_palette_batch(batch, width, height, dither, tone, resample)
+        return
+    for timestamp, frame in frames:
+        try:
+            yield timestamp, process_frame_timed(frame, width, height, dither, tone, palette, resample), None
+        except Exception as e:
+            yield timestamp, None, e
+
+def check_cancelled(frames, cancel):
+    """
+    Pass frames through until a cancel event is set.
+    
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs
+        cancel (threading.Event): Event that stops the run
+    
+    Yields:
+        tuple: ``(timestamp, frame)`` pairs
+    
+    Raises:
+        ProcessingCancelled: Once ``cancel`` is set
+    """
+    for item in frames:
+        if cancel.is_set():
+            raise ProcessingCancelled("Processing cancelled")
+        yield item
+
+def save_frames(frames, output_folder, width=400, height=300, total=None, workers=1, dither="floyd-steinberg",
+                written=None, job=None, container=None, tone="shot", metrics=None, progress=None, cancel=None,
+                fsync=False, palette="mono", resample="balanced", index_of=None):
+    """
+    Process decoded frames and save them as numbered BMP files.
+    
+    With more than one worker, frames are processed on a process pool and
+    written here in frame order, so numbering matches a serial run. Frames
+    are encoded into reused buffers and written by a background thread, so
+    file I/O overlaps with processing the next frames.
+    
+    Args:
+        frames (iterable): ``(timestamp, frame)`` pairs from the frame source
+        output_folder (str): Folder to save frames
+        width (int): Frame width
+        height (int): Frame height
+        total (int, optional): Expected number of frames for the progress bar
+        workers (int): Number of worker processes
+        dither (str): Dithering method
+        written (list, optional): Collects ``(filename, timestamp)`` for each saved frame
+        job (JobManifest, optional): Manifest to commit frames to; numbering
+            continues after its committed frames
+        container (ContainerWriter, optional): Write frames into this packed
+            container instead of BMP files
+        tone (str): Tone mapping mode
+        metrics (Metrics, optional): Collects per-stage timings
+        progress (callable, optional): Called as ``progress(done, total)``
+            after each written frame; ``total`` may be None
+        cancel (threading.Event, optional): Stops the run between frames
+            with ``ProcessingCancelled`` once set
+        fsync (bool): Flush frames to the device at each checkpoint before
+            committing them
+        palette (str): ``mono`` writes 1bpp BMPs, ``7color`` 4bpp BMPs
+        resample (str): Resampling preset for frames not yet at the output size
+        index_of (callable, optional): Maps a frame's timestamp to its BMP
+            number, so a shard numbers frames by their place in the whole
+            film; frames are numbered in order when not given
     
     Returns:
-        PIL.Image: Processed image
+        int: Number of frames written, including previously committed ones
     """
-    img = Image.fromarray(frame)
-    img = ImageOps.exif_transpose(img)
-    img = ImageOps.autocontrast(img, cutoff=2)
-    img = img.resize((width, height), Image.LANCZOS)
-    img = img.convert("1", dither=Image.FLOYDSTEINBERG)
-    return img
+    from tqdm import tqdm
+    from output_sink import SYNC_INTERVAL, Bmp4Encoder, BmpEncoder, OutputSink, PlaneEncoder
+    from palette import PALETTE
+    from parallel import process_frames_parallel
+    
+    if metrics is None:
+        metrics = Metrics()
+    if container is None:
+        os.makedirs(output_folder, exist_ok=True)
+    frame_count = len(job.frames) if job is not None else 0
+    next_index = frame_count
+    
+    if workers > 1:
+        func = functools.partial(process_frame_timed, width=width, height=height, dither=dither, tone=tone,
+                                 palette=palette, resample=resample)
+        results = process_frames_parallel(frames, func, workers, metrics=metrics)
+    else:
+        results = process_frames_serial(frames, width, height, dither, tone, palette, resample)
+    
+    if container is not None:
+        sink = OutputSink(PlaneEncoder(width, height), stream=container.spool, fsync=fsync, metrics=metrics)
+    else:
+        encoder = Bmp4Encoder(width, height, PALETTE) if palette == "7color" else BmpEncoder(width, height)
+        sink = OutputSink(encoder, folder=output_folder, fsync=fsync,
+                          sync_interval=job.checkpoint_interval if job is not None else SYNC_INTERVAL,
+                          hash_frames=job is not None, metrics=metrics)
+    
+    with tqdm(total=total, initial=frame_count, desc="Processing Frames") as pbar:
+        def finish(done):
+            nonlocal frame_count
+            for (filename, timestamp), sha256, _ in done:
+                if written is not None:
+                    written.append((filename, timestamp))
+                if job is not None:
+                    with metrics.stage("checkpoint"):
+                        job.commit(filename, timestamp, os.path.join(output_folder, filename), sha256)
+                frame_count += 1
+                pbar.update(1)
+                if progress is not None:
+                    progress(frame_count, total)
+        
+        try:
+            for timestamp, result, error in results:
+                if cancel is not None and cancel.is_set():
+                    raise ProcessingCancelled("Processing cancelled")
+                try:
+                    if error is not None:
+                        raise error
+                    img, timings = result
+                    metrics.merge(timings)
+                except Exception as e:
+                    print(f"Error processing frame at {timestamp:.3f}s: {e}")
+                    continue
+                
+                if container is not None:
+                    filename = f"{os.path.basename(container.path)}:{next_index}"
+                elif index_of is not None:
+                    filename = f"frame_{index_of(timestamp):04d}.bmp"
+                else:
+                    filename = f"frame_{next_index:04d}.bmp"
+                sink.write(filename, img, (filename, timestamp))
+                next_index += 1
+                finish(sink.completed())
+        finally:
+            # Frames already queued are still written and committed
+            finish(sink.close())
+    sink.check()
+    
+    return frame_count
 
-def extract_frames(video_path, output_folder, fps=1, width=400, height=300):
+def extract_frames(video_path, output_folder, fps=1, width=400, height=300, subtitle_file=None, crop=False, workers=1,
+                   dither="floyd-steinberg", dedup_distance=None, dedup_window=4, dedup_manifest=None, job=None,
+                   cache=None, container_path=None, tone="shot", metrics=None, progress=None, cancel=None,
+                   strategy="auto", fsync=False, palette="mono", resample="balanced", indexes=None,
+                   frame_range=None, luma=False, written=None):
     """
     Extract frames from video with progress tracking.
     
+    The video is decoded forward once, or sparse samples are fetched with
+    one keyframe seek each; fractional rates above and below one frame per
+    second are sampled exactly.
+    
     Args:
         video_path (str): Path to input video
         output_folder (str): Folder to save frames
         fps (float): Frames per second to extract
         width (int): Frame width
         height (int): Frame height
+        subtitle_file (str, optional): Subtitle file to burn in
+        crop (bool): Crop to the output aspect ratio instead of stretching
+        workers (int): Number of worker processes
+        dither (str): Dithering method
+        dedup_distance (int, optional): Skip frames within this Hamming distance
+            of a recently kept frame
+        dedup_window (int): Number of recently kept frames to compare against
+        dedup_manifest (str, optional): Where to write the dedup manifest
+        job (JobManifest, optional): Manifest used to skip committed frames
+            and checkpoint progress
+        cache (FrameCache, optional): Decoded-frame cache; frames are read
+            from it when present and stored in it otherwise. Cached frames
+            are grayscale, so the whole run processes luma frames.
+        container_path (str, optional): Write a packed frame container here
+            instead of BMP files into ``output_folder``
+        tone (str): Tone mapping mode, one of ``tone.MODES``; ``global`` and
+            ``shot`` gather statistics across frames, so a resumed run
+            decodes from the start to rebuild them. With ``frame``, it
+            decodes only past the last committed frame and restores the
+            deduplication window and groups from ``job``.
+        metrics (Metrics, optional): Collects per-stage timings; SRT and
+            WebVTT subtitles are drawn in the ``subtitle`` stage, while other
+            formats are burned in by FFmpeg as part of ``decode``
+        progress (callable, optional): Called as ``progress(done, total)``
+            after each written frame; ``total`` is estimated from the
+            video's duration and is an upper bound when deduplicating
+        cancel (threading.Event, optional): Stops the run with
+            ``ProcessingCancelled`` once set; committed frames are kept
+        strategy (str): ``"sequential"``, ``"seek"`` or ``"auto"`` to pick
+            from the sampling density and the video's keyframe spacing
+        fsync (bool): Flush written frames to the device at each checkpoint
+        palette (str): Output palette, one of ``palette.PALETTES``
+        resample (str): Resampling preset of the scaler, one of
+            ``resample.PRESETS``
+        indexes (list, optional): Ascending indices on the ``fps`` grid to
+            convert instead of every grid frame, as chosen by ``scene_planner``
+        frame_range (tuple, optional): ``(first, end)`` positions on the
+            ``fps`` grid, or in ``indexes`` when given, that one shard
+            converts; ``end`` is exclusive or None for the rest of the video.
+            Frames are numbered by position, so shards never collide.
+        luma (bool): Decode 8-bit luma instead of RGB for mono output
+        written (list, optional): Collects ``(filename, timestamp)`` for
+            every frame of the output, including those a resumed run kept
+    
+    Returns:
+        int: Number of frames written
     """
-    if fps <= 0:
-        raise ValueError("FPS must be positive")
+    from dedup import FrameDeduplicator
+    from dither import luma as to_luma
+    from epd_container import ContainerWriter
+    from subtitles import FORMATS as SUBTITLE_FORMATS, CueIndex, SubtitleRenderer, burn_subtitles
+    from tone import tone_map
     
-    os.makedirs(output_folder, exist_ok=True)
+    if metrics is None:
+        metrics = Metrics()
+    rate = parse_rate(fps)
     
-    with VideoFileClip(video_path) as clip:
-        duration = int(clip.duration)
-        frame_count = 0
-        
-        with tqdm(total=duration // fps, desc="Processing Frames") as pbar:
-            for second in range(0, duration, max(1, int(1/fps))):
-                try:
-                    frame = clip.get_frame(second)
-                    img = process_frame(frame, width, height)
-                    
-                    output_path = os.path.join(output_folder, f"frame_{frame_count:04d}.bmp")
-                    img.save(output_path, format="BMP")
-                    
-                    frame_count += 1
-                    pbar.update(1)
-                except Exception as e:
-                    print(f"Error processing frame at {second}s: {e}")
+    cues = None
+    if subtitle_file and os.path.splitext(subtitle_file)[1].lower() in SUBTITLE_FORMATS:
+        # Drawn on the sampled frames below, so FFmpeg and the cache never see them
+        cues = CueIndex.from_file(subtitle_file)
+        print(f"Loaded {len(cues)} subtitle intervals from {os.path.basename(subtitle_file)}")
+        subtitle_file = None
+    
+    if written is None:
+        written = []
+    start_frame = 0
+    resume_timestamp = None
+    resume_dedup = False
+    if job is not None:
+        written.extend(job.written())
+        if job.complete:
+            print("All frames are up to date; nothing to do.")
+            return len(job.frames)
+        resume_timestamp = job.resume_timestamp()
+        if resume_timestamp is not None and tone == "frame" and (dedup_distance is None or job.dedup is not None):
+            # Deduplication continues from the saved state, so only frames
+            # after the last committed one are decoded
+            start_frame = round(resume_timestamp * rate) + 1
+            resume_dedup = dedup_distance is not None
+        if resume_timestamp is not None:
+            print(f"Resuming after {len(written)} committed frames at {resume_timestamp:.3f}s")
+    
+    end_frame = None
+    index_of = None
+    position = 0
+    if frame_range is not None:
+        first, end_frame = frame_range
+        if tone == "shot":
+            from tone import MAX_SHOT_FRAMES
+            # Widen the range to the shot splits around it, so shots crossing
+            # the shard's edges are toned as in a whole-film run
+            first = first // MAX_SHOT_FRAMES * MAX_SHOT_FRAMES
+            if end_frame is not None:
+                end_frame = -(-end_frame // MAX_SHOT_FRAMES) * MAX_SHOT_FRAMES
+        position = first
+        if indexes is not None:
+            positions = {index: first + offset for offset, index in enumerate(indexes[first:end_frame])}
+            indexes = list(positions)
+            end_frame = None
+            
+            def index_of(timestamp):
+                return positions[round(timestamp * rate)]
+        else:
+            start_frame = max(start_frame, first)
+            
+            def index_of(timestamp):
+                return round(timestamp * rate)
+    
+    cached = None
+    if cache is not None:
+        cache_key = cache.key(fingerprint_file(video_path), rate, width, height, crop,
+                              fingerprint_file(subtitle_file), resample, luma)
+        cached = cache.get(cache_key)
+    
+    if cached is not None:
+        print(f"Reading {len(cached)} decoded frames from cache")
+        total = len(cached)
+        frames = cache.iter_cached(cached, rate, start_frame)
+        if end_frame is not None:
+            frames = ((timestamp, frame) for timestamp, frame in frames if round(timestamp * rate) < end_frame)
+        if indexes is not None:
+            wanted = set(indexes)
+            frames = ((timestamp, frame) for timestamp, frame in frames if round(timestamp * rate) in wanted)
+        frames = metrics.timed_iter("decode", frames)
+    else:
+        total = estimate_frame_count(video_path, rate)
+        if strategy == "auto":
+            strategy, gop = choose_strategy(video_path, rate, samples=len(indexes) if indexes else None)
+            print(f"Decode strategy: {strategy} ({gop['reason']})")
+        frames = iter_frames(video_path, rate, width, height, subtitle_path=subtitle_file, crop=crop,
+                             start_frame=start_frame, strategy=strategy, resample=resample, indexes=indexes,
+                             end_frame=end_frame, luma=luma)
+        frames = metrics.timed_iter("decode", frames)
+        if cache is not None and start_frame == 0 and indexes is None and end_frame is None:
+            frames = metrics.timed_iter("cache", cache.store(cache_key, frames))
+        elif cache is not None and not luma:
+            frames = metrics.timed_iter("cache", ((timestamp, to_luma(frame)) for timestamp, frame in frames))
+    
+    if cues is not None and len(cues):
+        # Before selection and tone mapping, so both see the burned-in text
+        frames = metrics.timed_iter("subtitle", burn_subtitles(frames, cues, SubtitleRenderer(width, height)))
+    
+    if frame_range is not None and indexes is not None:
+        low, high = frame_range
+        total = sum(1 for offset in positions.values() if offset >= low and (high is None or offset < high))
+    elif indexes is not None:
+        total = len(indexes)
+    elif frame_range is not None and total is not None:
+        total = (frame_range[1] if frame_range[1] is not None else total) - frame_range[0]
+    
+    if cancel is not None:
+        frames = check_cancelled(frames, cancel)
+    
+    deduplicator = None
+    if job is not None and job.planned is not None and job.planned_until is None:
+        total = len(job.planned)
+        # Frame selection is unchanged, so skip the select stage entirely
+        planned = set(job.planned)
+        frames = metrics.timed_iter("select", ((timestamp, frame) for timestamp, frame in frames
+                                               if timestamp in planned))
+    elif dedup_distance is not None:
+        deduplicator = FrameDeduplicator(dedup_distance, dedup_window)
+        if job is not None:
+            job.deduplicator = deduplicator
+            if resume_dedup:
+                deduplicator.restore(job.dedup, resume_timestamp)
+        if job is not None and job.planned is not None:
+            # Keep the interrupted run's selection, then deduplicate the rest
+            frames = deduplicator.filter(frames, kept=set(job.planned), until=job.planned_until)
+        else:
+            frames = deduplicator.filter(frames)
+        frames = metrics.timed_iter("select", frames)
+    
+    if tone != "frame":
+        # Per-frame autocontrast is timed inside process_frame instead
+        frames = metrics.timed_iter("tone", tone_map(frames, tone, color=palette != "mono", start=position))
+    
+    if frame_range is not None and tone == "shot":
+        low, high = frame_range
+        frames = ((timestamp, frame) for timestamp, frame in frames
+                  if low <= index_of(timestamp) and (high is None or index_of(timestamp) < high))
+    
+    if resume_timestamp is not None:
+        frames = ((timestamp, frame) for timestamp, frame in frames if timestamp > resume_timestamp)
+    
+    if container_path is not None:
+        if job is not None:
+            raise ValueError("Resuming is only supported for BMP output")
+        with ContainerWriter(container_path, width, height) as container:
+            frame_count = save_frames(frames, output_folder, width, height, workers=workers, dither=dither,
+                                      written=written, container=container, tone=tone, metrics=metrics,
+                                      total=total, progress=progress, cancel=cancel, fsync=fsync,
+                                      palette=palette, resample=resample)
+        print(f"Wrote {frame_count} frames to {container_path}")
+    else:
+        try:
+            frame_count = save_frames(frames, output_folder, width, height, workers=workers, dither=dither,
+                                      written=written, job=job, tone=tone, metrics=metrics,
+                                      total=total, progress=progress, cancel=cancel, fsync=fsync,
+                                      palette=palette, resample=resample, index_of=index_of)
+        finally:
+            if job is not None:
+                job.save()
+    if job is not None:
+        job.mark_complete()
+    
+    if deduplicator is not None:
+        print(f"Skipped {deduplicator.skipped} near-duplicate frames")
+        if dedup_manifest:
+            deduplicator.write_manifest(dedup_manifest, written)
+    return frame_count
 
-def process_video(input_video, output_prefix, subtitle_file=None, fps=1, width=400, height=300, keep_intermediate=False):
+def process_video(input_video, output_prefix, subtitle_file=None, fps=1, width=400, height=300, crop=False, workers=1, dither="floyd-steinberg",
+                  dedup_distance=None, dedup_window=4, resume=False, cache_dir=None, cache_size=None,
+                  output_format="bmp", tone="shot", metrics=None, cprofile_path=None, trace_memory=False,
+                  progress=None, cancel=None, strategy="auto", fsync=False, palette="mono", delta=False,
+                  resample="balanced", timestamps=None, budget=None, shard=None, luma=False, sync_target=None):
     """
     Comprehensive video processing workflow.
     
+    The video is decoded once by a single FFmpeg process that samples,
+    scales and burns in subtitles, so no intermediate videos are written.
+    
     Args:
         input_video (str): Path to input video
         output_prefix (str): Output file prefix
@@ -145,35 +590,347 @@ def process_video(input_video, output_prefix, subtitle_file=None, fps=1, width=4
         fps (float): Frames per second
         width (int): Output frame width
         height (int): Output frame height
-        keep_intermediate (bool): Retain intermediate files
+        crop (bool): Crop to the output aspect ratio instead of stretching
+        workers (int): Number of worker processes
+        dither (str): Dithering method
+        dedup_distance (int, optional): Skip frames within this Hamming distance
+            of a recently kept frame; a manifest of collapsed timestamps is
+            written next to the frames
+        dedup_window (int): Number of recently kept frames to compare against
+        resume (bool): Keep a job manifest next to the frames and skip work
+            that a previous run with the same inputs already committed
+        cache_dir (str, optional): Decoded-frame cache directory; enables the cache
+        cache_size (int, optional): Cache size cap in bytes
+        output_format (str): ``"bmp"`` for one BMP per frame in
+            ``<output_prefix>_frames``, or ``"container"`` for a single packed
+            ``<output_prefix>.simf`` file
+        tone (str): ``shot`` for one contrast stretch per detected shot,
+            ``global`` for one across the whole run, or ``frame`` for the
+            previous per-frame autocontrast
+        metrics (Metrics, optional): Filled with per-stage timings of the run
+        cprofile_path (str, optional): Profile the run with cProfile and
+            write the stats here
+        trace_memory (bool): Record Python allocations with tracemalloc
+        progress (callable, optional): Called as ``progress(done, total)``
+            after each written frame
+        cancel (threading.Event, optional): Stops the run with
+            ``ProcessingCancelled`` once set
+        strategy (str): ``"sequential"`` decodes the whole video, ``"seek"``
+            seeks to each sampled frame and ``"auto"`` chooses from the
+            sampling density and the video's keyframe spacing
+        fsync (bool): Flush written frames to the device at each checkpoint,
+            so a crash cannot leave committed frames unwritten
+        palette (str): ``mono`` for 1-bit frames or ``7color`` for 4bpp
+            frames in the epd7in3f panel's seven colours
+        delta (bool): Write the dirty region of each frame against the
+            previous one to a ``.delta`` sidecar for partial refreshes and
+            report the bytes they save
+        resample (str): ``fast`` box-reduces by an integer factor and then
+            filters bilinearly, ``balanced`` uses bicubic and ``quality``
+            Lanczos
+        timestamps (str, optional): Timestamp manifest from
+            ``scene_planner``; only its frames are converted, and ``fps``
+            is replaced by its grid rate
+        budget (int, optional): Plan this many representative frames with
+            ``scene_planner`` into ``<output_prefix>_plan.json``, then convert
+            them
+        shard (tuple, optional): ``(index, count)`` to convert only shard
+            ``index`` (from 1) of ``count`` contiguous time ranges, recording
+            it in ``<output_prefix>_shard<index>of<count>_job.json`` for
+            ``shards.merge_shards``
+        luma (bool): Have FFmpeg decode 8-bit luma instead of RGB; a third
+            of the decode traffic, for mono output only
+        sync_target (str, optional): Card directory to bring up to date with
+            the frames afterwards, writing only new and changed ones
     """
+    if fps <= 0:
+        raise ValueError("FPS must be positive")
+    if palette not in PALETTES:
+        raise ValueError(f"Unknown palette: {palette}")
+    if resample not in RESAMPLE_PRESETS:
+        raise ValueError(f"Unknown resampling preset: {resample}")
+    if palette == "7color":
+        if dither not in PALETTE_METHODS:
+            raise ValueError(f"Dither method {dither} is not available for the 7-colour palette")
+        if output_format == "container":
+            raise ValueError("The frame container only holds 1-bit frames")
+        if cache_dir is not None:
+            raise ValueError("The decoded-frame cache stores grayscale frames; it cannot feed colour output")
+        if luma:
+            raise ValueError("Luma decoding drops colour; it cannot feed colour output")
+    if timestamps is not None and budget is not None:
+        raise ValueError("Give either a frame budget or a timestamp manifest, not both")
+    if shard is not None:
+        if tone == "global":
+            raise ValueError("A global tone curve needs the whole film; shard with --tone shot or frame")
+        if dedup_distance is not None:
+            raise ValueError("Deduplication renumbers the frames that follow, so it cannot be sharded")
+        if output_format == "container":
+            raise ValueError("Shards write BMP frames; pack the merged folder with epd_container.py")
+        if delta:
+            raise ValueError("Build the partial-refresh index after merging the shards")
+        if sync_target is not None:
+            raise ValueError("Sync the card after merging the shards")
+    if sync_target is not None and output_format == "container":
+        raise ValueError("Card sync copies BMP frames; copy the container file instead")
+    
     # Check FFmpeg availability
     check_ffmpeg()
     
-    # Create temporary directory for intermediate files
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Resize video
-        resized_video = os.path.join(tmpdir, "resized.mp4")
-        resized_video = resize_video(input_video, resized_video, width, height)
-        
-        # Add subtitles if available
-        video_with_subtitles = resized_video
-        if subtitle_file:
-            video_with_subtitles = os.path.join(tmpdir, "subtitled.mp4")
-            video_with_subtitles = hardcode_subtitles(resized_video, subtitle_file, video_with_subtitles)
-        
-        # Extract frames
-        output_frames_folder = f"{output_prefix}_frames"
-        extract_frames(video_with_subtitles, output_frames_folder, fps, width, height)
-        
-        # Optional: Copy intermediate files if requested
-        if keep_intermediate:
-            intermediate_dir = f"{output_prefix}_intermediate"
-            os.makedirs(intermediate_dir, exist_ok=True)
-            if resized_video != input_video:
-                shutil.copy(resized_video, os.path.join(intermediate_dir, "resized.mp4"))
-            if video_with_subtitles != resized_video:
-                shutil.copy(video_with_subtitles, os.path.join(intermediate_dir, "subtitled.mp4"))
+    if subtitle_file and not os.path.exists(subtitle_file):
+        print(f"Warning: Subtitle file not found: {subtitle_file}")
+        print("Continuing without subtitles.")
+        subtitle_file = None
+    
+    if metrics is None:
+        metrics = Metrics()
+    metrics.start()
+    
+    indexes = None
+    if budget is not None or timestamps is not None:
+        from scene_planner import load_or_plan, read_plan
+        if budget is not None:
+            timestamps = f"{output_prefix}_plan.json"
+            with metrics.stage("plan"):
+                plan, reused = load_or_plan(input_video, budget, timestamps)
+            if not reused:
+                print(f"Planned {len(plan['indexes'])} frames over {plan['shots']} shots into {timestamps}")
+        else:
+            plan = read_plan(timestamps, input_video)
+        fps = parse_rate(plan["rate"])
+        indexes = plan["indexes"]
+        print(f"Converting {len(indexes)} planned frames from {timestamps}")
+    
+    frame_range = None
+    if shard is not None:
+        from shards import shard_range
+        total = len(indexes) if indexes is not None else estimate_frame_count(input_video, fps)
+        if total is None:
+            raise ValueError(f"Could not read the duration of {input_video} to split it into shards")
+        frame_range = shard_range(total, *shard)
+        last = "the end" if frame_range[1] is None else frame_range[1] - 1
+        print(f"Shard {shard[0]} of {shard[1]}: frames {frame_range[0]} to {last}")
+    
+    output_frames_folder = f"{output_prefix}_frames"
+    
+    container_path = f"{output_prefix}.simf" if output_format == "container" else None
+    
+    job = None
+    if resume or shard is not None:
+        stages = {
+            "decode": {
+                "source": fingerprint_file(input_video),
+                "fps": str(parse_rate(fps)),
+                "subtitle": fingerprint_file(subtitle_file),
+                "timestamps": fingerprint_file(timestamps),
+                "grayscale": cache_dir is not None or luma,
+                "luma": luma
+            },
+            "scale": {"width": width, "height": height, "crop": crop, "resample": resample},
+            "select": {"dedup_distance": dedup_distance, "dedup_window": dedup_window},
+            "render": {"dither": dither, "tone": tone, "palette": palette}
+        }
+        job_path = f"{output_prefix}_job.json"
+        if shard is not None:
+            from shards import shard_manifest_path
+            # The merge reads each shard's frames from its own manifest
+            stages["shard"] = {"index": shard[0], "count": shard[1], "first": frame_range[0], "end": frame_range[1]}
+            job_path = shard_manifest_path(output_prefix, *shard)
+        if resume:
+            job = JobManifest.open(job_path, stages, output_frames_folder)
+        else:
+            job = JobManifest(job_path, stages)
+    
+    cache = None
+    if cache_dir is not None:
+        from frame_cache import FrameCache
+        cache = FrameCache(cache_dir, cache_size or DEFAULT_CACHE_SIZE)
+    
+    written = []
+    try:
+        with metrics.capture(cprofile_path, trace_memory):
+            extract_frames(input_video, output_frames_folder, fps, width, height, subtitle_file=subtitle_file,
+                           crop=crop, workers=workers, dither=dither, dedup_distance=dedup_distance,
+                           dedup_window=dedup_window, dedup_manifest=f"{output_prefix}_dedup.json", job=job,
+                           cache=cache, container_path=container_path, tone=tone, metrics=metrics,
+                           progress=progress, cancel=cancel, strategy=strategy, fsync=fsync,
+                           palette=palette, resample=resample, indexes=indexes, frame_range=frame_range,
+                           luma=luma, written=written)
+            if delta:
+                from delta import build_index, print_report as print_delta_report, savings_report, write_index
+                source = container_path or output_frames_folder
+                with metrics.stage("delta"):
+                    index = build_index(source)
+                    write_index(index, f"{source}.delta")
+                print(f"Wrote partial-refresh index to {source}.delta")
+                print_delta_report(savings_report(index))
+            if sync_target is not None:
+                from sd_sync import print_report as print_sync_report, sync
+                with metrics.stage("sync"):
+                    # Only this run's frames; stale ones of a longer earlier run stay behind
+                    report = sync(output_frames_folder, sync_target, fsync=fsync,
+                                  names=[filename for filename, _ in written])
+                print(f"Synced frames to {sync_target}")
+                print_sync_report(report)
+    finally:
+        metrics.stop()
+
+def process_video_sharded(input_video, output_prefix, shards, budget=None, timestamps=None, delta=False,
+                          sync_target=None, **options):
+    """
+    Convert a film as parallel local shards, then merge them.
+    
+    Each shard runs ``process_video`` in its own process over one time
+    range, so the decodes and the processing of all shards overlap.
+    
+    Args:
+        input_video (str): Path to input video
+        output_prefix (str): Output file prefix
+        shards (int): Number of shards and processes
+        budget (int, optional): Frame budget, planned once before the shards
+            start so they share one timestamp manifest
+        timestamps (str, optional): Timestamp manifest from ``scene_planner``
+        delta (bool): Write a partial-refresh index of the merged frames
+        sync_target (str, optional): Card directory to sync the merged
+            frames to
+        **options: Further ``process_video`` arguments, applied to every shard
+    
+    Returns:
+        dict: Summary from ``shards.merge_shards``
+    
+    Raises:
+        ValueError: If the options cannot be sharded or the merge finds gaps
+            or overlaps
+        RuntimeError: If a shard fails
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from shards import merge_shards
+    
+    if shards < 1:
+        raise ValueError("The shard count must be at least 1")
+    if options.get("tone") == "global":
+        raise ValueError("A global tone curve needs the whole film; shard with --tone shot or frame")
+    if timestamps is not None and budget is not None:
+        raise ValueError("Give either a frame budget or a timestamp manifest, not both")
+    check_ffmpeg()
+    if budget is not None:
+        from scene_planner import load_or_plan
+        timestamps = f"{output_prefix}_plan.json"
+        load_or_plan(input_video, budget, timestamps)
+    
+    with ProcessPoolExecutor(max_workers=shards) as executor:
+        futures = [executor.submit(process_video, input_video, output_prefix, timestamps=timestamps,
+                                   shard=(index, shards), **options)
+                   for index in range(1, shards + 1)]
+        for index, future in enumerate(futures, 1):
+            try:
+                future.result()
+            except Exception as e:
+                raise RuntimeError(f"Shard {index} of {shards} failed: {e}") from e
+    
+    merged = merge_shards(output_prefix)
+    print(f"Merged {merged['shards']} shards: {merged['frames']} frames")
+    if delta:
+        from delta import build_index, print_report as print_delta_report, savings_report, write_index
+        source = f"{output_prefix}_frames"
+        index = build_index(source)
+        write_index(index, f"{source}.delta")
+        print(f"Wrote partial-refresh index to {source}.delta")
+        print_delta_report(savings_report(index))
+    if sync_target is not None:
+        from sd_sync import job_frames, print_report as print_sync_report, sync
+        report = sync(f"{output_prefix}_frames", sync_target, fsync=options.get("fsync", False),
+                      names=job_frames(merged["path"]))
+        print(f"Synced frames to {sync_target}")
+        print_sync_report(report)
+    return merged
+
+def plan_video(input_video, fps=1, width=400, height=300, dither="floyd-steinberg", palette="mono",
+               output_format="bmp", strategy="auto", workers=1, frames=None):
+    """
+    Estimate a run from the video's container metadata alone.
+    
+    No frame is decoded: the frame count follows from the duration and
+    sampling rate, output sizes from the frame format, and the runtime from
+    typical decode and dithering throughput.
+    
+    Args:
+        input_video (str): Path to input video
+        fps (float): Frames per second to sample
+        width (int): Output frame width
+        height (int): Output frame height
+        dither (str): Dithering method
+        palette (str): Output palette, one of ``palette.PALETTES``
+        output_format (str): ``"bmp"`` or ``"container"``
+        strategy (str): ``"sequential"``, ``"seek"`` or ``"auto"``
+        workers (int): Number of worker processes
+        frames (int, optional): Frames to convert when a timestamp manifest
+            or budget picks them, at most the count at ``fps``
+    
+    Returns:
+        dict: Source metadata, ``frames``, ``slots`` (firmware picture
+        indices), ``frame_bytes``, ``total_bytes`` and estimated
+        ``decode_seconds`` and ``process_seconds``
+    
+    Raises:
+        ValueError: If the options are invalid or the duration is unknown
+    """
+    rate = parse_rate(fps)
+    if dither not in PLAN_DITHER_NS_PER_PIXEL.get(palette, {}):
+        raise ValueError(f"Dither method {dither} is not available for the {palette} palette")
+    source = probe_video(input_video)
+    if source["duration"] is None:
+        raise ValueError(f"Could not read the duration of {input_video}")
+    plan = dict(source)
+    grid = estimate_frame_count(input_video, rate)
+    plan["frames"] = frames = grid if frames is None else min(frames, grid)
+    plan["slots"] = MAX_PICTURE_INDEX + 1
+    
+    if output_format == "container":
+        # Header, then an offset table entry and a packed plane per frame
+        plan["frame_bytes"] = 4 + (width + 7) // 8 * height
+        plan["total_bytes"] = 32 + frames * plan["frame_bytes"]
+    else:
+        # File and info headers plus a 2- or 16-entry colour table; rows are
+        # padded to four bytes
+        if palette == "7color":
+            header, row_bytes = 118, (width + 1) // 2
+        else:
+            header, row_bytes = 62, (width + 7) // 8
+        plan["frame_bytes"] = header + (row_bytes + 3) // 4 * 4 * height
+        plan["total_bytes"] = frames * plan["frame_bytes"]
+    
+    decoded_pixels = (source["width"] or width) * (source["height"] or height)
+    source_fps = source["fps"] or 25.0
+    sequential = source["duration"] * source_fps
+    grid_gap = source_fps / float(rate)
+    sample_gap = sequential / frames if frames else grid_gap
+    sequential_cost, seek_cost, _ = strategy_costs(source_fps, PLAN_KEYFRAME_INTERVAL, grid_gap, sample_gap,
+                                                   decoded_pixels)
+    seek = frames * seek_cost
+    sequential = frames * sequential_cost
+    if strategy == "auto":
+        sparse = sample_gap >= SEEK_MIN_GOPS * source_fps * PLAN_KEYFRAME_INTERVAL
+        plan["strategy"] = "seek" if sparse and seek < sequential else "sequential"
+    else:
+        plan["strategy"] = strategy
+    decoded_frames = seek if plan["strategy"] == "seek" else sequential
+    plan["decode_seconds"] = decoded_frames * decoded_pixels / PLAN_DECODE_PIXELS_PER_SECOND
+    plan["process_seconds"] = (frames * width * height * PLAN_DITHER_NS_PER_PIXEL[palette][dither] * 1e-9
+                               / max(workers, 1))
+    return plan
+
+def print_plan(plan):
+    """Print the estimates of ``plan_video``."""
+    print(f"Source: {plan['codec'] or 'unknown codec'}, {plan['width'] or '?'}x{plan['height'] or '?'}, "
+          f"{plan['fps'] or '?'} fps, {plan['duration']:.1f}s")
+    print(f"Frames: {plan['frames']} of {plan['slots']} picture indices")
+    if plan["frames"] > plan["slots"]:
+        print(f"Warning: {plan['frames'] - plan['slots']} frames exceed the firmware's picture index; "
+              f"--fps {plan['slots'] / plan['duration']:.4g} or lower fits, as may --dedup")
+    print(f"Output: {plan['total_bytes'] / 1024 ** 2:.1f} MB ({plan['frame_bytes']:,} bytes per frame)")
+    print(f"Estimated runtime: ~{plan['decode_seconds'] + plan['process_seconds']:.0f}s "
+          f"(decode ~{plan['decode_seconds']:.0f}s {plan['strategy']}, processing ~{plan['process_seconds']:.0f}s)")
 
 def main():
     """Command-line interface for video processing."""
@@ -184,23 +941,119 @@ def main():
     parser.add_argument("--fps", type=float, default=1, help="Frames per second (default: 1)")
     parser.add_argument("--width", type=int, default=400, help="Output frame width (default: 400)")
     parser.add_argument("--height", type=int, default=300, help="Output frame height (default: 300)")
-    parser.add_argument("--keep-intermediate", action="store_true", help="Keep intermediate files")
+    parser.add_argument("--crop", action="store_true", help="Crop to the output aspect ratio instead of stretching")
+    parser.add_argument("--dither", choices=DITHER_METHODS, default="floyd-steinberg", help="Dithering method (default: floyd-steinberg)")
+    parser.add_argument("--palette", choices=PALETTES, default="mono", help="1-bit frames, or 4bpp frames in the 7-colour panel's palette (default: mono)")
+    parser.add_argument("--resample", choices=RESAMPLE_PRESETS, default="balanced", help="Scaler: integer box reduction plus bilinear, bicubic, or Lanczos (default: balanced)")
+    parser.add_argument("--tone", choices=TONE_MODES, default="shot", help="Contrast stretch per shot, over the whole video, or per frame (default: shot)")
+    parser.add_argument("--format", choices=("bmp", "container"), default="bmp", help="Output BMP files or one packed frame container (default: bmp)")
+    parser.add_argument("--dedup", type=int, metavar="DISTANCE", help="Skip frames within this perceptual-hash distance of a recent frame")
+    parser.add_argument("--dedup-window", type=int, default=4, help="Recent frames compared when deduplicating (default: 4)")
+    parser.add_argument("--resume", action="store_true", help="Resume from the job manifest, skipping committed frames")
+    parser.add_argument("--cache", action="store_true", help="Cache decoded frames so reruns skip decoding")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Decoded-frame cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE / 1024 ** 3, help="Cache size cap in GB (default: 20)")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings and write <output_prefix>_metrics.json")
+    parser.add_argument("--cprofile", metavar="PATH", help="Profile the run with cProfile and write the stats to PATH (implies --profile)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Record Python allocations during the run (implies --profile)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for frame processing (default: 1)")
+    parser.add_argument("--delta", action="store_true", help="Write a partial-refresh index of changed regions between frames")
+    parser.add_argument("--fsync", action="store_true", help="Flush frames to the device at each checkpoint")
+    parser.add_argument("--luma", action="store_true", help="Decode 8-bit luma instead of RGB for mono output; a third of the decode traffic")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="auto", help="Decode the whole video or seek to each sampled frame (default: auto)")
+    parser.add_argument("--timestamps", metavar="MANIFEST", help="Convert only the frames of a scene_planner timestamp manifest")
+    parser.add_argument("--budget", type=int, metavar="N", help="Plan N representative frames by scene change, then convert them")
+    parser.add_argument("--sync", metavar="DIR", help="Afterwards, write only new and changed frames to this card directory")
+    parser.add_argument("--shard", metavar="I/N", help="Convert only shard I of N time ranges; merge them with shards.py")
+    parser.add_argument("--shards", metavar="N", help="Convert in N parallel local shards and merge them; 'auto' uses every CPU")
+    parser.add_argument("--plan", action="store_true", help="Report frame count, output size and estimated runtime from metadata, without decoding")
     
     args = parser.parse_args()
-
+    
+    if args.plan:
+        check_ffmpeg()
+        try:
+            fps, frames = args.fps, args.budget
+            if args.budget is not None:
+                from scene_planner import SCORE_FPS
+                fps = SCORE_FPS
+            elif args.timestamps:
+                from scene_planner import read_plan
+                manifest = read_plan(args.timestamps, args.input_video)
+                fps, frames = manifest["rate"], len(manifest["indexes"])
+            plan = plan_video(args.input_video, fps, args.width, args.height, dither=args.dither,
+                              palette=args.palette, output_format=args.format, strategy=args.strategy,
+                              workers=args.workers, frames=frames)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print_plan(plan)
+        return
+    
+    profile = args.profile or args.cprofile or args.tracemalloc
+    metrics = Metrics()
+    
+    shard = shards = None
     try:
-        process_video(
-            args.input_video, 
-            args.output_prefix, 
-            subtitle_file=args.subtitle, 
-            fps=args.fps,
-            width=args.width,
-            height=args.height,
-            keep_intermediate=args.keep_intermediate
-        )
+        if args.shard and args.shards:
+            raise ValueError("Give either --shard or --shards, not both")
+        if args.shard:
+            from shards import parse_shard
+            shard = parse_shard(args.shard)
+        if args.shards:
+            if args.shards == "auto":
+                shards = os.cpu_count() or 1
+            elif args.shards.isdigit():
+                shards = int(args.shards)
+            else:
+                raise ValueError(f"--shards takes a number or 'auto', not {args.shards!r}")
+            if profile:
+                raise ValueError("Profile a single --shard instead of a local sharded run")
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    options = dict(
+        subtitle_file=args.subtitle,
+        fps=args.fps,
+        width=args.width,
+        height=args.height,
+        crop=args.crop,
+        workers=args.workers,
+        dither=args.dither,
+        dedup_distance=args.dedup,
+        dedup_window=args.dedup_window,
+        resume=args.resume,
+        cache_dir=args.cache_dir if args.cache else None,
+        cache_size=int(args.cache_size * 1024 ** 3),
+        output_format=args.format,
+        tone=args.tone,
+        strategy=args.strategy,
+        fsync=args.fsync,
+        palette=args.palette,
+        delta=args.delta,
+        resample=args.resample,
+        timestamps=args.timestamps,
+        budget=args.budget,
+        luma=args.luma,
+        sync_target=args.sync
+    )
+    
+    try:
+        if shards is not None:
+            process_video_sharded(args.input_video, args.output_prefix, shards, **options)
+        else:
+            process_video(args.input_video, args.output_prefix, metrics=metrics, cprofile_path=args.cprofile,
+                          trace_memory=args.tracemalloc, shard=shard, **options)
     except Exception as e:
         print(f"Processing failed: {e}")
         sys.exit(1)
+    
+    if profile:
+        print(metrics.summary())
+        metrics_path = f"{args.output_prefix}_metrics.json"
+        metrics.write_json(metrics_path)
+        print(f"Metrics written to {metrics_path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file